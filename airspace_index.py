@@ -0,0 +1,225 @@
+"""Overlap index of one country's airspaces.
+
+CTRs, TMAs, FIR sectors and restricted areas are stacked on top of each other;
+without help, clients have to intersect polygons to place labels that do not
+collide. ``AirspaceIndex`` builds one STRtree over the polygons of an ``asp``
+file and derives, per airspace:
+
+- ``overlap_group`` - connected component of airspaces whose interiors
+  overlap (touching borders do not count), numbered per country;
+- ``stack_size`` - how many airspaces overlap this one, itself included;
+- ``stack_rank`` - how many of those are larger (0 = the outermost one);
+- ``label_lon``/``label_lat`` - the pole of inaccessibility (polylabel) of
+  the airspace minus the smaller airspaces stacked on it, i.e. the point
+  farthest from any border that no inner airspace covers.
+
+Label points of a file are computed in one batch (GEOS maximum inscribed
+circle, vectorised over all polygons). ``annotate`` attaches the results to
+the raw properties: ``STACK_KEY`` for ``get_airspace_properties``,
+``LABEL_KEY`` (point and area in km2) for the ``airspace_labels`` layer, and
+the parsed shape (``SHAPE_KEY``) so the border mappers reuse it instead of
+parsing the geometry again.
+
+The index is built outside the time budget of ``feature_guard``, so it keeps
+away from the geometries that stall GEOS: features ``skip`` selects (the
+``countries.slow_features`` of the file) are not indexed at all, and
+polygons of ``LABEL_MAX_VERTICES`` vertices or more get no cutouts and a
+plain point on surface as label instead of the inscribed circle; if such a
+polygon is also invalid it is left out of the index rather than repaired.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import shapely
+from shapely.errors import GEOSException
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+from shapely.ops import polylabel
+from shapely.strtree import STRtree
+
+SHAPE_KEY = "_shape"
+STACK_KEY = "_stack"
+LABEL_KEY = "_label"
+# Interior/interior intersection of dimension 2: a real overlap.
+OVERLAP_PATTERN = "2********"
+# Cut at most this many smaller airspaces out of a polygon when placing its
+# label; FIRs can contain hundreds and the union gets expensive.
+MAX_LABEL_CUTOUTS = 32
+# From this size on a polygon skips the overlay and inscribed-circle work.
+LABEL_MAX_VERTICES = int(os.environ.get("LABEL_MAX_VERTICES", "20000"))
+LABEL_PRECISION = 6
+# polylabel precision: this fraction of the polygon's larger bbox side.
+LABEL_TOLERANCE = 0.01
+KM_PER_DEGREE = 111.32
+POLYGONAL_TYPE_IDS = (3, 6)  # Polygon, MultiPolygon
+
+Feature = Dict[str, Any]
+
+
+class AirspaceIndex:
+    def __init__(self, features: Iterable[Feature], skip: Optional[Callable[[Feature], bool]] = None) -> None:
+        """Index the polygon features of ``features`` (kept in file order)
+        that ``skip`` does not select."""
+
+        self.shapes: List[Optional[BaseGeometry]] = []
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") in ("Polygon", "MultiPolygon") and not (skip and skip(feature)):
+                self.shapes.append(shape(geometry))
+            else:
+                self.shapes.append(None)
+        positions = [position for position, polygon in enumerate(self.shapes) if polygon is not None]
+        geometries = np.array([self.shapes[position] for position in positions], dtype=object)
+        invalid = ~shapely.is_valid(geometries)
+        if invalid.any():
+            huge = invalid & (shapely.get_num_coordinates(geometries) >= LABEL_MAX_VERTICES)
+            for position in np.asarray(positions)[huge].tolist():
+                self.shapes[position] = None
+            repair = invalid & ~huge
+            if repair.any():
+                geometries[repair] = shapely.make_valid(geometries[repair])
+            positions = [position for position, keep in zip(positions, ~huge) if keep]
+            geometries = geometries[~huge]
+        self.positions = positions
+        self.geometries = geometries
+        self.vertices = shapely.get_num_coordinates(geometries)
+        self.tree = STRtree(geometries)
+        self.stacks = self._stacks()
+
+    def _overlaps(self) -> List[List[int]]:
+        neighbours: List[List[int]] = [[] for _ in self.positions]
+        if not len(self.geometries):
+            return neighbours
+        left, right = self.tree.query(self.geometries, predicate="intersects")
+        pairs = left < right
+        left, right = left[pairs], right[pairs]
+        overlapping = shapely.relate_pattern(self.geometries[left], self.geometries[right], OVERLAP_PATTERN)
+        for a, b in zip(left[overlapping].tolist(), right[overlapping].tolist()):
+            neighbours[a].append(b)
+            neighbours[b].append(a)
+        return neighbours
+
+    def _stacks(self) -> Dict[int, Dict[str, Any]]:
+        neighbours = self._overlaps()
+        areas = shapely.area(self.geometries)
+        groups = _components(neighbours)
+        free_areas = []
+        ranks = []
+        for index in range(len(self.positions)):
+            # Larger airspaces come first; ties keep file order.
+            larger = {other for other in neighbours[index] if (areas[other], -other) > (areas[index], -index)}
+            smaller = sorted(set(neighbours[index]) - larger, key=lambda other: -areas[other])
+            cutouts = [self.geometries[other] for other in smaller]
+            overlay_vertices = self.vertices[index] + sum(self.vertices[other] for other in smaller[:MAX_LABEL_CUTOUTS])
+            if overlay_vertices >= LABEL_MAX_VERTICES:
+                cutouts = []
+            free_areas.append(self._free_area(self.geometries[index], cutouts))
+            ranks.append(len(larger))
+        points = label_points(np.array(free_areas, dtype=object), self.vertices < LABEL_MAX_VERTICES)
+        latitudes = shapely.get_y(shapely.centroid(self.geometries))
+        areas_km2 = areas * KM_PER_DEGREE ** 2 * np.cos(np.radians(latitudes))
+        stacks: Dict[int, Dict[str, Any]] = {}
+        self.labels: Dict[int, Dict[str, Any]] = {}
+        for index, position in enumerate(self.positions):
+            stacks[position] = {
+                "overlap_group": groups[index],
+                "stack_size": len(neighbours[index]) + 1,
+                "stack_rank": ranks[index],
+            }
+            if points[index].is_empty:
+                continue
+            lon = round(float(shapely.get_x(points[index])), LABEL_PRECISION)
+            lat = round(float(shapely.get_y(points[index])), LABEL_PRECISION)
+            stacks[position].update(label_lon=lon, label_lat=lat)
+            self.labels[position] = {"lon": lon, "lat": lat, "area_km2": round(float(areas_km2[index]), 3)}
+        return stacks
+
+    @staticmethod
+    def _free_area(polygon: BaseGeometry, smaller: List[BaseGeometry]) -> BaseGeometry:
+        """``polygon`` minus the smaller airspaces stacked on it (the polygon
+        itself when nothing is left)."""
+
+        polygon = _polygonal(polygon)
+        if smaller:
+            try:
+                free = _polygonal(polygon.difference(shapely.union_all(smaller[:MAX_LABEL_CUTOUTS])))
+            except GEOSException:
+                free = None
+            if free is not None and not free.is_empty:
+                return free
+        return polygon
+
+    def annotate(self, features: Iterable[Feature]) -> Iterator[Feature]:
+        """Yield ``features`` (the same sequence the index was built from) with
+        the shape and stacking attached to their properties."""
+
+        for position, feature in enumerate(features):
+            properties = feature.get("properties")
+            polygon = self.shapes[position] if position < len(self.shapes) else None
+            if polygon is not None and properties is not None:
+                properties[SHAPE_KEY] = polygon
+                properties[STACK_KEY] = self.stacks[position]
+                if position in self.labels:
+                    properties[LABEL_KEY] = self.labels[position]
+            yield feature
+
+
+def _components(neighbours: List[List[int]]) -> List[int]:
+    """Number the connected components of the overlap graph in index order."""
+
+    groups = [-1] * len(neighbours)
+    count = 0
+    for start in range(len(neighbours)):
+        if groups[start] != -1:
+            continue
+        groups[start] = count
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for other in neighbours[node]:
+                if groups[other] == -1:
+                    groups[other] = count
+                    stack.append(other)
+        count += 1
+    return groups
+
+
+def _polygonal(geometry: BaseGeometry) -> BaseGeometry:
+    """Drop the lines and points an overlay or ``make_valid`` may leave."""
+
+    if geometry.geom_type in ("Polygon", "MultiPolygon"):
+        return geometry
+    parts = [part for part in shapely.get_parts(geometry) if part.geom_type in ("Polygon", "MultiPolygon")]
+    return shapely.union_all(parts) if parts else geometry
+
+
+def label_points(polygons: np.ndarray, inscribed: Optional[np.ndarray] = None) -> np.ndarray:
+    """Pole of inaccessibility of every polygon, in one vectorised call
+    (degenerate non-polygonal geometries, and those ``inscribed`` marks
+    False, fall back to a point on them)."""
+
+    points = shapely.point_on_surface(polygons)
+    polygonal = np.isin(shapely.get_type_id(polygons), POLYGONAL_TYPE_IDS) & ~shapely.is_empty(polygons)
+    if inscribed is not None:
+        polygonal &= inscribed
+    if not polygonal.any():
+        return points
+    polygons = polygons[polygonal]
+    bounds = shapely.bounds(polygons)
+    tolerance = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]) * LABEL_TOLERANCE
+    tolerance = np.maximum(tolerance, 1e-9)
+    if hasattr(shapely, "maximum_inscribed_circle"):
+        # shapely >= 2.1: the circle's first point is its centre.
+        points[polygonal] = shapely.get_point(shapely.maximum_inscribed_circle(polygons, tolerance), 0)
+        return points
+    labels = []
+    for polygon, polygon_tolerance in zip(polygons, tolerance):
+        if polygon.geom_type == "MultiPolygon":
+            polygon = max(polygon.geoms, key=lambda part: part.area)
+        labels.append(polylabel(polygon, polygon_tolerance))
+    points[polygonal] = labels
+    return points
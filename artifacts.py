@@ -0,0 +1,119 @@
+"""Hash manifest of the published build artifacts and its verification.
+
+The build job hands ``openaip.pmtiles``, ``openaip.stats.json``,
+``tmp/geojsons/`` and the extracts in ``output_tiles/`` to the upload job
+as a workflow artifact, and nothing checked that what arrives is what was
+built. After the stages that produce
+them, ``main.py`` hashes every published file once (in parallel,
+mmap-backed, see ``hashing.py``) into ``artifacts.json``:
+
+    {"files": {path_in_repo: {"path", "size", "sha256", "git_sha1"}}}
+
+``upload_to_hugging_face.publish`` hashes the files again before pushing and
+refuses to upload when a file is missing, unexpected, or differs in size or
+hash. The digests of that single verification pass are then reused by the
+upload planner to skip files the repo already holds, so the upload job still
+reads every file only once.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import time
+from typing import Any
+
+from build_stats import STATS_PATH
+from extract import EXTRACTS_DIR
+from geojson_artifacts import MANIFEST_NAME
+from hashing import HASH_WORKERS, FileDigest, hash_files
+from run_metrics import report
+
+ARTIFACT_MANIFEST_PATH = pathlib.Path("artifacts.json")
+PMTILES_FILE = pathlib.Path("openaip.pmtiles")
+GEOJSONS_DIR = pathlib.Path("tmp/geojsons")
+GEOJSONS_PREFIX = "geojsons/"
+EXTRACTS_PREFIX = "output_tiles/"
+
+
+def artifact_files() -> dict[str, pathlib.Path]:
+    """Return `path_in_repo -> local path` for everything that is published."""
+
+    files: dict[str, pathlib.Path] = {}
+    if PMTILES_FILE.exists():
+        files[PMTILES_FILE.name] = PMTILES_FILE
+    if STATS_PATH.exists():
+        files[STATS_PATH.name] = STATS_PATH
+    if GEOJSONS_DIR.exists():
+        # Raw files, their .gz/.zst variants and the size/hash manifest.
+        for pattern in ("*.geojson", "*.geojson.*", MANIFEST_NAME):
+            for path in sorted(GEOJSONS_DIR.glob(pattern)):
+                files[f"{GEOJSONS_PREFIX}{path.name}"] = path
+    if EXTRACTS_DIR.exists():
+        # Per-country and per-continent extracts (extract.py).
+        for path in sorted(EXTRACTS_DIR.rglob("*.pmtiles")):
+            files[f"{EXTRACTS_PREFIX}{path.relative_to(EXTRACTS_DIR).as_posix()}"] = path
+    return files
+
+
+def write_artifact_manifest(
+    files: dict[str, pathlib.Path] | None = None,
+    path: pathlib.Path = ARTIFACT_MANIFEST_PATH,
+    workers: int | None = None,
+) -> dict[str, Any]:
+    files = artifact_files() if files is None else files
+    started = time.perf_counter()
+    digests = hash_files(files.values(), workers or HASH_WORKERS)
+    manifest = {
+        "files": {
+            path_in_repo: {
+                "path": str(local),
+                "size": digests[local].size,
+                "sha256": digests[local].sha256,
+                "git_sha1": digests[local].git_sha1,
+            }
+            for path_in_repo, local in sorted(files.items())
+        }
+    }
+    path.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    size = sum(digest.size for digest in digests.values())
+    seconds = time.perf_counter() - started
+    print(f"hashed {len(files)} artifacts ({size / 1024 ** 2:.1f} MB) into {path} in {seconds:.1f}s")
+    report.record("artifacts", {"files": len(files), "bytes": size, "seconds": round(seconds, 3)})
+    return manifest
+
+
+def verify_artifacts(
+    files: dict[str, pathlib.Path],
+    path: pathlib.Path = ARTIFACT_MANIFEST_PATH,
+    workers: int | None = None,
+) -> dict[pathlib.Path, FileDigest]:
+    """Hash ``files`` and check them against the manifest at ``path``.
+
+    Returns the digests for reuse; raises ``RuntimeError`` listing every
+    mismatch. Without a manifest (a local publish of files not built by
+    ``main.py``) the files are only hashed.
+    """
+
+    digests = hash_files(files.values(), workers or HASH_WORKERS)
+    if not path.exists():
+        print(f"no {path}; uploading without verifying the artifacts")
+        return digests
+    expected = json.loads(path.read_text(encoding="utf-8"))["files"]
+    problems = [f"missing: {name}" for name in sorted(expected.keys() - files.keys())]
+    problems += [f"not in the manifest: {name}" for name in sorted(files.keys() - expected.keys())]
+    for name, local in sorted(files.items()):
+        entry = expected.get(name)
+        digest = digests[local]
+        if entry is not None and (entry["size"], entry["sha256"]) != (digest.size, digest.sha256):
+            problems.append(f"changed: {name} ({entry['size']} -> {digest.size} bytes)")
+    if problems:
+        shown = "\n  ".join(problems[:20])
+        more = f"\n  ... and {len(problems) - 20} more" if len(problems) > 20 else ""
+        raise RuntimeError(f"artifacts do not match {path}:\n  {shown}{more}")
+    print(f"verified {len(files)} artifacts against {path}")
+    return digests
+
+
+if __name__ == "__main__":
+    write_artifact_manifest()
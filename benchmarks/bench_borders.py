@@ -0,0 +1,92 @@
+"""Border band cost on multi-island airspaces.
+
+Compares ``mapper.border_band`` (one projection and one buffer per feature)
+with the previous approach applied part by part (a pair of pyproj
+Transformers and a per-coordinate ``shapely.ops.transform`` for every
+polygon of a MultiPolygon). The time per part should stay flat as the number
+of islands grows, and every band must be a valid (Multi)Polygon.
+
+    python benchmarks/bench_borders.py [--parts 1 10 50 200] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import pathlib
+import sys
+import time
+import warnings
+from typing import Any, Callable
+
+import pyproj
+from shapely.geometry import MultiPolygon, Polygon
+from shapely.ops import transform, unary_union
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from mapper import BORDER_WIDTH_M, border_band  # noqa: E402
+
+
+def per_part_border_band(polygon: Any) -> Any:
+    """The previous implementation, run on every part separately."""
+
+    bands = []
+    # shapely.ops.transform is deprecated but was what the mapper used.
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    for part in getattr(polygon, "geoms", [polygon]):
+        aeqd_crs = f"+proj=aeqd +lat_0={part.centroid.y} +lon_0={part.centroid.x} +datum=WGS84 +units=m"
+        to_utm = pyproj.Transformer.from_crs("EPSG:4326", aeqd_crs, always_xy=True).transform
+        to_wgs = pyproj.Transformer.from_crs(aeqd_crs, "EPSG:4326", always_xy=True).transform
+        part_utm = transform(to_utm, part)
+        bands.append(transform(to_wgs, part_utm.difference(part_utm.buffer(-BORDER_WIDTH_M))))
+    return unary_union(bands)
+
+
+def islands(parts: int, vertices: int = 64) -> MultiPolygon:
+    """``parts`` disjoint, roughly 5 km wide islands on a grid off the coast."""
+
+    columns = math.ceil(math.sqrt(parts))
+    polygons = []
+    for index in range(parts):
+        lon = 10.0 + (index % columns) * 0.1
+        lat = 54.0 + (index // columns) * 0.1
+        ring = []
+        for step in range(vertices):
+            angle = 2 * math.pi * step / vertices
+            radius = 0.025 * (1 + 0.2 * math.sin(5 * angle))
+            ring.append((lon + radius * math.cos(angle), lat + radius * math.sin(angle) * 0.6))
+        polygons.append(Polygon(ring))
+    return MultiPolygon(polygons)
+
+
+def measure(func: Callable[[Any], Any], polygon: Any, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(polygon)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parts", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'parts':>6} {'per-part ms':>12} {'batched ms':>11} {'ms/part old':>12} {'ms/part new':>12} {'valid':>6}")
+    for parts in args.parts:
+        polygon = islands(parts)
+        old = measure(per_part_border_band, polygon, args.repeat)
+        new = measure(border_band, polygon, args.repeat)
+        band = border_band(polygon)
+        valid = band.is_valid and band.geom_type in ("Polygon", "MultiPolygon")
+        print(
+            f"{parts:>6} {old * 1000:>12.1f} {new * 1000:>11.1f} "
+            f"{old * 1000 / parts:>12.2f} {new * 1000 / parts:>12.2f} {str(valid):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
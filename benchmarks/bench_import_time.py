@@ -0,0 +1,54 @@
+"""Start-up cost of the entry points.
+
+Imports every module in a fresh interpreter (best of ``--repeat`` runs, the
+bare interpreter start subtracted) and lists which heavy libraries the import
+pulled in. ``check_bucket``, ``update_web`` and ``web_generator`` should load
+none of them; ``main`` only loads them once a stage maps features or talks to
+the bucket.
+
+    python benchmarks/bench_import_time.py [--repeat 5] [module ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+ENTRY_POINTS = ["check_bucket", "update_web", "web_generator", "extract", "main"]
+HEAVY_MODULES = ["shapely", "pyproj", "numpy", "google.auth", "requests", "enums", "mapper"]
+PROBE = "import sys, {module}; print(__import__('json').dumps([name for name in {heavy!r} if name in sys.modules]))"
+
+
+def run(code: str) -> tuple[float, str]:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return time.perf_counter() - started, result.stdout
+
+
+def best_of(code: str, repeat: int) -> tuple[float, str]:
+    runs = [run(code) for _ in range(repeat)]
+    return min(seconds for seconds, _ in runs), runs[-1][1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline, _ = best_of("pass", args.repeat)
+    print(f"interpreter start: {baseline * 1000:.0f} ms (subtracted below)")
+    print(f"{'module':<16} {'import ms':>10}  heavy modules loaded")
+    for module in args.modules:
+        seconds, output = best_of(PROBE.format(module=module, heavy=HEAVY_MODULES), args.repeat)
+        loaded = json.loads(output.strip().splitlines()[-1])
+        print(f"{module:<16} {(seconds - baseline) * 1000:>10.0f}  {', '.join(loaded) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
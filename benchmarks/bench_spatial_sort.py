@@ -0,0 +1,77 @@
+"""tippecanoe on layer files in writer order versus Hilbert order.
+
+Copies the layer files of the last map stage (``tmp/<layer>.geojson``) twice,
+sorts one copy with ``spatial_sort.sort_layer`` and tiles both with the
+pipeline's tippecanoe arguments. Prints the sort time and, per input order,
+the best tippecanoe wall time and peak RSS of ``--repeat`` runs and the
+archive size. ``--run-mb`` forces the external merge (e.g. ``--run-mb 1``).
+
+    python benchmarks/bench_spatial_sort.py [--layers airspaces,obstacles] [--repeat 3] [--run-mb 256]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from main import OPEN_AIP_DATASETS, TIPPECANOE_ARGS, TIPPECANOE_EXECUTABLE, geojson_path  # noqa: E402
+from spatial_sort import SORT_RUN_MB, sort_layer  # noqa: E402
+
+
+def tile(inputs: list[pathlib.Path], output: pathlib.Path, work_dir: pathlib.Path) -> tuple[float, int]:
+    """Run tippecanoe once; return wall seconds and peak RSS in bytes."""
+
+    command = [TIPPECANOE_EXECUTABLE, "-q", "-t", str(work_dir), "-o", str(output), *TIPPECANOE_ARGS, *map(str, inputs)]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)  # reaped by wait4
+    if process.returncode:
+        raise RuntimeError(f"tippecanoe failed with exit {process.returncode}")
+    return seconds, usage.ru_maxrss * 1024  # ru_maxrss is in KiB on Linux
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layers", help="comma-separated layer names (default: every layer file present)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--run-mb", type=int, default=SORT_RUN_MB, help="in-memory run size of the sort")
+    args = parser.parse_args()
+    if shutil.which(TIPPECANOE_EXECUTABLE) is None:
+        sys.exit("tippecanoe not found on PATH")
+    names = args.layers.split(",") if args.layers else None
+    layers = [geojson_path(d) for d in OPEN_AIP_DATASETS if (names is None or d.layer_name in names) and geojson_path(d).exists()]
+    if not layers:
+        sys.exit("no layer files found; run `python main.py map` first")
+    print(f"{len(layers)} layers, {sum(path.stat().st_size for path in layers) / 1024 ** 2:.1f} MB of GeoJSON")
+
+    with tempfile.TemporaryDirectory(prefix="bench-sort-") as scratch:
+        root = pathlib.Path(scratch)
+        inputs: dict[str, list[pathlib.Path]] = {}
+        for order in ("writer", "hilbert"):
+            (root / order).mkdir()
+            inputs[order] = [pathlib.Path(shutil.copy(path, root / order / path.name)) for path in layers]
+        started = time.perf_counter()
+        runs = [sort_layer(path, args.run_mb * 1024 * 1024)["runs"] for path in inputs["hilbert"]]
+        print(f"sort: {time.perf_counter() - started:.2f}s ({sum(runs)} runs over {len(runs)} layers)")
+
+        print(f"{'order':<8} {'tippecanoe s':>12} {'peak RSS MB':>12} {'archive MB':>11}")
+        for order, paths in inputs.items():
+            output = root / f"{order}.pmtiles"
+            results = [tile(paths, output, root) for _ in range(args.repeat)]
+            seconds = min(seconds for seconds, _ in results)
+            peak = min(rss for _, rss in results)
+            print(f"{order:<8} {seconds:>12.2f} {peak / 1024 ** 2:>12.0f} {output.stat().st_size / 1024 ** 2:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cost of schema validation versus the mapping it protects.
+
+For every raw object given (default: the payloads in ``tmp/raw/``, else
+``tmp/geojsons/``) times, per feature, the compiled validator of its file
+code (``schema.validator``), the properties mappers of the datasets reading
+that file, and the full ``main.map_features`` of those datasets (geometry,
+zoom and properties mappers plus serialization). Validation should cost a
+small fraction of even the properties mappers alone.
+
+    python benchmarks/bench_validation.py [--repeat 5] [FILE.geojson ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import sys
+import time
+from typing import Any, Callable
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from main import GEOJSONS_DIR, RAW_CACHE_DIR, file_datasets, map_features  # noqa: E402
+from schema import validator  # noqa: E402
+
+
+def best_of(repeat: int, function: Callable[[], Any]) -> float:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - started)
+    return min(runs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", type=pathlib.Path)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    files = args.files or sorted(RAW_CACHE_DIR.glob("*.geojson")) or sorted(GEOJSONS_DIR.glob("*.geojson"))
+    if not files:
+        sys.exit(f"no payloads in {RAW_CACHE_DIR} or {GEOJSONS_DIR}; run `python main.py fetch` first")
+
+    by_code: dict[str, list[dict[str, Any]]] = {}
+    for path in files:
+        file_code = path.name.split(".")[0].split("_")[-1]
+        by_code.setdefault(file_code, []).extend(json.loads(path.read_text(encoding="utf-8")).get("features") or [])
+
+    print(f"{'code':<5} {'features':>9} {'validate us':>12} {'properties us':>14} {'map us':>10} {'validate/properties':>20}")
+    for file_code, features in sorted(by_code.items()):
+        validate = validator(file_code)
+        datasets = file_datasets(file_code)
+        if validate is None or not features or not datasets:
+            continue
+        invalid = sum(validate(feature) is not None for feature in features)
+
+        def validate_all() -> None:
+            for feature in features:
+                validate(feature)
+
+        def properties_all() -> None:
+            for dataset in datasets:
+                if dataset.properties_mapper is not None:
+                    for feature in features:
+                        dataset.properties_mapper(feature["properties"])
+
+        def map_all() -> None:
+            for dataset in datasets:
+                map_features("bench", dataset, features)
+
+        map_all()  # resolve the lazy mappers (imports) outside the timings
+        validating = best_of(args.repeat, validate_all) / len(features) * 1e6
+        properties = best_of(args.repeat, properties_all) / len(features) * 1e6
+        mapping = best_of(max(1, args.repeat // 2), map_all) / len(features) * 1e6
+        print(
+            f"{file_code:<5} {len(features):>9} {validating:>12.2f} {properties:>14.2f} {mapping:>10.1f} "
+            f"{validating / properties:>19.0%}" + (f"  ({invalid} invalid)" if invalid else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Per-country viewer bootstrap files for a fast first paint.
+
+A PMTiles client opening one country in the planet archive first reads the
+header and root directory, then the leaf directories of the tiles in view,
+and only then the tiles: two or three round trips before anything is drawn.
+For every country ``write_bootstraps`` writes ``web/bootstrap/<country>.json``
+(published with the web pages), computed from the combined archive once per
+build:
+
+- ``bbox``, ``center`` and ``zoom``: the country's bounding box (from
+  ``tmp/country_bounds.json``; ``min_lon > max_lon`` when it crosses the
+  antimeridian, see ``bounds.py``) and the largest zoom at which it fits a
+  ``VIEWPORT`` of 512 px tiles, clamped to the archive's zoom range;
+- ``header``: the byte range of the header and root directory;
+- ``leaves``: the byte ranges of the leaf directories that address the tiles
+  of the initial view;
+- ``tiles``: ``[z, x, y, offset, length]`` of every tile of the initial view,
+  so a viewer can request them in parallel with the directories.
+
+Byte ranges are ``[offset, length]`` into the archive at ``archive.url``.
+``archive.sha256`` is the SHA-256 of the archive the ranges were computed
+from; Hugging Face serves it as the ETag of LFS files, so a viewer checks the
+ETag of every prefetched response against it and falls back to a plain
+PMTiles open when the published archive is another build (``archive.size``
+alone cannot tell two builds of the same size apart). ``index.json`` lists
+the countries with a file, for the map preview of ``web/index.html``. Files
+whose content did not change are not rewritten.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import pathlib
+import time
+from typing import Any
+
+from bounds import bbox_parts, center_lon, lon_span
+from hashing import hash_files
+from pmtiles_archive import Entry, PMTilesReader, bbox_tile_range, zxy_to_tileid
+from run_metrics import report
+from templates import write_if_changed
+from web_generator import COUNTRY_META, HF_RESOLVE
+
+BOOTSTRAP_DIR = pathlib.Path(__file__).with_name("web") / "bootstrap"
+ARCHIVE_URL = f"{HF_RESOLVE}/openaip.pmtiles"
+INDEX_NAME = "index.json"
+# Size of the map a viewer opens in, in CSS pixels, and of its vector tiles.
+VIEWPORT = (1024, 768)
+TILE_SIZE = 512
+# The initial view never asks for more tiles than this; larger countries
+# start one zoom further out.
+MAX_INITIAL_TILES = 64
+
+
+def mercator_y(lat: float) -> float:
+    lat = min(85.0511287, max(-85.0511287, lat))
+    rad = math.radians(lat)
+    return math.log(math.tan(rad) + 1.0 / math.cos(rad)) / (2 * math.pi)
+
+
+def fit_zoom(bbox: list[float], min_zoom: int, max_zoom: int) -> int:
+    """Largest zoom at which ``bbox`` fits the viewport."""
+
+    width = max(lon_span(bbox), 1e-9) / 360.0
+    height = max(mercator_y(bbox[3]) - mercator_y(bbox[1]), 1e-9)
+    scale = min(VIEWPORT[0] / TILE_SIZE / width, VIEWPORT[1] / TILE_SIZE / height)
+    return min(max_zoom, max(min_zoom, int(math.floor(math.log2(scale)))))
+
+
+def view_tiles(bbox: list[float], zoom: int, min_zoom: int) -> tuple[int, list[tuple[int, int, int]]]:
+    """The zoom and ``(z, x, y)`` tiles of the initial view of ``bbox``; a box
+    crossing the antimeridian takes the tiles on both sides of it."""
+
+    while True:
+        tiles: dict[tuple[int, int, int], None] = {}
+        for part in bbox_parts(bbox):
+            min_x, min_y, max_x, max_y = bbox_tile_range(part, zoom)
+            tiles.update(((zoom, x, y), None) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1))
+        if len(tiles) <= MAX_INITIAL_TILES or zoom <= min_zoom:
+            return zoom, list(tiles)
+        zoom -= 1
+
+
+def mercator_center_lat(bbox: list[float]) -> float:
+    """Latitude halfway between the bbox edges on the Mercator map."""
+
+    y = (mercator_y(bbox[1]) + mercator_y(bbox[3])) / 2
+    return math.degrees(math.atan(math.sinh(y * 2 * math.pi)))
+
+
+def country_bootstrap(
+    reader: PMTilesReader,
+    root: list[Entry],
+    country: str,
+    bbox: list[float],
+    sha256: str,
+) -> dict[str, Any]:
+    header = reader.header
+    zoom, tiles = view_tiles(bbox, fit_zoom(bbox, header.min_zoom, header.max_zoom), header.min_zoom)
+    leaves: list[list[int]] = []
+    located: list[list[int]] = []
+    for z, x, y in tiles:
+        walked, entry = reader.find_path(zxy_to_tileid(z, x, y), root)
+        for leaf in walked:
+            byte_range = [header.leaf_directory_offset + leaf.offset, leaf.length]
+            if byte_range not in leaves:
+                leaves.append(byte_range)
+        if entry is not None:
+            located.append([z, x, y, header.tile_data_offset + entry.offset, entry.length])
+    return {
+        "country": country,
+        "name": COUNTRY_META.get(country, (country.upper(), "Other"))[0],
+        "bbox": bbox,
+        "center": [round(center_lon(bbox), 5), round(mercator_center_lat(bbox), 5)],
+        "zoom": zoom,
+        "archive": {"url": ARCHIVE_URL, "size": reader.path.stat().st_size, "sha256": sha256},
+        "header": [0, header.root_offset + header.root_length],
+        "leaves": sorted(leaves),
+        "tiles": located,
+    }
+
+
+def write_bootstraps(
+    combined: pathlib.Path,
+    country_bounds: dict[str, list[float]],
+    output_dir: pathlib.Path = BOOTSTRAP_DIR,
+) -> None:
+    """Write ``<country>.json`` into ``output_dir`` for every country in
+    ``country_bounds``, and ``index.json`` for every file there."""
+
+    if not combined.exists():
+        raise RuntimeError(f"{combined} not found, run the tiling stage first")
+    started = time.perf_counter()
+    written = 0
+    sha256 = hash_files([combined])[combined].sha256
+    with PMTilesReader(combined) as reader:
+        root = reader.root_entries()
+        for country, bbox in sorted(country_bounds.items()):
+            bootstrap = country_bootstrap(reader, root, country, bbox, sha256)
+            if write_if_changed(output_dir / f"{country}.json", json.dumps(bootstrap, separators=(",", ":"))):
+                written += 1
+    # Countries of earlier (e.g. --countries) runs keep their entry.
+    names = {
+        path.stem: COUNTRY_META.get(path.stem, (path.stem.upper(), "Other"))[0]
+        for path in sorted(output_dir.glob("*.json"))
+        if path.name != INDEX_NAME
+    }
+    write_if_changed(output_dir / INDEX_NAME, json.dumps(names, separators=(",", ":")))
+    print(
+        f"{written} of {len(country_bounds)} bootstrap files changed in {output_dir} "
+        f"({time.perf_counter() - started:.2f}s)"
+    )
+    report.record("bootstrap", {"countries": len(country_bounds), "changed": written})
+
+
+if __name__ == "__main__":
+    from main import COMBINED_PM_TILES, COUNTRY_BOUNDS_PATH
+
+    write_bootstraps(COMBINED_PM_TILES, json.loads(COUNTRY_BOUNDS_PATH.read_text(encoding="utf-8")))
@@ -0,0 +1,117 @@
+"""Bounding boxes that may cross the antimeridian.
+
+A plain ``[min_lon, min_lat, max_lon, max_lat]`` union of the features of a
+country with territory on both sides of ±180° (us, ru, nz, fj, ki, to, tv)
+spans almost the whole world, so its extract and its initial view would be
+a latitude band full of other countries. Boxes here follow the GeoJSON
+convention (RFC 7946, 5.2) instead: a box that crosses the antimeridian has
+``min_lon > max_lon``, e.g. ``[172, 51, -130, 72]`` for the Aleutians and
+Alaska. ``union_bounds`` keeps the shorter way around the globe, and
+``bbox_parts`` splits a crossing box into the two plain boxes on either side
+of ±180° for tile range queries.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterator, Optional
+
+FULL_LONGITUDE = [-180.0, 180.0]
+
+
+def normalize_lon(lon: float) -> float:
+    """``lon`` in ``[-180, 180]`` (180 stays 180)."""
+
+    if -180.0 <= lon <= 180.0:
+        return lon
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def lon_span(bbox: list[float]) -> float:
+    """Width of ``bbox`` in degrees of longitude, going east from its west edge."""
+
+    if bbox[0] <= bbox[2]:
+        return bbox[2] - bbox[0]
+    return bbox[2] - bbox[0] + 360.0
+
+
+def center_lon(bbox: list[float]) -> float:
+    return normalize_lon(bbox[0] + lon_span(bbox) / 2)
+
+
+def crosses_antimeridian(bbox: list[float]) -> bool:
+    return bbox[0] > bbox[2]
+
+
+def bbox_parts(bbox: list[float]) -> list[list[float]]:
+    """``bbox`` as one plain box, or as the two on either side of ±180°."""
+
+    if not crosses_antimeridian(bbox):
+        return [bbox]
+    return [[bbox[0], bbox[1], 180.0, bbox[3]], [-180.0, bbox[1], bbox[2], bbox[3]]]
+
+
+def union_bounds(current: Optional[list[float]], bounds: Optional[list[float]]) -> Optional[list[float]]:
+    """Smallest box holding both boxes, going around either side of the globe.
+
+    Of the two arcs that start at one box's west edge and reach the other
+    box's east edge, the shorter one is kept; one reaching all the way round
+    becomes the full ``[-180, 180]``.
+    """
+
+    if not bounds:
+        return current
+    if current is None:
+        return list(bounds)
+    south, north = min(current[1], bounds[1]), max(current[3], bounds[3])
+    candidates = []
+    for first, second in ((current, bounds), (bounds, current)):
+        reach_first = lon_span(first)
+        reach_second = (second[0] - first[0]) % 360.0 + lon_span(second)
+        # The arc starts at the west edge of ``first`` and ends at the east
+        # edge of whichever box reaches further east from there.
+        east = first[2] if reach_first >= reach_second else second[2]
+        candidates.append((max(reach_first, reach_second), first[0], east))
+    span, west, east = min(candidates)
+    if span >= 360.0:
+        return [FULL_LONGITUDE[0], south, FULL_LONGITUDE[1], north]
+    return [west, south, east, north]
+
+
+def _longitudes(coordinates: Any) -> Iterator[float]:
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates[0]
+        return
+    for part in coordinates or []:
+        yield from _longitudes(part)
+
+
+def _geometry_longitudes(geometry: dict[str, Any]) -> Iterator[float]:
+    if geometry.get("type") == "GeometryCollection":
+        for part in geometry.get("geometries") or []:
+            yield from _geometry_longitudes(part)
+    else:
+        yield from _longitudes(geometry.get("coordinates"))
+
+
+def geometry_extent(bounds: Optional[list[float]], geometry: dict[str, Any]) -> Optional[list[float]]:
+    """``bounds`` (the plain bounds of ``geometry``), crossing the antimeridian
+    when the geometry does.
+
+    Only a geometry wider than 180° can cross it, so the vertices are only
+    looked at again for those: the box then leaves out the widest gap
+    between consecutive longitudes around the globe.
+    """
+
+    if bounds is None:
+        return None
+    if -180.0 <= bounds[0] and bounds[2] <= 180.0 and bounds[2] - bounds[0] <= 180.0:
+        return bounds
+    lons = sorted({normalize_lon(lon) for lon in _geometry_longitudes(geometry)})
+    if not lons:
+        return bounds
+    # (gap, west edge after it, east edge before it); the wrap gap first.
+    widest = (lons[0] + 360.0 - lons[-1], lons[0], lons[-1])
+    for before, after in zip(lons, lons[1:]):
+        if after - before > widest[0]:
+            widest = (after - before, after, before)
+    return [widest[1], bounds[1], widest[2], bounds[3]]
@@ -0,0 +1,81 @@
+"""Indexed manifest of the source bucket.
+
+``check_bucket.py`` writes ``tmp/bucket_manifest.json`` from its listing:
+every ``*.geojson`` object with its size, generation, MD5 and update time.
+``main.py`` reuses it as the download plan: objects missing from the manifest
+are never requested, and downloaded payloads are cached under ``tmp/raw/``
+keyed by generation, so an unchanged object is never downloaded twice.
+Comparing two manifests tells which objects changed between runs.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import time
+from typing import Any, Iterable
+
+BUCKET_MANIFEST_PATH = pathlib.Path("tmp/bucket_manifest.json")
+# Fields requested from the listing API (``fields=`` projection) and kept per
+# object in the manifest.
+OBJECT_FIELDS = ("name", "size", "generation", "md5Hash", "updated")
+
+Manifest = dict[str, Any]
+
+
+def build_manifest(items: Iterable[dict[str, Any]]) -> Manifest:
+    objects = {
+        item["name"]: {
+            "size": int(item.get("size", 0)),
+            "generation": str(item.get("generation", "")),
+            "md5Hash": item.get("md5Hash", ""),
+            "updated": item.get("updated", ""),
+        }
+        for item in items
+        if item.get("name", "").endswith(".geojson")
+    }
+    return {"generated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "objects": dict(sorted(objects.items()))}
+
+
+def load_manifest(path: pathlib.Path = BUCKET_MANIFEST_PATH) -> Manifest | None:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(manifest: Manifest, path: pathlib.Path = BUCKET_MANIFEST_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+
+
+def country_of(name: str) -> str:
+    return name.split("_", 1)[0]
+
+
+def changed_objects(previous: Manifest | None, current: Manifest) -> dict[str, list[str]]:
+    """Return the object names ``added``/``changed``/``removed`` since
+    ``previous`` (a new generation or MD5 counts as changed)."""
+
+    before = (previous or {}).get("objects", {})
+    after = current["objects"]
+    changed = [
+        name
+        for name, entry in after.items()
+        if name in before
+        and (entry["generation"], entry["md5Hash"]) != (before[name]["generation"], before[name]["md5Hash"])
+    ]
+    return {
+        "added": sorted(set(after) - set(before)),
+        "changed": sorted(changed),
+        "removed": sorted(set(before) - set(after)),
+    }
+
+
+def bytes_per_country(manifest: Manifest, names: Iterable[str]) -> dict[str, int]:
+    totals: dict[str, int] = {}
+    objects = manifest["objects"]
+    for name in names:
+        if name in objects:
+            country = country_of(name)
+            totals[country] = totals.get(country, 0) + objects[name]["size"]
+    return totals
@@ -0,0 +1,148 @@
+"""Per-country, per-layer statistics of a build and their change since the last one.
+
+The map stage already knows, for every object it maps, how many features
+each layer got, their bounding box and the size of the GeoJSON written, so
+``BuildStats`` collects those numbers as the chunks go to the writers: no
+output file is parsed again. After the map stage ``write_stats`` stores them
+compactly in ``openaip.stats.json`` next to ``openaip.pmtiles``:
+
+    {"generated": "...", "previous": "...", "totals": {layer: {"features", "delta"}},
+     "countries": {code: {"quarantined": n, "layers": {layer: {"features", "bytes", "bounds", "delta"}}}}}
+
+``delta`` is the change in features since the previous stats: the
+``openaip.stats.json`` of the last local build or, when there is none (a
+fresh CI checkout), the one published at ``PREVIOUS_STATS_URL``. Layers that
+lost all their features stay listed with 0 features, so removals show up.
+``web_generator`` embeds the numbers in the download page and publishes
+the file as ``web/stats.json``, which is where the next build finds it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import threading
+import urllib.request
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from bounds import union_bounds
+
+STATS_PATH = pathlib.Path("openaip.stats.json")
+PREVIOUS_STATS_URL = os.environ.get("PREVIOUS_STATS_URL", "")
+BOUNDS_PRECISION = 4
+FETCH_TIMEOUT_S = 30
+
+Stats = Dict[str, Any]
+
+
+class BuildStats:
+    """Thread-safe accumulator of per-country, per-layer counters.
+
+    ``base`` (the previous stats) pre-fills the countries and layers this
+    build does not map, as in patch mode, where the archive still holds
+    them.
+    """
+
+    def __init__(self, base: Optional[Stats] = None) -> None:
+        self._lock = threading.Lock()
+        self.countries: Dict[str, Dict[str, Any]] = {}
+        for code, country in ((base or {}).get("countries") or {}).items():
+            self.countries[code] = {
+                "quarantined": country.get("quarantined", 0),
+                "layers": {
+                    layer: {key: value for key, value in entry.items() if key != "delta"}
+                    for layer, entry in country.get("layers", {}).items()
+                },
+            }
+
+    def _country(self, country: str) -> Dict[str, Any]:
+        return self.countries.setdefault(country, {"quarantined": 0, "layers": {}})
+
+    def reset(self, country: str, layers: List[str]) -> None:
+        """Forget what ``base`` said about ``layers`` of ``country``, which
+        this build maps again."""
+
+        with self._lock:
+            entry = self._country(country)
+            entry["quarantined"] = 0
+            for layer in layers:
+                entry["layers"].pop(layer, None)
+
+    def add(self, country: str, layer: str, features: int, bounds: Optional[List[float]], size: int) -> None:
+        with self._lock:
+            entry = self._country(country)["layers"].setdefault(layer, {"features": 0, "bytes": 0, "bounds": None})
+            entry["features"] += features
+            entry["bytes"] += size
+            if bounds:
+                rounded = [round(value, BOUNDS_PRECISION) for value in bounds]
+                current = entry["bounds"]
+                entry["bounds"] = union_bounds(current, rounded)
+
+    def add_quarantined(self, country: str, count: int) -> None:
+        if count:
+            with self._lock:
+                self._country(country)["quarantined"] += count
+
+    def as_dict(self, previous: Optional[Stats] = None) -> Stats:
+        """The stats of this build, with deltas against ``previous``."""
+
+        previous_countries = (previous or {}).get("countries") or {}
+        countries: Dict[str, Any] = {}
+        totals: Dict[str, Dict[str, int]] = {}
+        for code in sorted(set(self.countries) | set(previous_countries)):
+            current_layers = self.countries.get(code, {}).get("layers", {})
+            previous_layers = previous_countries.get(code, {}).get("layers", {})
+            layers: Dict[str, Any] = {}
+            for layer in sorted(set(current_layers) | set(previous_layers)):
+                entry = dict(current_layers.get(layer) or {"features": 0, "bytes": 0, "bounds": None})
+                if previous is not None:
+                    entry["delta"] = entry["features"] - previous_layers.get(layer, {}).get("features", 0)
+                if not entry["features"] and not entry.get("delta"):
+                    continue
+                layers[layer] = entry
+                total = totals.setdefault(layer, {"features": 0})
+                total["features"] += entry["features"]
+                if previous is not None:
+                    total["delta"] = total.get("delta", 0) + entry["delta"]
+            if layers:
+                countries[code] = {"quarantined": self.countries.get(code, {}).get("quarantined", 0), "layers": layers}
+        return {
+            "generated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "previous": (previous or {}).get("generated"),
+            "totals": dict(sorted(totals.items())),
+            "countries": countries,
+        }
+
+
+def load_stats(path: pathlib.Path = STATS_PATH) -> Optional[Stats]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def previous_stats(path: pathlib.Path = STATS_PATH, url: str = PREVIOUS_STATS_URL) -> Optional[Stats]:
+    """The stats of the last build: the local file, else the published one."""
+
+    stats = load_stats(path)
+    if stats is not None or not url:
+        return stats
+    try:
+        with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT_S) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except (OSError, ValueError) as exc:
+        print(f"no previous stats from {url} ({exc}); deltas start with this build")
+        return None
+
+
+def write_stats(stats: BuildStats, previous: Optional[Stats], path: pathlib.Path = STATS_PATH) -> Stats:
+    result = stats.as_dict(previous)
+    path.write_text(json.dumps(result, separators=(",", ":")), encoding="utf-8")
+    changes = ", ".join(
+        f"{layer} {total['features']}" + (f" ({total['delta']:+d})" if "delta" in total else "")
+        for layer, total in result["totals"].items()
+    )
+    since = f" since {result['previous']}" if result["previous"] else ""
+    print(f"stats of {len(result['countries'])} countries written to {path}{since}: {changes}")
+    return result
@@ -7,61 +7,70 @@ one the pipeline tries to export (a country from ``countries.py`` x the
 end it prints the files the pipeline tries to export that are missing from
 the bucket.
 
+The whole bucket is listed, paged in parallel (one name prefix per possible
+leading character) with a ``fields=`` projection, and saved as
+``tmp/bucket_manifest.json`` which ``main.py`` reuses as its download plan;
+only the plan is limited to the countries of ``countries.py``. The audit also prints what a
+pipeline run would download per country and which objects changed since the
+previous manifest.
+
 Usage:
     python check_bucket.py
 """
 
 from __future__ import annotations
 
+import string
 import sys
-
-from main import (
-    BASE_URL,
-    GCS_USER_PROJECT,
-    countries,
-    get_gcs_session,
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from bucket_manifest import (
+    OBJECT_FIELDS,
+    Manifest,
+    build_manifest,
+    bytes_per_country,
+    changed_objects,
+    load_manifest,
+    save_manifest,
 )
+from countries import countries
+from gcs_config import get_object_source
+from main import OPEN_AIP_DATASETS
 
+# Object names are ``<iso country code>_<file code>.geojson``, so one listing
+# per leading character covers the whole bucket - including countries that
+# are not in countries.py and names starting with a digit, an uppercase letter
+# or ``_`` - and the pages can be fetched concurrently.
+LIST_PREFIXES = tuple(string.digits + string.ascii_uppercase + "_" + string.ascii_lowercase)
+LIST_WORKERS = 8
+LIST_FIELDS = f"items({','.join(OBJECT_FIELDS)}),nextPageToken"
 
-def list_bucket_geojsons() -> list[str]:
-    """Return the names of every ``*.geojson`` object stored in the bucket.
 
-    The bucket is requester-pays, so each listing request must be authenticated
-    and must name the billing project via ``userProject``. Results are paged
-    through ``nextPageToken`` until the bucket has been fully enumerated.
+def list_prefix(prefix: str) -> list[dict[str, Any]]:
+    """Return the listing items of every object whose name starts with
+    ``prefix`` (all pages, only the manifest fields)."""
+
+    return get_object_source().list_objects(prefix, LIST_FIELDS)
+
+
+def list_bucket_manifest() -> Manifest:
+    """List the whole bucket (prefixes in parallel) into a manifest.
+
+    The source bucket is requester-pays: ``get_object_source`` refuses to
+    list it without ``GCS_USER_PROJECT``.
     """
 
-    if not GCS_USER_PROJECT:
-        raise RuntimeError(
-            "GCS_USER_PROJECT is not set. This bucket is a requester-pays bucket "
-            "and requires a GCP project ID with billing enabled. Set the "
-            "GCS_USER_PROJECT environment variable, e.g.:\n"
-            "    export GCS_USER_PROJECT='your-project-id'"
-        )
-
-    session = get_gcs_session()
-    names: list[str] = []
-    page_token = None
-    while True:
-        params = {"userProject": GCS_USER_PROJECT}
-        if page_token:
-            params["pageToken"] = page_token
-        response = session.get(BASE_URL, params=params)
-        if not response.ok:
-            # Include the GCS error body so the exact reason (billing vs. IAM
-            # permission) is visible in the console.
-            raise RuntimeError(
-                f"GCS list failed with HTTP {response.status_code}: {response.text}"
-            )
-        payload = response.json()
-        for item in payload.get("items", []):
-            name = item.get("name", "")
-            if name.endswith(".geojson"):
-                names.append(name)
-        page_token = payload.get("nextPageToken")
-        if not page_token:
-            break
-    return names
+    get_object_source()  # fail fast on missing configuration
+    with ThreadPoolExecutor(max_workers=LIST_WORKERS) as pool:
+        pages = list(pool.map(list_prefix, LIST_PREFIXES))
+    return build_manifest(item for items in pages for item in items)
+
+
+def list_bucket_geojsons() -> list[str]:
+    """Return the names of every ``*.geojson`` object stored in the bucket."""
+
+    return list(list_bucket_manifest()["objects"])
 
 
 # Only the raw airport (apt) and airspace (asp) GeoJSON files are exported
@@ -91,8 +100,43 @@ def expected_export_files() -> set[str]:
     }
 
 
+def format_size(num_bytes: int) -> str:
+    return f"{num_bytes / 1024 / 1024:.1f} MB"
+
+
+def print_run_cost(manifest: Manifest, previous: Manifest | None) -> None:
+    """Print what a pipeline run downloads and what changed since the last
+    audit."""
+
+    file_codes = sorted({dataset.file_code for dataset in OPEN_AIP_DATASETS})
+    planned = [f"{country}_{code}.geojson" for country in countries for code in file_codes]
+    per_country = bytes_per_country(manifest, planned)
+    total = sum(per_country.values())
+    present = sum(name in manifest["objects"] for name in planned)
+    print(
+        f"\nA pipeline run downloads {present} objects, {format_size(total)} "
+        f"(file codes {', '.join(file_codes)}):"
+    )
+    for country, size in sorted(per_country.items(), key=lambda item: -item[1]):
+        print(f"  {country}  {format_size(size):>10}")
+
+    changes = changed_objects(previous, manifest)
+    if previous is None:
+        print("\nNo previous manifest - every object counts as new")
+        return
+    print(f"\nChanges since the manifest of {previous.get('generated', '?')}:")
+    for kind in ("added", "changed", "removed"):
+        names = changes[kind]
+        print(f"  {kind} ({len(names)}): " + (", ".join(names) if names else "none"))
+    changed_bytes = sum(manifest["objects"][name]["size"] for name in changes["added"] + changes["changed"])
+    print(f"  {format_size(changed_bytes)} of new or changed data")
+
+
 def main() -> None:
-    all_bucket_files = sorted(list_bucket_geojsons())
+    previous = load_manifest()
+    manifest = list_bucket_manifest()
+    save_manifest(manifest)
+    all_bucket_files = sorted(manifest["objects"])
     expected = expected_export_files()
 
     # Only airports/airspaces are exported - ignore every other geojson file.
@@ -156,6 +200,8 @@ def main() -> None:
     )
     print("  " + (", ".join(exported_missing) if exported_missing else "none"))
 
+    print_run_cost(manifest, previous)
+
 
 if __name__ == "__main__":
     try:
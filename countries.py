@@ -18,15 +18,18 @@ countries = ['ad','ae','af','ag','ai','al','am','ao','aq','ar','as','at','au','a
 slow_features = {'ar': {
     'airspaces': {'name':['FIR COMODORO']},
     'airspaces_border_offset': {'name':['FIR COMODORO']},
-    'airspaces_border_offset_2x': {'name':['FIR COMODORO']}
+    'airspaces_border_offset_2x': {'name':['FIR COMODORO']},
+    'airspace_labels': {'name':['FIR COMODORO']}
     },'au': {
     'airspaces': {'name':['MELBOURNE FIR CTA A2']},
     'airspaces_border_offset': {'name':['MELBOURNE FIR CTA A2']},
-    'airspaces_border_offset_2x': {'name':['MELBOURNE FIR CTA A2']}
+    'airspaces_border_offset_2x': {'name':['MELBOURNE FIR CTA A2']},
+    'airspace_labels': {'name':['MELBOURNE FIR CTA A2']}
     },'gl': {
     'airspaces': {'name':['NUUK SECTOR NORTH', 'BGGL FIR']},
     'airspaces_border_offset': {'name':['NUUK SECTOR NORTH', 'BGGL FIR']},
-    'airspaces_border_offset_2x': {'name':['NUUK SECTOR NORTH', 'BGGL FIR']}
+    'airspaces_border_offset_2x': {'name':['NUUK SECTOR NORTH', 'BGGL FIR']},
+    'airspace_labels': {'name':['NUUK SECTOR NORTH', 'BGGL FIR']}
     }
     }
 
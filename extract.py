@@ -0,0 +1,165 @@
+"""Cut per-country and per-continent PMTiles extracts out of the combined archive.
+
+The combined ``openaip.pmtiles`` is tiled once; every extract is a bounding-box
+slice of it, so no extract re-runs tippecanoe. The tile directory of the
+combined archive is decoded a single time into a per-zoom index sorted by tile
+column, each country's tile set is a cheap range query against that index, and
+a continent is the union of its countries' tile sets. Payloads are copied
+straight out of the memory-mapped source, and the extracts are written
+concurrently.
+
+Country bounding boxes come from ``tmp/country_bounds.json`` (written by
+``main.py`` while the layer files are generated); a box of a country that
+crosses the antimeridian has ``min_lon > max_lon`` (see ``bounds.py``) and
+selects the tiles on both sides of it. Continents come from
+``web_generator.COUNTRY_META``.
+
+Usage:
+    python extract.py
+"""
+
+from __future__ import annotations
+
+import bisect
+import functools
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from bounds import bbox_parts, center_lon, crosses_antimeridian, union_bounds
+from pmtiles_archive import Entry, PMTilesReader, PMTilesWriter, bbox_tile_range, tileid_to_zxy
+from web_generator import COUNTRY_META
+
+EXTRACTS_DIR = pathlib.Path("output_tiles")
+CONTINENTS_DIR = EXTRACTS_DIR / "continents"
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+
+# (tile_id, offset, length) of one addressed tile in the source archive.
+TileRef = tuple[int, int, int]
+
+
+class TileIndex:
+    """Addressed tiles of an archive, grouped per zoom and sorted by column."""
+
+    def __init__(self, reader: PMTilesReader) -> None:
+        columns: dict[int, list[tuple[int, int, int, int, int]]] = {}
+        for tile_id, entry in reader.tiles():
+            z, x, y = tileid_to_zxy(tile_id)
+            columns.setdefault(z, []).append((x, y, tile_id, entry.offset, entry.length))
+        self._tiles = {z: sorted(tiles) for z, tiles in columns.items()}
+        self._xs = {z: [tile[0] for tile in tiles] for z, tiles in self._tiles.items()}
+
+    def select(self, bbox: list[float]) -> list[TileRef]:
+        """Return the tiles intersecting ``bbox``, sorted by tile id; a box
+        crossing the antimeridian is queried on both sides of it."""
+
+        selected: dict[int, TileRef] = {}
+        for part in bbox_parts(bbox):
+            for z, tiles in self._tiles.items():
+                min_x, min_y, max_x, max_y = bbox_tile_range(part, z)
+                xs = self._xs[z]
+                start = bisect.bisect_left(xs, min_x)
+                end = bisect.bisect_right(xs, max_x)
+                for _, y, tile_id, offset, length in tiles[start:end]:
+                    if min_y <= y <= max_y:
+                        selected[tile_id] = (tile_id, offset, length)
+        return [selected[tile_id] for tile_id in sorted(selected)]
+
+
+def continent_slug(continent: str) -> str:
+    return continent.lower().replace(" ", "-")
+
+
+def write_extract(
+    reader: PMTilesReader,
+    output: pathlib.Path,
+    name: str,
+    bbox: list[float],
+    tiles: list[TileRef],
+) -> int:
+    """Copy ``tiles`` out of ``reader`` into a new archive at ``output``.
+
+    PMTiles bounds cannot cross the antimeridian, so a ``bbox`` that does is
+    written with the full longitude range; the centre stays on the country.
+    """
+
+    bounds = [-180.0, bbox[1], 180.0, bbox[3]] if crosses_antimeridian(bbox) else bbox
+    header = replace(
+        reader.header,
+        min_lon_e7=int(bounds[0] * 10_000_000),
+        min_lat_e7=int(bounds[1] * 10_000_000),
+        max_lon_e7=int(bounds[2] * 10_000_000),
+        max_lat_e7=int(bounds[3] * 10_000_000),
+        center_lon_e7=int(center_lon(bbox) * 10_000_000),
+        center_lat_e7=int((bbox[1] + bbox[3]) / 2 * 10_000_000),
+    )
+    metadata = reader.metadata()
+    metadata["name"] = f"OpenAIP {name}"
+    metadata["bounds"] = ",".join(str(value) for value in bounds)
+    with PMTilesWriter(output) as writer:
+        for tile_id, offset, length in tiles:
+            # The source offset identifies the payload, so shared tiles (e.g.
+            # empty ocean) are stored once without hashing them again.
+            writer.add_tile(tile_id, reader.tile_data(Entry(tile_id, offset, length, 1)), key=offset)
+        writer.finalize(header, metadata)
+    return len(tiles)
+
+
+def extract_all(
+    combined: pathlib.Path,
+    country_bounds: dict[str, list[float]],
+    workers: int = EXTRACT_WORKERS,
+    continents: bool = True,
+) -> None:
+    """Write ``output_tiles/<country>.pmtiles`` for every country in
+    ``country_bounds`` and, with ``continents``,
+    ``output_tiles/continents/<continent>.pmtiles`` (a continent extract
+    covers the countries of ``country_bounds`` only, so pass every country
+    of the archive)."""
+
+    if not combined.exists():
+        raise RuntimeError(f"{combined} not found, run the tiling stage first")
+    started = time.perf_counter()
+    EXTRACTS_DIR.mkdir(parents=True, exist_ok=True)
+    CONTINENTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    with PMTilesReader(combined) as reader:
+        index = TileIndex(reader)
+        jobs: list[tuple[pathlib.Path, str, list[float], list[TileRef]]] = []
+        by_continent: dict[str, list[str]] = {}
+        country_tiles: dict[str, list[TileRef]] = {}
+        for country, bbox in sorted(country_bounds.items()):
+            country_tiles[country] = index.select(bbox)
+            name, continent = COUNTRY_META.get(country, (country.upper(), "Other"))
+            by_continent.setdefault(continent, []).append(country)
+            jobs.append((EXTRACTS_DIR / f"{country}.pmtiles", name, bbox, country_tiles[country]))
+        for continent, members in sorted(by_continent.items() if continents else ()):
+            merged: dict[int, TileRef] = {}
+            for country in members:
+                for tile in country_tiles[country]:
+                    merged[tile[0]] = tile
+            bbox = functools.reduce(union_bounds, (country_bounds[country] for country in members))
+            output = CONTINENTS_DIR / f"{continent_slug(continent)}.pmtiles"
+            jobs.append((output, continent, bbox, [merged[key] for key in sorted(merged)]))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(write_extract, reader, output, name, bbox, tiles)
+                for output, name, bbox, tiles in jobs
+                if tiles
+            ]
+            written = sum(future.result() for future in futures)
+
+    print(
+        f"wrote {len(futures)} extracts ({written} tiles) to {EXTRACTS_DIR} "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    from main import COMBINED_PM_TILES, COUNTRY_BOUNDS_PATH
+
+    extract_all(COMBINED_PM_TILES, json.loads(COUNTRY_BOUNDS_PATH.read_text(encoding="utf-8")))
@@ -0,0 +1,162 @@
+"""Time budget and isolation for expensive per-feature geometry work.
+
+A single degenerate airspace can keep GEOS busy in one ``buffer``/
+``difference`` call for minutes, and such a call cannot be interrupted from
+Python. ``BudgetedGeometryMapper`` therefore runs the geometry mapper of large
+features (``FEATURE_ISOLATION_MIN_VERTICES`` vertices or more) in a
+persistent worker process and waits at most ``FEATURE_TIME_BUDGET_S``
+seconds. When the budget runs out the worker is killed (and restarted for the
+next feature) and the feature is not dropped:
+
+1. the ``fallback`` mapper (e.g. the band around a simplified ring) gets the
+   same budget in a fresh worker;
+2. if that is over budget too, the airspace's outer ring is emitted as a
+   line.
+
+Every fallback is recorded (``drain_fallbacks``) and ends up in the run
+report, so no airspace silently disappears from the map.
+``FEATURE_TIME_BUDGET_S=0`` runs every mapper inline, as before.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from profiling import count_vertices
+
+FEATURE_TIME_BUDGET_S = float(os.environ.get("FEATURE_TIME_BUDGET_S", "30"))
+FEATURE_ISOLATION_MIN_VERTICES = int(os.environ.get("FEATURE_ISOLATION_MIN_VERTICES", "1000"))
+
+Geometry = Dict[str, Any]
+GeometryMapper = Callable[[Geometry, Dict[str, Any]], Optional[Geometry]]
+GeometryPredicate = Callable[[Geometry, Dict[str, Any]], bool]
+
+_fallbacks: List[Dict[str, Any]] = []
+
+
+def _serve(connection: Connection) -> None:
+    connection.send("ready")
+    while True:
+        message = connection.recv()
+        if message is None:
+            return
+        func, geometry, properties = message
+        try:
+            connection.send((True, func(geometry, properties)))
+        except Exception as exc:
+            connection.send((False, exc))
+
+
+class IsolatedWorker:
+    """A worker process that runs one mapper call at a time."""
+
+    def __init__(self) -> None:
+        self._process: Optional[multiprocessing.process.BaseProcess] = None
+        self._connection: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        # spawn: the caller may be a multi-threaded process, where fork is unsafe.
+        context = multiprocessing.get_context("spawn")
+        self._connection, child = context.Pipe()
+        self._process = context.Process(target=_serve, args=(child,), name="feature-worker", daemon=True)
+        self._process.start()
+        child.close()
+        # Process start-up (imports) does not count against the budget.
+        self._connection.recv()
+
+    def call(self, func: GeometryMapper, geometry: Geometry, properties: Dict[str, Any], timeout: float) -> Tuple[bool, Any]:
+        """Return ``(True, result)``, or ``(False, None)`` when ``timeout``
+        expired; exceptions raised by ``func`` are re-raised here."""
+
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                self._start()
+            assert self._connection is not None
+            self._connection.send((func, geometry, properties))
+            if not self._connection.poll(timeout):
+                self.kill()
+                return False, None
+            finished, value = self._connection.recv()
+        if not finished:
+            raise value
+        return True, value
+
+    def kill(self) -> None:
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+        if self._connection is not None:
+            self._connection.close()
+        self._process = None
+        self._connection = None
+
+
+_worker = IsolatedWorker()
+
+
+def outer_ring(geometry: Geometry) -> Optional[Geometry]:
+    """Last resort: the exterior ring(s) as (multi)line, no GEOS involved."""
+
+    if geometry.get("type") == "Polygon" and geometry.get("coordinates"):
+        return {"type": "LineString", "coordinates": geometry["coordinates"][0]}
+    if geometry.get("type") == "MultiPolygon" and geometry.get("coordinates"):
+        return {"type": "MultiLineString", "coordinates": [polygon[0] for polygon in geometry["coordinates"] if polygon]}
+    if geometry.get("type") == "GeometryCollection":
+        rings: List[Any] = []
+        for part in geometry.get("geometries") or []:
+            line = outer_ring(part)
+            if line is not None:
+                rings.extend([line["coordinates"]] if line["type"] == "LineString" else line["coordinates"])
+        return {"type": "MultiLineString", "coordinates": rings} if rings else None
+    return None
+
+
+class BudgetedGeometryMapper:
+    """``mapper`` under the time budget, for the features ``applies`` to
+    (a cheap check run inline; other features map to ``None`` directly)."""
+
+    def __init__(self, mapper: GeometryMapper, fallback: GeometryMapper, applies: GeometryPredicate) -> None:
+        self.mapper = mapper
+        self.fallback = fallback
+        self.applies = applies
+
+    def __call__(self, geometry: Geometry, properties: Dict[str, Any]) -> Optional[Geometry]:
+        if FEATURE_TIME_BUDGET_S <= 0:
+            return self.mapper(geometry, properties)
+        if not self.applies(geometry, properties):
+            return None
+        vertices = count_vertices(geometry)
+        if vertices < FEATURE_ISOLATION_MIN_VERTICES:
+            return self.mapper(geometry, properties)
+        finished, result = _worker.call(self.mapper, geometry, properties, FEATURE_TIME_BUDGET_S)
+        if finished:
+            return result
+        used = "simplified"
+        finished, result = _worker.call(self.fallback, geometry, properties, FEATURE_TIME_BUDGET_S)
+        if not finished or not result:
+            used = "outer_ring"
+            result = outer_ring(geometry)
+        _fallbacks.append(
+            {
+                "country": properties.get("country"),
+                "_id": properties.get("_id"),
+                "name": properties.get("name"),
+                "vertices": vertices,
+                "fallback": used,
+                "budget_s": FEATURE_TIME_BUDGET_S,
+            }
+        )
+        return result
+
+
+def drain_fallbacks() -> List[Dict[str, Any]]:
+    """Return and forget the fallbacks recorded since the last call."""
+
+    records = list(_fallbacks)
+    _fallbacks.clear()
+    return records
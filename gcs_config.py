@@ -0,0 +1,119 @@
+"""Where the OpenAIP objects come from: configuration of the object source.
+
+Kept apart from the geometry pipeline so the tools that only talk to the
+bucket (``check_bucket.py``) load neither shapely/pyproj nor, until the first
+bucket request, requests/google-auth. Nothing happens at import time: the
+settings are read from the environment (and the git-ignored ``.env`` file)
+when ``get_object_source`` first runs.
+
+- ``GCS_USER_PROJECT`` - billing project for the requester-pays bucket;
+- ``OPENAIP_SOURCE_DIR`` - read the objects from a local directory instead;
+- ``GCS_BASE_URL`` - point the JSON API client at a stand-in such as
+  ``python object_source.py serve DIR`` (see object_source.py).
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from object_source import ObjectSource
+
+BASE_URL = "https://storage.googleapis.com/storage/v1/b/29f98e10-a489-4c82-ae5e-489dbcd4912f/o"
+ENV_FILE = pathlib.Path(__file__).with_name(".env")
+
+
+def load_env_file(path: pathlib.Path = ENV_FILE) -> None:
+    """Load KEY=VALUE pairs from a .env file into os.environ.
+
+    Real environment variables take precedence over the file. The parser is
+    intentionally tiny (quotes, inline comments, blank lines) so the project
+    needs no extra dependency like python-dotenv.
+    """
+
+    if not path.exists():
+        return
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, _, value = line.partition("=")
+        key = key.strip()
+        value = value.strip()
+        # Drop inline comments (e.g. `VALUE=abc # note`).
+        if " #" in value:
+            value = value.split(" #", 1)[0].strip()
+        # Strip surrounding matching quotes.
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        if key and key not in os.environ:
+            os.environ[key] = value
+
+
+def user_project() -> str:
+    # The bucket is a "requester pays" bucket: every request must name the
+    # Google Cloud billing project that will be charged for the data transfer.
+    # NEVER hardcode the project ID here - anyone with access to the repo could
+    # then use your billing project. Provide it via the GCS_USER_PROJECT
+    # environment variable (or the local .env file) instead.
+    return os.environ.get("GCS_USER_PROJECT", "")
+
+
+def require_user_project() -> str:
+    project = user_project()
+    if not project:
+        raise RuntimeError(
+            "GCS_USER_PROJECT is not set. This bucket is a requester-pays bucket "
+            "and requires a GCP project ID with billing enabled. Set the "
+            "GCS_USER_PROJECT environment variable, e.g.:\n"
+            "    export GCS_USER_PROJECT='your-project-id'"
+        )
+    return project
+
+
+_gcs_session: Any = None
+
+
+def get_gcs_session() -> Any:
+    """Return the authenticated, pooled GCS session (created once and reused).
+
+    Credentials are resolved via Google Application Default Credentials, see
+    gcs_transport.load_credentials.
+    """
+
+    global _gcs_session
+    if _gcs_session is None:
+        from gcs_transport import load_credentials, make_session
+
+        _gcs_session = make_session(load_credentials(), user_project())
+    return _gcs_session
+
+
+_object_source: Optional[ObjectSource] = None
+
+
+def get_object_source() -> ObjectSource:
+    """Return the configured object source (created once and reused)."""
+
+    global _object_source
+    if _object_source is not None:
+        return _object_source
+    load_env_file()
+    from object_source import BucketSource, DirectorySource
+
+    source_dir = os.environ.get("OPENAIP_SOURCE_DIR", "")
+    base_url = os.environ.get("GCS_BASE_URL", "")
+    if source_dir:
+        _object_source = DirectorySource(pathlib.Path(source_dir))
+    elif base_url:
+        from gcs_transport import make_session
+
+        # A stand-in needs neither credentials nor a billing project.
+        stand_in_session = make_session()
+        _object_source = BucketSource(base_url, lambda: stand_in_session)
+    else:
+        project = require_user_project()
+        _object_source = BucketSource(BASE_URL, get_gcs_session, project)
+    return _object_source
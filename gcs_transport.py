@@ -0,0 +1,251 @@
+"""HTTP transport for bucket I/O.
+
+``make_session`` returns the session ``BucketSource`` sends its requests
+through:
+
+- a connection pool sized for concurrent downloads (``GCS_POOL_SIZE``,
+  default 32, instead of urllib3's 10) with keep-alive reuse;
+- compression negotiated for listings and media downloads. Google APIs only
+  gzip a response when the request says ``Accept-Encoding: gzip`` *and* its
+  User-Agent contains "gzip". Payloads are decoded transparently, so sizes and
+  MD5s are those of the stored object;
+- proactive token refresh: the access token is renewed under a lock a few
+  minutes before it expires, so concurrent workers neither race to refresh
+  nor send a request that comes back 401;
+- optional HTTP/2 (``GCS_HTTP2=1``, needs ``pip install 'httpx[http2]'``):
+  all requests are multiplexed over a few connections. Without httpx or its
+  ``h2`` extra the requests/urllib3 transport is used.
+
+Every request gets ``REQUEST_TIMEOUT`` unless the caller passes its own.
+
+``stats`` counts requests, payload bytes and time spent in requests;
+``record_throughput`` adds them to the run report.
+"""
+
+from __future__ import annotations
+
+import datetime
+import importlib.util
+import os
+import threading
+from typing import Any, Iterator
+
+import google.auth
+import requests
+from google.auth.credentials import Credentials
+from google.auth.exceptions import DefaultCredentialsError
+from google.auth.transport.requests import AuthorizedSession, Request
+from requests.adapters import HTTPAdapter
+
+from run_metrics import report
+
+try:
+    import httpx
+except ImportError:  # optional dependency
+    httpx = None
+
+GCS_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+POOL_SIZE = int(os.environ.get("GCS_POOL_SIZE", "32"))
+USE_HTTP2 = os.environ.get("GCS_HTTP2", "") == "1"
+# Refresh the access token this long before it expires.
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+REQUEST_TIMEOUT = 300
+DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip",
+    "User-Agent": "openaip-pmtiles (gzip)",
+}
+
+
+def http2_enabled() -> bool:
+    # httpx.Client(http2=True) raises ImportError without the h2 package.
+    return USE_HTTP2 and httpx is not None and importlib.util.find_spec("h2") is not None
+
+
+class TransportStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, num_bytes: int, seconds: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes += num_bytes
+            self.seconds += seconds
+
+
+stats = TransportStats()
+
+
+def record_throughput(wall_seconds: float) -> None:
+    """Add the transport counters of a stage that took ``wall_seconds``."""
+
+    if not stats.requests:
+        return
+    report.record("gcs_requests", stats.requests)
+    report.record("gcs_bytes", stats.bytes)
+    report.record("gcs_http_version", "HTTP/2" if http2_enabled() else "HTTP/1.1")
+    report.record("gcs_pool_size", POOL_SIZE)
+    # Aggregate rate (what the runner's link achieved) and per-request rate
+    # (what a single connection achieved); their ratio is the parallelism.
+    if wall_seconds > 0:
+        report.record("gcs_mb_per_s", round(stats.bytes / wall_seconds / 1024 / 1024, 2))
+    if stats.seconds > 0:
+        report.record("gcs_request_mb_per_s", round(stats.bytes / stats.seconds / 1024 / 1024, 2))
+
+
+class TokenKeeper:
+    """Keep ``credentials`` fresh, refreshing once for all threads."""
+
+    def __init__(self, credentials: Credentials) -> None:
+        self.credentials = credentials
+        self._lock = threading.Lock()
+        self._request = Request()
+
+    def _stale(self) -> bool:
+        if not self.credentials.token:
+            return True
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return False
+        # google-auth keeps expiry as a naive UTC datetime.
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return expiry - now < TOKEN_REFRESH_MARGIN
+
+    def ensure_fresh(self) -> None:
+        if not self._stale():
+            return
+        with self._lock:
+            if self._stale():
+                self.credentials.refresh(self._request)
+
+    def apply(self, headers: Any) -> None:
+        self.ensure_fresh()
+        self.credentials.apply(headers)
+
+
+def load_credentials() -> Credentials:
+    """Resolve Google Application Default Credentials (ADC).
+
+    Requester-pays buckets never accept anonymous requests, so the request must
+    be authenticated:
+      - locally: `gcloud auth application-default login`, or a service-account
+        key pointed to by GOOGLE_APPLICATION_CREDENTIALS
+      - GitHub Actions: the `google-github-actions/auth` step (WIF/OIDC)
+    """
+
+    try:
+        # The scope is required: with WIF the credentials impersonate the
+        # service account, and iamcredentials.generateAccessToken rejects the
+        # request (400 INVALID_ARGUMENT) when no scope is provided.
+        credentials, _ = google.auth.default(scopes=GCS_SCOPES)
+    except DefaultCredentialsError as exc:
+        raise RuntimeError(
+            "No Google Cloud credentials found. Set up Application Default "
+            "Credentials (ADC):\n"
+            "  1) gcloud auth application-default login, or\n"
+            "  2) set GOOGLE_APPLICATION_CREDENTIALS to a service-account key\n"
+            "  (in GitHub Actions the google-github-actions/auth step does this)"
+        ) from exc
+    return credentials
+
+
+class _PooledAuthorizedSession(AuthorizedSession):
+    def __init__(self, keeper: TokenKeeper) -> None:
+        super().__init__(keeper.credentials)
+        self._keeper = keeper
+
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any) -> requests.Response:
+        self._keeper.ensure_fresh()
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        return super().request(method, url, *args, **kwargs)
+
+
+class _TimeoutSession(requests.Session):
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        return super().request(method, url, *args, **kwargs)
+
+
+def _mount_pool(session: requests.Session) -> None:
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+
+
+# --- HTTP/2 (httpx) ------------------------------------------------------------
+
+
+class _Http2Response:
+    """The part of ``requests.Response`` that ``BucketSource`` uses."""
+
+    def __init__(self, response: Any) -> None:
+        self._response = response
+        self.status_code = response.status_code
+        self.ok = response.is_success
+
+    @property
+    def content(self) -> bytes:
+        return self._response.read()
+
+    @property
+    def text(self) -> str:
+        self._response.read()
+        return self._response.text
+
+    def json(self) -> Any:
+        self._response.read()
+        return self._response.json()
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        return self._response.iter_bytes(chunk_size)
+
+    def close(self) -> None:
+        self._response.close()
+
+    def __enter__(self) -> _Http2Response:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class Http2Session:
+    """Minimal ``requests.Session`` look-alike on top of an HTTP/2 httpx client."""
+
+    def __init__(self, keeper: TokenKeeper | None) -> None:
+        self._keeper = keeper
+        self.headers: dict[str, str] = dict(DEFAULT_HEADERS)
+        self._client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            timeout=REQUEST_TIMEOUT,
+        )
+
+    def get(self, url: str, params: dict[str, str] | None = None, stream: bool = False) -> _Http2Response:
+        headers = dict(self.headers)
+        if self._keeper is not None:
+            self._keeper.apply(headers)
+        request = self._client.build_request("GET", url, params=params, headers=headers)
+        response = self._client.send(request, stream=True)
+        if not stream:
+            response.read()
+        return _Http2Response(response)
+
+
+def make_session(credentials: Credentials | None = None, user_project: str = "") -> Any:
+    """Return a pooled session; authenticated when ``credentials`` is given."""
+
+    keeper = TokenKeeper(credentials) if credentials is not None else None
+    if http2_enabled():
+        session: Any = Http2Session(keeper)
+    else:
+        if USE_HTTP2:
+            print("GCS_HTTP2=1 but httpx[http2] (httpx and h2) is not installed; using HTTP/1.1")
+        session = _PooledAuthorizedSession(keeper) if keeper is not None else _TimeoutSession()
+        _mount_pool(session)
+    if user_project:
+        session.headers["x-goog-user-project"] = user_project
+    return session
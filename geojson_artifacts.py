@@ -0,0 +1,160 @@
+"""Compressed variants and size/hash manifest of the raw GeoJSON downloads.
+
+For every ``tmp/geojsons/<country>_<code>.geojson`` a ``.geojson.gz`` (always)
+and a ``.geojson.zst`` (when the optional ``zstandard`` package is installed)
+are written next to it. Each file is streamed through both codecs in one
+pass, and files are compressed concurrently; both ``zlib`` and
+``zstandard`` release the GIL, so a thread pool scales across cores. Files
+that did not change since the previous run keep their variants.
+
+``manifest.json`` records the size and SHA-256 of every file and variant.
+``web_generator`` renders the sizes and variant links into the download
+page from it, so the page needs no Hugging Face API call.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+MANIFEST_NAME = "manifest.json"
+COMPRESS_WORKERS = int(os.environ.get("COMPRESS_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+CHUNK_SIZE = 1024 * 1024
+
+
+class _HashingWriter:
+    """File wrapper that hashes and counts what the compressor writes."""
+
+    def __init__(self, file: BinaryIO) -> None:
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+
+def _gzip(output: _HashingWriter, size: int) -> BinaryIO:
+    # No file name and a zero mtime in the header keep the output reproducible.
+    return gzip.GzipFile(filename="", mode="wb", fileobj=output, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _zstd(output: _HashingWriter, size: int) -> BinaryIO:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(output, size=size, closefd=False)
+
+
+def compressors() -> dict[str, Callable[[_HashingWriter, int], BinaryIO]]:
+    """Return ``suffix -> stream writer factory`` for the available codecs."""
+
+    available = {"gz": _gzip}
+    if zstandard is not None:
+        available["zst"] = _zstd
+    return available
+
+
+def file_sha256(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_unchanged(path: pathlib.Path, entry: dict[str, Any] | None) -> bool:
+    """Whether ``entry`` (from the previous manifest) still describes ``path``
+    and all its variants, so they need not be compressed again."""
+
+    if not entry or entry.get("size") != path.stat().st_size:
+        return False
+    variants = entry.get("variants", {})
+    if variants.keys() != compressors().keys():
+        return False
+    for suffix, variant in variants.items():
+        compressed = path.with_name(f"{path.name}.{suffix}")
+        if not compressed.exists() or compressed.stat().st_size != variant["size"]:
+            return False
+    return file_sha256(path) == entry["sha256"]
+
+
+def compress_geojson(path: pathlib.Path, previous: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Write the compressed variants of ``path``; return its manifest entry.
+
+    The file is read once, in chunks, and fed to every codec at the same
+    time. When ``previous`` (its entry in the last manifest) still matches the
+    file and its variants, they are kept as they are.
+    """
+
+    if previous is not None and is_unchanged(path, previous):
+        return previous
+    size = path.stat().st_size
+    digest = hashlib.sha256()
+    with contextlib.ExitStack() as stack:
+        outputs: dict[str, _HashingWriter] = {}
+        writers: list[BinaryIO] = []
+        for suffix, open_writer in compressors().items():
+            target = stack.enter_context(path.with_name(f"{path.name}.{suffix}").open("wb"))
+            outputs[suffix] = _HashingWriter(target)
+            # Entered after the file, so the codec is flushed before it closes.
+            writers.append(stack.enter_context(open_writer(outputs[suffix], size)))
+        source = stack.enter_context(path.open("rb"))
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+            for writer in writers:
+                writer.write(chunk)
+    return {
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "variants": {
+            suffix: {"size": output.size, "sha256": output.sha256.hexdigest()} for suffix, output in outputs.items()
+        },
+    }
+
+
+def write_geojson_manifest(directory: pathlib.Path, workers: int = COMPRESS_WORKERS) -> dict[str, Any]:
+    """Compress every raw geojson in ``directory`` and write ``manifest.json``.
+
+    Files whose size and SHA-256 match the previous manifest, and whose
+    variants are still in place, are not compressed again.
+    """
+
+    directory.mkdir(parents=True, exist_ok=True)
+    previous = load_geojson_manifest(directory)["files"]
+    files = sorted(directory.glob("*.geojson"))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(compress_geojson, files, [previous.get(path.name) for path in files])
+        entries = dict(zip((path.name for path in files), results))
+    manifest = {"files": entries}
+    (directory / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    reused = sum(1 for name, entry in entries.items() if entry is previous.get(name))
+    raw = sum(entry["size"] for entry in entries.values())
+    gz = sum(entry["variants"]["gz"]["size"] for entry in entries.values())
+    print(
+        f"compressed {len(entries) - reused} geojson files ({reused} unchanged): "
+        f"{raw / 1024 / 1024:.1f} MB raw, {gz / 1024 / 1024:.1f} MB gzip"
+    )
+    return manifest
+
+
+def load_geojson_manifest(directory: pathlib.Path) -> dict[str, Any]:
+    path = directory / MANIFEST_NAME
+    if not path.exists():
+        return {"files": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
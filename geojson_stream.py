@@ -0,0 +1,66 @@
+"""Stream the features of a GeoJSON FeatureCollection file one at a time.
+
+``json.loads`` on a multi-hundred-MB country file holds the text, the parsed
+tree and every copy the mappers make in memory at once. This reader keeps only
+a bounded text buffer plus the feature currently being decoded, so peak memory
+is set by the largest single feature instead of the whole file.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import re
+from typing import Any, Dict, Iterator
+
+CHUNK_SIZE = 1024 * 1024
+
+# Top-level keys before "features" ("type", maybe "bbox"/"crs") are tiny, so the
+# first match is the FeatureCollection's array and never a nested property.
+_FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+_SKIP = " \t\r\n,"
+
+
+def iter_geojson_features(path: pathlib.Path, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    decoder = json.JSONDecoder()
+    with path.open("r", encoding="utf-8") as f:
+        buffer = ""
+        while True:
+            match = _FEATURES_START.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            # Keep a tail in case the key is split across two chunks.
+            buffer = buffer[-32:] + chunk
+
+        pos = 0
+        eof = False
+        read_size = chunk_size
+        while True:
+            while pos < len(buffer) and buffer[pos] in _SKIP:
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer):
+                try:
+                    feature, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield feature
+                    pos = end
+                    read_size = chunk_size
+                    continue
+            elif eof:
+                return
+            # Need more text: drop what was consumed and read (geometrically
+            # more for huge features, so re-parsing stays amortised linear).
+            chunk = f.read(read_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            read_size *= 2
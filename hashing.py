@@ -0,0 +1,54 @@
+"""Parallel, mmap-backed file hashing.
+
+Files are hashed in a single streaming pass over a read-only memory map, so
+even the multi-GB ``openaip.pmtiles`` never has to fit in RAM. Each pass
+computes both the SHA-256 (used by Git LFS on Hugging Face) and the git blob
+SHA-1 (used for small, non-LFS files), so remote hashes can be compared
+whichever way the hub stored a file. ``hashlib`` releases the GIL on large
+buffers, so a thread pool hashes several files truly in parallel.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable
+
+CHUNK_SIZE = 8 * 1024 * 1024
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+
+
+@dataclass(frozen=True)
+class FileDigest:
+    path: pathlib.Path
+    size: int
+    sha256: str
+    git_sha1: str
+
+
+def hash_file(path: pathlib.Path) -> FileDigest:
+    size = path.stat().st_size
+    sha256 = hashlib.sha256()
+    git_sha1 = hashlib.sha1(f"blob {size}\0".encode("ascii"))
+    if size:
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for start in range(0, size, CHUNK_SIZE):
+                    chunk = view[start:start + CHUNK_SIZE]
+                    sha256.update(chunk)
+                    git_sha1.update(chunk)
+                    chunk.release()
+            finally:
+                view.release()
+    return FileDigest(path, size, sha256.hexdigest(), git_sha1.hexdigest())
+
+
+def hash_files(paths: Iterable[pathlib.Path], workers: int = HASH_WORKERS) -> dict[pathlib.Path, FileDigest]:
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(hash_file, paths)))
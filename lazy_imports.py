@@ -0,0 +1,40 @@
+"""Deferred imports for the heavy geometry and credential stacks.
+
+``main`` names its mappers and indexes at import time, but shapely, pyproj,
+numpy and google-auth cost a few hundred milliseconds to load and are only
+needed once a stage maps features or talks to the bucket. ``LazyFunction``
+stands for ``module.name`` and imports the module on its first call, so the
+lightweight entry points (``check_bucket.py``, ``update_web.py``, ...) start
+without them. Instances pickle as the reference, not the function, so they
+can be sent to worker processes.
+"""
+
+from __future__ import annotations
+
+import importlib
+from typing import Any, Callable, Optional
+
+
+class LazyFunction:
+    """``module.name``, resolved on the first call."""
+
+    def __init__(self, module: str, name: str) -> None:
+        self.module = module
+        self.name = name
+        self._target: Optional[Callable[..., Any]] = None
+
+    def resolve(self) -> Callable[..., Any]:
+        if self._target is None:
+            # import_module holds the import lock, so concurrent first calls
+            # resolve to the same object.
+            self._target = getattr(importlib.import_module(self.module), self.name)
+        return self._target
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self.resolve()(*args, **kwargs)
+
+    def __reduce__(self) -> Any:
+        return LazyFunction, (self.module, self.name)
+
+    def __repr__(self) -> str:
+        return f"LazyFunction({self.module}.{self.name})"
@@ -1,70 +1,97 @@
+import argparse
 import json
+import multiprocessing
 import os
 import pathlib
 import shutil
-import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, List, Optional
-
-import google.auth
-import requests
-from google.auth.exceptions import DefaultCredentialsError
-from google.auth.transport.requests import AuthorizedSession
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
+from artifacts import write_artifact_manifest
+from bootstrap import write_bootstraps
+from bounds import geometry_extent, union_bounds
+from bucket_manifest import Manifest, load_manifest
+from build_stats import BuildStats, previous_stats, write_stats
 from countries import countries, slow_features
-from mapper import DatasetProperties, Geometry, get_airports_properties, get_airspace_border_properties, get_airspace_borders2x_geometry, get_airspace_borders_geometry, get_airspace_properties, get_hang_glidings_properties, get_hotspots_properties, get_navaids_properties, get_obstacle_properties, get_reporting_points_properties
+from extract import EXTRACT_WORKERS, extract_all
+from feature_guard import BudgetedGeometryMapper, drain_fallbacks
+from gcs_config import get_object_source, load_env_file
+from geojson_artifacts import write_geojson_manifest
+from geojson_stream import iter_geojson_features
+from lazy_imports import LazyFunction
+from pipeline import Channel, OrderedBuffer, Pipeline
+from profiling import SLOW_FEATURE_MS, SlowFeature, profiled, slow_feature, write_slow_features
+from run_metrics import MemoryGovernor, report
+from schema import MAPPING_ERRORS, QuarantineRecord, quarantine_record, validated, validator, write_quarantine
+from tiling import run_tippecanoe
+
+if TYPE_CHECKING:
+    from airspace_index import AirspaceIndex
+    from mapper import DatasetProperties, Geometry
 
 DOWNLOAD_DIR = pathlib.Path("tmp")
 GEOJSONS_DIR = DOWNLOAD_DIR / "geojsons"
 OUTPUT_TILES_DIR = pathlib.Path(".")
 COMBINED_PM_TILES = OUTPUT_TILES_DIR / "openaip.pmtiles"
-BASE_URL = "https://storage.googleapis.com/storage/v1/b/29f98e10-a489-4c82-ae5e-489dbcd4912f/o"
-
-
-def load_env_file(path: pathlib.Path = pathlib.Path(__file__).with_name(".env")) -> None:
-    """Load KEY=VALUE pairs from a .env file into os.environ.
-
-    Real environment variables take precedence over the file. The parser is
-    intentionally tiny (quotes, inline comments, blank lines) so the project
-    needs no extra dependency like python-dotenv.
-    """
+COUNTRY_BOUNDS_PATH = DOWNLOAD_DIR / "country_bounds.json"
+RUN_REPORT_PATH = DOWNLOAD_DIR / "run_report.json"
+SPILL_DIR = DOWNLOAD_DIR / "spill"
+RAW_CACHE_DIR = DOWNLOAD_DIR / "raw"
+# Generation label of payloads the fetch stage keeps without a bucket manifest.
+FETCHED_GENERATION = "fetched"
 
-    if not path.exists():
-        return
-    for line in path.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line or line.startswith("#") or "=" not in line:
-            continue
-        key, _, value = line.partition("=")
-        key = key.strip()
-        value = value.strip()
-        # Drop inline comments (e.g. `VALUE=abc # note`).
-        if " #" in value:
-            value = value.split(" #", 1)[0].strip()
-        # Strip surrounding matching quotes.
-        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
-            value = value[1:-1]
-        if key and key not in os.environ:
-            os.environ[key] = value
-
-
-load_env_file()
-
-# The bucket is a "requester pays" bucket: every request must name the
-# Google Cloud billing project that will be charged for the data transfer.
-# NEVER hardcode the project ID here - anyone with access to the repo could
-# then use your billing project. Provide it via the GCS_USER_PROJECT
-# environment variable (or the local .env file) instead.
-GCS_USER_PROJECT = os.environ.get("GCS_USER_PROJECT", "")
+if __name__ == "__main__":
+    # Run as a script: let the git-ignored .env file provide the settings
+    # below. Importing main (check_bucket.py, tools, workers) has no side
+    # effects.
+    load_env_file()
+
+# Memory-bounded mode: MEMORY_LIMIT_MB sets an RSS ceiling (0 = unbounded).
+# In that mode payloads are streamed to disk; those larger than
+# SPILL_THRESHOLD_MB (or any payload once RSS nears the ceiling) are mapped
+# feature by feature instead of being parsed in memory, and new downloads
+# wait for headroom.
+MEMORY_LIMIT_MB = int(os.environ.get("MEMORY_LIMIT_MB", "0"))
+SPILL_THRESHOLD_MB = int(os.environ.get("SPILL_THRESHOLD_MB", "32"))
+memory_governor = MemoryGovernor(MEMORY_LIMIT_MB * 1024 * 1024)
+# Download pipeline: DOWNLOAD_WORKERS threads fetch objects, MAP_WORKERS
+# processes map them (one in-process worker in memory-bounded mode, so the
+# governor sees its memory), one writer per layer appends in country order.
+# PIPELINE_QUEUE_SIZE bounds every queue between the stages.
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "8"))
+MAP_WORKERS = int(os.environ.get("MAP_WORKERS", "0")) or os.cpu_count() or 1
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "8"))
+# The mapping processes start lazily, from map-stage threads, while the
+# download threads and the samplers run; a forked worker could inherit a lock
+# one of them holds (urllib3 pool, import lock, stdout) and hang, so they are
+# spawned, like the geometry workers of feature_guard.py. Importing main has
+# no side effects, so a spawned worker starts quickly, and as direct children
+# of main.py their peak RSS still shows up in the run report.
+MAP_WORKER_CONTEXT = multiprocessing.get_context("spawn")
+# The layer writers hold chunks that arrive ahead of their turn; beyond
+# REORDER_BUFFER_MB (shared by all layers, an eighth of MEMORY_LIMIT_MB in
+# memory-bounded mode) they are spilled to REORDER_SPILL_DIR until due.
+REORDER_BUFFER_MB = int(os.environ.get("REORDER_BUFFER_MB", "256"))
+if MEMORY_LIMIT_MB:
+    REORDER_BUFFER_MB = min(REORDER_BUFFER_MB, max(1, MEMORY_LIMIT_MB // 8))
+REORDER_SPILL_DIR = DOWNLOAD_DIR / "reorder"
+# Dry runs price the download at this egress rate (USD per GiB).
+GCS_EGRESS_USD_PER_GB = float(os.environ.get("GCS_EGRESS_USD_PER_GB", "0.12"))
 INITIAL_GEOJSON_TEMPLATE = '{"type": "FeatureCollection","features": ['
+FINAL_GEOJSON_TEMPLATE = "]}"
 TIPPECANOE_EXECUTABLE = "tippecanoe"
+MIN_ZOOM = 0
+MAX_ZOOM = 14
 TIPPECANOE_ARGS = [
     "--no-feature-limit",
     "--no-tile-size-limit",
     "--no-line-simplification",
     "--detect-shared-borders",
-    "--minimum-zoom=0",
-    "--maximum-zoom=14",
+    f"--minimum-zoom={MIN_ZOOM}",
+    f"--maximum-zoom={MAX_ZOOM}",
     "--force",
     "--drop-rate=0",
     "--base-zoom=0",
@@ -72,31 +99,92 @@ TIPPECANOE_ARGS = [
     "--coalesce-smallest-as-needed",
 ]
 
-PropertiesMapper = Callable[[DatasetProperties], DatasetProperties]
-GeometryMapper = Callable[[Geometry, DatasetProperties], Optional[Geometry]]
+PropertiesMapper = Callable[["DatasetProperties"], "DatasetProperties"]
+GeometryMapper = Callable[["Geometry", "DatasetProperties"], Optional["Geometry"]]
+# Returns the per-feature tippecanoe zoom range ({"minzoom", "maxzoom"}).
+ZoomMapper = Callable[["DatasetProperties"], Optional[Dict[str, int]]]
 Feature = Dict[str, Any]
 
+
+def from_mapper(name: str) -> LazyFunction:
+    """``mapper.<name>``; shapely/pyproj load with the first mapped feature,
+    not when main is imported (see lazy_imports.py)."""
+    return LazyFunction("mapper", name)
+
+
+geometry_bounds = from_mapper("geometry_bounds")
+
+# Indexes built once per downloaded file and shared by every dataset reading
+# it: the airspace overlap index annotates the raw asp features with their
+# stacking and parsed shape (see airspace_index.py).
+FILE_INDEXES: Dict[str, Callable[[Iterable[Feature], Callable[[Feature], bool]], "AirspaceIndex"]] = {
+    "asp": LazyFunction("airspace_index", "AirspaceIndex"),
+}
+
+@dataclass(frozen=True)
+class ZoomAttributes:
+    """Attributes a layer carries up to ``max_zoom``: only ``include`` (when
+    given), minus ``exclude``."""
+    max_zoom: int
+    include: Optional[Tuple[str, ...]] = None
+    exclude: Tuple[str, ...] = ()
+
+    def apply(self, properties: "DatasetProperties") -> "DatasetProperties":
+        return {
+            key: value
+            for key, value in properties.items()
+            if (self.include is None or key in self.include) and key not in self.exclude
+        }
+
 @dataclass()
 class OpenAipDatasetConfig:
     layer_name: str
     file_code: str
     properties_mapper: Optional[PropertiesMapper] = None
     geometry_mapper: Optional[GeometryMapper] = None
-    first = True
+    zoom_mapper: Optional[ZoomMapper] = None
+    # Per-zoom attribute rules, by ascending max_zoom; zooms above the last
+    # rule keep every attribute. tippecanoe cannot filter attributes by layer
+    # and zoom, so each feature is written once per band, limited to that
+    # band with "tippecanoe": {"minzoom", "maxzoom"} (see zoom_bands).
+    attributes: Tuple[ZoomAttributes, ...] = ()
+
+# Below DETAIL_ZOOM point layers carry only what the map renders there; the
+# long labels and the ids/country used by detail popups start at DETAIL_ZOOM.
+# `python tile_report.py` shows what every attribute costs per zoom.
+DETAIL_ZOOM = 8
+OVERVIEW_ATTRIBUTES = (ZoomAttributes(DETAIL_ZOOM - 1, exclude=("name_label_full", "source_id", "country", "icao_code")),)
 
 OPEN_AIP_DATASETS: List[OpenAipDatasetConfig] = [
-    OpenAipDatasetConfig("obstacles", "obs", get_obstacle_properties),
-    OpenAipDatasetConfig("hang_glidings", "hgl", get_hang_glidings_properties),
-    OpenAipDatasetConfig("airports", "apt", get_airports_properties),
-    OpenAipDatasetConfig("navaids", "nav", get_navaids_properties),
-    OpenAipDatasetConfig("hotspots", "hot", get_hotspots_properties),
-    OpenAipDatasetConfig("airspaces", "asp", get_airspace_properties),
-    OpenAipDatasetConfig("airspaces_border_offset", "asp", get_airspace_border_properties, get_airspace_borders_geometry),
-    OpenAipDatasetConfig("airspaces_border_offset_2x", "asp", get_airspace_border_properties, get_airspace_borders2x_geometry),
-    OpenAipDatasetConfig("reporting_points", "rpp", get_reporting_points_properties),
+    OpenAipDatasetConfig("obstacles", "obs", from_mapper("get_obstacle_properties"), attributes=OVERVIEW_ATTRIBUTES),
+    OpenAipDatasetConfig("hang_glidings", "hgl", from_mapper("get_hang_glidings_properties"), attributes=OVERVIEW_ATTRIBUTES),
+    OpenAipDatasetConfig("airports", "apt", from_mapper("get_airports_properties"), attributes=OVERVIEW_ATTRIBUTES),
+    OpenAipDatasetConfig("navaids", "nav", from_mapper("get_navaids_properties"), attributes=OVERVIEW_ATTRIBUTES),
+    OpenAipDatasetConfig("hotspots", "hot", from_mapper("get_hotspots_properties"), attributes=OVERVIEW_ATTRIBUTES),
+    OpenAipDatasetConfig("airspaces", "asp", from_mapper("get_airspace_properties")),
+    OpenAipDatasetConfig("airspace_labels", "asp", from_mapper("get_airspace_label_properties"), from_mapper("get_airspace_label_geometry"), from_mapper("get_airspace_label_zoom"), attributes=OVERVIEW_ATTRIBUTES),
+    # Border bands run under a per-feature time budget (feature_guard.py).
+    OpenAipDatasetConfig("airspaces_border_offset", "asp", from_mapper("get_airspace_border_properties"), BudgetedGeometryMapper(from_mapper("get_airspace_borders_geometry"), from_mapper("get_airspace_border_fallback_geometry"), from_mapper("has_border_band"))),
+    OpenAipDatasetConfig("airspaces_border_offset_2x", "asp", from_mapper("get_airspace_border_properties"), BudgetedGeometryMapper(from_mapper("get_airspace_borders2x_geometry"), from_mapper("get_airspace_border_fallback_geometry"), from_mapper("has_border_band_2x"))),
+    OpenAipDatasetConfig("reporting_points", "rpp", from_mapper("get_reporting_points_properties"), attributes=OVERVIEW_ATTRIBUTES),
 ]
 
 
+# Objects listed by the last `check_bucket.py` audit (tmp/bucket_manifest.json).
+# When present it is the download plan: absent objects are not requested and
+# payloads are cached per generation under tmp/raw/.
+bucket_objects: Optional[Dict[str, Dict[str, Any]]] = None
+# Requested objects skipped because the bucket manifest does not list them.
+unlisted_objects: List[str] = []
+
+# Bounding box of every feature written per country; used to cut the
+# per-country/per-continent extracts out of the combined archive.
+country_bounds: Dict[str, List[float]] = {}
+country_bounds_lock = threading.Lock()
+# Features, bounds and GeoJSON size per country and layer (build_stats.py).
+build_stats = BuildStats()
+
+
 def ensure_download_dir() -> pathlib.Path:
     DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
     return DOWNLOAD_DIR
@@ -116,15 +204,7 @@ def clear_geojsons_dir() -> None:
         shutil.rmtree(GEOJSONS_DIR)
 
 
-def save_raw_geojson(country: str, file_code: str, payload: str) -> None:
-    """Save the raw downloaded GeoJSON for apt/asp layers under tmp/geojsons/.
-
-    These files are later uploaded to the `geojsons` folder on Hugging Face.
-    """
-    GEOJSONS_DIR.mkdir(parents=True, exist_ok=True)
-    (GEOJSONS_DIR / f"{country}_{file_code}.geojson").write_text(payload, encoding="utf-8")
-
-def is_slow_features(country: str, layer: str, properties: DatasetProperties) -> bool:
+def is_slow_features(country: str, layer: str, properties: "DatasetProperties") -> bool:
     slow_by_layer = slow_features.get(country, {})
     slow_props = slow_by_layer.get(layer, {})
     if not slow_props:
@@ -139,153 +219,743 @@ def geojson_path(dataset: OpenAipDatasetConfig) -> pathlib.Path:
     return DOWNLOAD_DIR / f"{dataset.layer_name}.geojson"
 
 
-def init_geojson_files(datasets: List[OpenAipDatasetConfig]) -> None:
-    for dataset in datasets:
-        with geojson_path(dataset).open("w", encoding="utf-8") as f:
-            f.write(INITIAL_GEOJSON_TEMPLATE)
+def country_geojson_path(country: str, layer_name: str) -> pathlib.Path:
+    """Layer file of one country, written in patch mode (see tile_patch.py)."""
+    return DOWNLOAD_DIR / country / f"{layer_name}.geojson"
 
 
-def finalize_geojson_files(datasets: List[OpenAipDatasetConfig]) -> None:
-    for dataset in datasets:
-        with geojson_path(dataset).open("a", encoding="utf-8") as f:
-            f.write("]}")
+def write_country_layers(country: str, layers: Dict[str, str]) -> None:
+    country_dir = ensure_country_dir(country)
+    for layer_name, chunk in layers.items():
+        (country_dir / f"{layer_name}.geojson").write_text(
+            INITIAL_GEOJSON_TEMPLATE + chunk + FINAL_GEOJSON_TEMPLATE, encoding="utf-8"
+        )
+
+
+def extend_country_bounds(country: str, bounds: Optional[List[float]]) -> None:
+    with country_bounds_lock:
+        merged = union_bounds(country_bounds.get(country), bounds)
+        if merged is not None:
+            country_bounds[country] = merged
+
 
-def write_dataset_geojson(
+def load_country_bounds() -> Dict[str, List[float]]:
+    if not COUNTRY_BOUNDS_PATH.exists():
+        return {}
+    return json.loads(COUNTRY_BOUNDS_PATH.read_text(encoding="utf-8"))
+
+
+def seed_country_bounds(country_codes: List[str], remapped_layers: bool) -> None:
+    """Start from the saved bounds of the countries a limited run keeps.
+
+    Countries this run does not map keep their saved bounds; with
+    ``remapped_layers`` (a ``--layers`` run) the mapped countries keep them
+    too, grown by what is mapped now, as their other layers stay in place.
+    Countries no longer in countries.py are dropped.
+    """
+    mapped = set(country_codes)
+    with country_bounds_lock:
+        for country, bounds in load_country_bounds().items():
+            if country in countries and (remapped_layers or country not in mapped):
+                country_bounds[country] = bounds
+
+
+def save_country_bounds() -> None:
+    COUNTRY_BOUNDS_PATH.write_text(json.dumps(country_bounds), encoding="utf-8")
+
+
+def zoom_bands(feature: Feature, rules: Tuple[ZoomAttributes, ...]) -> List[Feature]:
+    """Split ``feature`` into one copy per attribute band that overlaps its
+    own zoom range; every copy keeps the feature id."""
+    if not rules:
+        return [feature]
+    zoom = feature.get("tippecanoe") or {}
+    low, high = zoom.get("minzoom", MIN_ZOOM), zoom.get("maxzoom", MAX_ZOOM)
+    bands: List[Feature] = []
+    start = MIN_ZOOM
+    for rule in (*rules, None):
+        end = MAX_ZOOM if rule is None else rule.max_zoom
+        band_low, band_high = max(start, low), min(end, high)
+        if band_low <= band_high:
+            properties = feature["properties"] if rule is None else rule.apply(feature["properties"])
+            bands.append(dict(feature, properties=properties, tippecanoe={"minzoom": band_low, "maxzoom": band_high}))
+        start = end + 1
+    return bands
+
+
+class MappedFeatures(NamedTuple):
+    serialized: List[str]
+    features: int
+    bounds: Optional[List[float]]
+    slow: List[SlowFeature]
+    quarantined: List[QuarantineRecord]
+
+
+def map_features(
     country: str,
     dataset: OpenAipDatasetConfig,
-    features: List[Feature],
-) -> None:
-    """Append filtered features to the dataset geojson output file."""
-    with geojson_path(dataset).open("a", encoding="utf-8") as f:
-        feature_id = 0
-        for feature in features:
-            if "geometry" not in feature or "properties" not in feature:
-                continue
-            if is_slow_features(country, dataset.layer_name, feature["properties"]):
-                continue
+    features: Iterable[Feature],
+) -> MappedFeatures:
+    """Map and serialize the features of one dataset; return them with their
+    count and bounding box, the features slower to map than SLOW_FEATURE_MS
+    and those a mapper failed on (quarantined, see schema.py)."""
+    serialized: List[str] = []
+    count = 0
+    bounds: Optional[List[float]] = None
+    slow: List[SlowFeature] = []
+    quarantined: List[QuarantineRecord] = []
+    for raw in features:
+        if "geometry" not in raw or "properties" not in raw:
+            continue
+        if is_slow_features(country, dataset.layer_name, raw["properties"]):
+            continue
+        started = time.perf_counter()
+        # Datasets of the same file share the parsed payload; the mappers
+        # return new objects, so a shallow copy keeps it intact.
+        feature = dict(raw)
+        try:
             if dataset.geometry_mapper:
                 geometry = dataset.geometry_mapper(feature["geometry"], feature["properties"])
                 if not geometry:
                     continue
                 feature["geometry"] = geometry
+            if dataset.zoom_mapper:
+                zoom = dataset.zoom_mapper(feature["properties"])
+                if zoom:
+                    feature["tippecanoe"] = zoom
             if dataset.properties_mapper:
                 feature["properties"] = dataset.properties_mapper(feature["properties"])
-            if dataset.first:
-                dataset.first = False
-            else:
-                f.write(",")
-            feature["id"] = feature_id
-            feature_id += 1
-            f.write(json.dumps(feature))
+        except MAPPING_ERRORS as exc:
+            reason = f"{dataset.layer_name}: {type(exc).__name__}: {exc}"
+            quarantined.append(quarantine_record(country, dataset.file_code, dataset.layer_name, raw, reason))
+            continue
+        elapsed = time.perf_counter() - started
+        if elapsed * 1000 > SLOW_FEATURE_MS:
+            slow.append(slow_feature(country, dataset.file_code, dataset.layer_name, raw, elapsed))
+        feature["id"] = count
+        count += 1
+        bounds = union_bounds(bounds, geometry_extent(geometry_bounds(feature["geometry"]), feature["geometry"]))
+        serialized.extend(json.dumps(band) for band in zoom_bands(feature, dataset.attributes))
+    return MappedFeatures(serialized, count, bounds, slow, quarantined)
 
 
-def process_tiles(datasets: List[OpenAipDatasetConfig]) -> None:
+def map_file(
+    country: str,
+    file_code: str,
+    path: Optional[pathlib.Path],
+    streamed: bool,
+    wanted_layers: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Map one downloaded object for every dataset reading it.
+
+    Runs in a mapping worker process. Returns the serialized features per
+    layer (comma-joined) with their count and bounds per layer, the bounding
+    box of everything mapped, the slow
+    features, the geometry fallbacks taken and the quarantined features.
+    With PROFILE set the whole file is profiled. The file is parsed once, or
+    streamed feature by feature once per dataset (and once for its index)
+    when ``streamed``; either way only features valid under the schema of
+    ``file_code`` are mapped. ``wanted_layers`` limits the datasets mapped.
+    """
+    datasets = [
+        dataset for dataset in file_datasets(file_code) if wanted_layers is None or dataset.layer_name in wanted_layers
+    ]
+    serialized_layers = {dataset.layer_name: "" for dataset in datasets}
+    bounds: Optional[List[float]] = None
+    slow: List[SlowFeature] = []
+    fallbacks: List[Dict[str, Any]] = []
+    quarantined: List[QuarantineRecord] = []
+    stats: Dict[str, Tuple[int, Optional[List[float]]]] = {}
+    mapped = {
+        "layers": serialized_layers,
+        "stats": stats,
+        "bounds": bounds,
+        "slow": slow,
+        "fallbacks": fallbacks,
+        "quarantined": quarantined,
+    }
+    if path is None:
+        return mapped
+    validate = validator(file_code)
+    with profiled(f"{country}_{file_code}"):
+        features: List[Feature] = []
+        if not streamed:
+            raw_features = json.loads(path.read_text(encoding="utf-8")).get("features") or []
+            features = list(validated(raw_features, validate, quarantined, country, file_code))
+
+        def stream() -> Iterable[Feature]:
+            # Every pass over a streamed file sees the same invalid features;
+            # only the first one quarantines them.
+            first = not stream_passes
+            stream_passes.append(True)
+            return validated(iter_geojson_features(path), validate, quarantined if first else None, country, file_code)
+
+        stream_passes: List[bool] = []
+        index = None
+        if file_code in FILE_INDEXES:
+            # Features excluded from every layer never reach the index either.
+            file_layers = [dataset.layer_name for dataset in file_datasets(file_code)]
+
+            def excluded(feature: Feature) -> bool:
+                return all(is_slow_features(country, layer, feature["properties"]) for layer in file_layers)
+
+            index = FILE_INDEXES[file_code](stream() if streamed else features, excluded)
+        for dataset in datasets:
+            dataset_features: Iterable[Feature] = stream() if streamed else features
+            if index is not None:
+                dataset_features = index.annotate(dataset_features)
+            result = map_features(country, dataset, dataset_features)
+            serialized_layers[dataset.layer_name] = ",".join(result.serialized)
+            stats[dataset.layer_name] = (result.features, result.bounds)
+            mapped["bounds"] = union_bounds(mapped["bounds"], result.bounds)
+            slow.extend(result.slow)
+            quarantined.extend(result.quarantined)
+            fallbacks.extend(dict(record, layer=dataset.layer_name) for record in drain_fallbacks())
+    return mapped
+
+
+class LayerWriter:
+    """Appends the mapped chunks of one layer in task order."""
+
+    def __init__(self, dataset: OpenAipDatasetConfig, order: Iterable[int], max_bytes: int = 0) -> None:
+        self.buffer = OrderedBuffer(order, max_bytes, REORDER_SPILL_DIR)
+        self.first = True
+        self.file = geojson_path(dataset).open("w", encoding="utf-8")
+        self.file.write(INITIAL_GEOJSON_TEMPLATE)
+
+    def write(self, item: Tuple[int, str]) -> List[Any]:
+        seq, chunk = item
+        for ready in self.buffer.push(seq, chunk):
+            if not ready:
+                continue
+            if self.first:
+                self.first = False
+            else:
+                self.file.write(",")
+            self.file.write(ready)
+        return []
+
+    def close(self) -> None:
+        if not self.buffer.complete:
+            self.buffer.discard()
+            self.file.close()
+            raise RuntimeError(f"{self.file.name}: not every country was written")
+        self.file.write(FINAL_GEOJSON_TEMPLATE)
+        self.file.close()
+
+
+def process_tiles(datasets: List[OpenAipDatasetConfig], threads: int = 0, patch_countries: Optional[List[str]] = None) -> None:
+    """Tile the layer files into the combined archive; with
+    ``patch_countries``, retile only the changed ones of those countries and
+    join their cached tiles instead (see tile_patch.py)."""
     if shutil.which(TIPPECANOE_EXECUTABLE) is None:
         raise RuntimeError(
             "tippecanoe executable not found on PATH. Install tippecanoe to generate pmtiles."
         )
-    geojson_paths = [str(geojson_path(dataset)) for dataset in datasets]
+    if patch_countries is not None:
+        from tile_patch import patch_tiles
+
+        # Every country's archive holds every layer, whatever --layers says.
+        country_layers = {
+            country: [country_geojson_path(country, dataset.layer_name) for dataset in OPEN_AIP_DATASETS]
+            for country in patch_countries
+        }
+        empty_size = len(INITIAL_GEOJSON_TEMPLATE) + len(FINAL_GEOJSON_TEMPLATE)
+        patch_tiles(country_layers, [TIPPECANOE_EXECUTABLE, *TIPPECANOE_ARGS], COMBINED_PM_TILES, empty_size, threads)
+        return
+    missing = [dataset.layer_name for dataset in datasets if not geojson_path(dataset).exists()]
+    if missing:
+        raise RuntimeError(f"no geojson for {', '.join(missing)}, run the map stage first")
+    geojson_paths = [geojson_path(dataset) for dataset in datasets]
     cmd = [
         TIPPECANOE_EXECUTABLE,
         "-o",
         str(COMBINED_PM_TILES),
         *TIPPECANOE_ARGS,
-        *geojson_paths,
+        *[str(path) for path in geojson_paths],
     ]
-    try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as exc:
-        raise RuntimeError("tippecanoe failed") from exc
+    # Temporary directory, threads, metrics and retries: see tiling.py.
+    run_tippecanoe(cmd, COMBINED_PM_TILES, geojson_paths, threads)
 
-def file_datasets(file_code: str) -> List[OpenAipDatasetConfig]:
-    return [dataset for dataset in OPEN_AIP_DATASETS if dataset.file_code == file_code]
+def sort_geojsons(paths: List[pathlib.Path], workers: int = 1) -> None:
+    """Rewrite layer files in Hilbert order of their features (see
+    spatial_sort.py); in memory-bounded mode one layer at a time, with runs
+    of at most a quarter of the ceiling."""
+    from spatial_sort import SORT_RUN_MB, sort_layers
 
+    missing = [str(path) for path in paths if not path.exists()]
+    if missing:
+        raise RuntimeError(f"{', '.join(missing)} not found, run the map stage first")
+    run_bytes = SORT_RUN_MB * 1024 * 1024
+    if memory_governor.enabled:
+        run_bytes = min(run_bytes, MEMORY_LIMIT_MB * 1024 * 1024 // 4)
+        workers = 1
+    report.record("spatial_sort", sort_layers(paths, run_bytes, workers))
 
-_gcs_session = None
 
+def file_datasets(file_code: str, datasets: Optional[List[OpenAipDatasetConfig]] = None) -> List[OpenAipDatasetConfig]:
+    return [dataset for dataset in datasets or OPEN_AIP_DATASETS if dataset.file_code == file_code]
 
-def get_gcs_session() -> requests.Session:
-    """Return an authenticated GCS session (created once and reused).
 
-    Requester-pays buckets never accept anonymous requests, so the request must
-    be authenticated. Credentials are resolved via Google Application Default
-    Credentials (ADC):
-      - locally: `gcloud auth application-default login`, or a service-account
-        key pointed to by GOOGLE_APPLICATION_CREDENTIALS
-      - GitHub Actions: the `google-github-actions/auth` step (WIF/OIDC)
-    """
+def warn_unlisted_objects(manifest: Manifest) -> None:
+    if not unlisted_objects:
+        return
+    names = sorted(unlisted_objects)
+    print(
+        f"{len(names)} requested objects are not in the bucket manifest of {manifest['generated']} and were "
+        f"skipped ({', '.join(names[:10])}{', ...' if len(names) > 10 else ''}); run check_bucket.py again if "
+        "the bucket changed since"
+    )
+    report.record("unlisted_objects", len(names))
+
+
+def fetch_file(country: str, file_code: str, keep: bool = False) -> Tuple[Optional[pathlib.Path], bool]:
+    """Download ``<country>_<file_code>.geojson``; return its local path (None
+    when it does not exist) and whether the file is temporary.
+
+    Without a bucket manifest payloads are spilled and deleted after mapping,
+    unless ``keep`` (fetch stage alone) stores them in tmp/raw/ for a later
+    map stage."""
+    name = f"{country}_{file_code}.geojson"
+    if bucket_objects is not None:
+        entry = bucket_objects.get(name)
+        if entry is None:
+            # Not in the bucket according to the audit - skip the 404 round trip.
+            unlisted_objects.append(name)
+            return None, False
+        path = cached_download(name, entry)
+        temporary = False
+    else:
+        path = RAW_CACHE_DIR / f"{country}_{file_code}.{FETCHED_GENERATION}.geojson" if keep else SPILL_DIR / name
+        with memory_governor.slot():
+            if get_object_source().download(name, path) is None:
+                return None, False
+        report.increment("raw_downloaded_bytes", path.stat().st_size)
+        temporary = not keep
+    if path is not None and file_code in ("apt", "asp"):
+        # Raw apt/asp downloads are also published to the `geojsons` folder
+        # on Hugging Face.
+        GEOJSONS_DIR.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, GEOJSONS_DIR / name)
+    return path, temporary
+
+
+def cached_download(name: str, entry: Dict[str, Any]) -> Optional[pathlib.Path]:
+    """Return the payload of ``name`` from tmp/raw/, downloading it only when
+    the cached copy is not of the generation listed in the bucket manifest."""
+    stem = name[: -len(".geojson")]
+    path = RAW_CACHE_DIR / f"{stem}.{entry['generation']}.geojson"
+    if path.exists() and path.stat().st_size == entry["size"]:
+        report.increment("raw_cache_hits")
+        return path
+
+    partial = path.with_suffix(".part")
+    with memory_governor.slot():
+        md5 = get_object_source().download(name, partial)
+    if md5 is None:
+        print(f"{name} is in the bucket manifest but no longer in the bucket")
+        return None
+    for stale in RAW_CACHE_DIR.glob(f"{stem}.*.geojson"):
+        stale.unlink()
+    if md5 != entry["md5Hash"]:
+        # The object was replaced after the audit: use it, but do not cache it
+        # under the old generation.
+        print(f"{name} changed since the bucket manifest was written; rerun check_bucket.py")
+        path = RAW_CACHE_DIR / f"{stem}.unverified.geojson"
+    partial.replace(path)
+    report.increment("raw_downloaded_bytes", path.stat().st_size)
+    return path
+
+
+def local_file(country: str, file_code: str) -> Optional[pathlib.Path]:
+    """Return the payload an earlier fetch stage left in tmp/raw/: the
+    generation listed in the bucket manifest, else the newest copy."""
+    stem = f"{country}_{file_code}"
+    entry = (bucket_objects or {}).get(f"{stem}.geojson")
+    if entry is not None:
+        path = RAW_CACHE_DIR / f"{stem}.{entry['generation']}.geojson"
+        if path.exists():
+            return path
+    copies = sorted(RAW_CACHE_DIR.glob(f"{stem}.*.geojson"), key=lambda path: path.stat().st_mtime)
+    return copies[-1] if copies else None
+
+
+def file_codes(datasets: Optional[List[OpenAipDatasetConfig]] = None) -> List[str]:
+    return list(dict.fromkeys(dataset.file_code for dataset in datasets or OPEN_AIP_DATASETS))
+
+
+def is_streamed(path: Optional[pathlib.Path]) -> bool:
+    """Large payloads are mapped feature by feature in memory-bounded mode."""
+    return path is not None and memory_governor.enabled and (
+        path.stat().st_size > SPILL_THRESHOLD_MB * 1024 * 1024 or memory_governor.near_ceiling()
+    )
 
-    global _gcs_session
-    if _gcs_session is not None:
-        return _gcs_session
 
+def fetch_countries(country_codes: List[str], datasets: Optional[List[OpenAipDatasetConfig]] = None) -> None:
+    """Fetch stage alone: download the objects of ``country_codes`` into
+    tmp/raw/ for a later map stage."""
+    tasks = [(country, file_code) for country in country_codes for file_code in file_codes(datasets)]
+    pipeline = Pipeline()
+    queued = pipeline.channel("tasks", DOWNLOAD_WORKERS)
+    missing: List[str] = []
+
+    def download(item: Tuple[str, str]) -> List[Tuple[Channel, Any]]:
+        path, _ = fetch_file(*item, keep=True)
+        if path is None:
+            missing.append("_".join(item))
+        return []
+
+    pipeline.source("tasks", tasks, queued)
+    pipeline.stage("download", download, queued, workers=DOWNLOAD_WORKERS)
+    pipeline.run()
+    pipeline.print_summary()
+    report.record("pipeline", pipeline.as_dict())
+    print(f"fetched {len(tasks) - len(missing)} of {len(tasks)} objects into {RAW_CACHE_DIR}")
+
+
+def download_countries(
+    country_codes: List[str],
+    datasets: Optional[List[OpenAipDatasetConfig]] = None,
+    local_only: bool = False,
+    per_country: bool = False,
+) -> None:
+    """Download, map and write every object of ``country_codes``.
+
+    download (threads) -> map (processes) -> one ordered writer per layer,
+    connected by bounded queues; per-stage busy/idle/blocked time and queue
+    depths go to the run report. ``datasets`` limits the layers written;
+    ``local_only`` (map stage alone) reads the payloads of an earlier fetch
+    stage from tmp/raw/ instead of downloading them; ``per_country`` (patch
+    mode) also writes every country's layers to tmp/<country>/.
+    """
+    datasets = datasets or OPEN_AIP_DATASETS
+    codes = file_codes(datasets)
+    tasks = [(country, file_code) for country in country_codes for file_code in codes]
+    pending = {country: len(codes) for country in country_codes}
+    pending_lock = threading.Lock()
+    slow: List[SlowFeature] = []
+    fallbacks: List[Dict[str, Any]] = []
+    quarantined: List[QuarantineRecord] = []
+    pipeline = Pipeline()
+    queued = pipeline.channel("tasks", DOWNLOAD_WORKERS)
+    downloaded = pipeline.channel("downloaded", PIPELINE_QUEUE_SIZE)
+    writers: Dict[str, LayerWriter] = {}
+    layer_channels: Dict[str, Channel] = {}
+    reorder_bytes = REORDER_BUFFER_MB * 1024 * 1024 // len(datasets)
+    for dataset in datasets:
+        order = [seq for seq, (_, file_code) in enumerate(tasks) if file_code == dataset.file_code]
+        writers[dataset.layer_name] = LayerWriter(dataset, order, reorder_bytes)
+        layer_channels[dataset.layer_name] = pipeline.channel(f"write:{dataset.layer_name}", PIPELINE_QUEUE_SIZE)
+
+    def download(item: Tuple[int, Tuple[str, str]]) -> List[Tuple[Channel, Any]]:
+        seq, (country, file_code) = item
+        if local_only:
+            path, temporary = local_file(country, file_code), False
+        else:
+            path, temporary = fetch_file(country, file_code)
+        return [(downloaded, (seq, country, file_code, path, temporary))]
+
+    layers = [dataset.layer_name for dataset in datasets]
+    for country in country_codes:
+        build_stats.reset(country, layers)
+    in_process = memory_governor.enabled
+    executor = None if in_process else ProcessPoolExecutor(max_workers=MAP_WORKERS, mp_context=MAP_WORKER_CONTEXT)
+
+    def map_stage(item: Tuple[int, str, str, Optional[pathlib.Path], bool]) -> List[Tuple[Channel, Any]]:
+        seq, country, file_code, path, temporary = item
+        streamed = is_streamed(path)
+        try:
+            if executor is None:
+                mapped = map_file(country, file_code, path, streamed, layers)
+            else:
+                mapped = executor.submit(map_file, country, file_code, path, streamed, layers).result()
+        finally:
+            if path is not None and temporary:
+                path.unlink()
+        extend_country_bounds(country, mapped["bounds"])
+        for layer, (count, layer_bounds) in mapped["stats"].items():
+            build_stats.add(country, layer, count, layer_bounds, len(mapped["layers"][layer]))
+        build_stats.add_quarantined(country, len(mapped["quarantined"]))
+        if per_country:
+            write_country_layers(country, mapped["layers"])
+        with pending_lock:
+            slow.extend(mapped["slow"])
+            fallbacks.extend(mapped["fallbacks"])
+            quarantined.extend(mapped["quarantined"])
+            pending[country] -= 1
+            if not pending[country]:
+                done = len(country_codes) - sum(1 for count in pending.values() if count)
+                print(f"geojson generated for {country} ({done}/{len(country_codes)})")
+        return [(layer_channels[layer], (seq, chunk)) for layer, chunk in mapped["layers"].items()]
+
+    pipeline.source("tasks", enumerate(tasks), queued)
+    pipeline.stage("read" if local_only else "download", download, queued, [downloaded], workers=DOWNLOAD_WORKERS)
+    pipeline.stage("map", map_stage, downloaded, layer_channels.values(), workers=1 if in_process else MAP_WORKERS)
+    for layer, writer in writers.items():
+        pipeline.stage(f"write:{layer}", writer.write, layer_channels[layer])
     try:
-        # The scope is required: with WIF the credentials impersonate the
-        # service account, and iamcredentials.generateAccessToken rejects the
-        # request (400 INVALID_ARGUMENT) when no scope is provided.
-        credentials, _ = google.auth.default(
-            scopes=["https://www.googleapis.com/auth/cloud-platform"]
-        )
-    except DefaultCredentialsError as exc:
-        raise RuntimeError(
-            "No Google Cloud credentials found. Set up Application Default "
-            "Credentials (ADC):\n"
-            "  1) gcloud auth application-default login, or\n"
-            "  2) set GOOGLE_APPLICATION_CREDENTIALS to a service-account key\n"
-            "  (in GitHub Actions the google-github-actions/auth step does this)"
-        ) from exc
-
-    session = AuthorizedSession(credentials)
-    if GCS_USER_PROJECT:
-        session.headers["x-goog-user-project"] = GCS_USER_PROJECT
-    _gcs_session = session
-    return session
-
-
-def download_file(country: str, file_code: str) -> None:
-    if not GCS_USER_PROJECT:
-        raise RuntimeError(
-            "GCS_USER_PROJECT is not set. This bucket is a requester-pays bucket "
-            "and requires a GCP project ID with billing enabled. Set the "
-            "GCS_USER_PROJECT environment variable, e.g.:\n"
-            "    export GCS_USER_PROJECT='your-project-id'"
-        )
-    url = f"{BASE_URL}/{country}_{file_code}.geojson"
-    response = get_gcs_session().get(
-        url,
-        params={"alt": "media", "userProject": GCS_USER_PROJECT},
+        pipeline.run()
+    except BaseException:
+        for writer in writers.values():
+            writer.buffer.discard()
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    for writer in writers.values():
+        writer.close()
+    pipeline.print_summary()
+    report.record("pipeline", pipeline.as_dict())
+    buffers = [writer.buffer for writer in writers.values()]
+    spilled = sum(buffer.spilled for buffer in buffers)
+    spilled_bytes = sum(buffer.spilled_bytes for buffer in buffers)
+    if spilled:
+        print(f"reorder buffers spilled {spilled} chunks ({spilled_bytes / 1024 ** 2:.1f} MB) to {REORDER_SPILL_DIR}")
+    report.record(
+        "reorder_buffer",
+        {
+            "limit_mb": REORDER_BUFFER_MB,
+            "max_buffered_bytes": {layer: writer.buffer.max_buffered_bytes for layer, writer in writers.items()},
+            "spilled_chunks": spilled,
+            "spilled_bytes": spilled_bytes,
+        },
     )
-    if response.status_code == 404:
-        return
-    if not response.ok:
-        # Include the GCS error body so the exact reason (billing vs. IAM
-        # permission) is visible in the logs.
-        raise RuntimeError(
-            f"GCS download failed with HTTP {response.status_code}: {response.text}"
+    report.record("slow_features", len(slow))
+    report.record("geometry_fallbacks", fallbacks)
+    for record in fallbacks:
+        print(
+            f"geometry fallback {record['country']}/{record['layer']}: {record['name'] or record['_id']} "
+            f"({record['vertices']} vertices) over {record['budget_s']:.0f}s, used {record['fallback']}"
         )
-    payload_text = response.text
-    if file_code in ("apt", "asp"):
-        save_raw_geojson(country, file_code, payload_text)
-    for dataset in file_datasets(file_code):
-        geojson = json.loads(payload_text)
-        features: List[Feature] = geojson.get("features") or []
-        write_dataset_geojson(country, dataset, features)
+    layers_by_file = {code: [dataset.layer_name for dataset in file_datasets(code, datasets)] for code in codes}
+    write_slow_features(slow, layers_by_file)
+    report.record("quarantined", write_quarantine(quarantined))
+
+
+STAGES = ["fetch", "map", "sort", "tile", "extract", "publish"]
+# Publishing runs as its own CI job, after the pages are regenerated; the
+# spatial sort (spatial_sort.py) is opt-in.
+DEFAULT_STAGES = ["fetch", "map", "tile", "extract"]
+
+
+def parse_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def parse_jobs(values: List[str]) -> Dict[str, int]:
+    """``["4", "map=2"]`` -> workers per stage; a bare number applies to
+    every stage without an explicit value."""
+    jobs: Dict[str, int] = {}
+    default = 0
+    for value in values:
+        stage, _, count = value.rpartition("=")
+        if stage and stage not in STAGES:
+            raise argparse.ArgumentTypeError(f"unknown stage {stage!r} in --jobs {value}")
+        if not count.isdigit() or int(count) < 1:
+            raise argparse.ArgumentTypeError(f"--jobs {value}: expected [STAGE=]N with N >= 1")
+        if stage:
+            jobs[stage] = int(count)
+        else:
+            default = int(count)
+    return {stage: jobs.get(stage, default) for stage in STAGES if jobs.get(stage, default)}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Build the OpenAIP PMTiles: fetch the raw objects, map them to GeoJSON layers, "
+        "tile them with tippecanoe, cut the extracts and publish to Hugging Face.",
+    )
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        metavar="STAGE",
+        help=f"stages to run, always in pipeline order ({', '.join(STAGES)}; default: {' '.join(DEFAULT_STAGES)}). "
+        "A map stage without fetch reads the payloads an earlier fetch left in tmp/raw/.",
+    )
+    parser.add_argument("--countries", type=parse_list, help="comma-separated ISO codes (default: countries.py)")
+    parser.add_argument("--layers", type=parse_list, help="comma-separated layer names (default: all)")
+    parser.add_argument(
+        "--jobs",
+        action="append",
+        default=[],
+        metavar="[STAGE=]N",
+        help="workers of a stage (fetch: downloads, map: processes, sort: layers at a time, tile: tippecanoe threads, "
+        "extract, publish: hashing); "
+        "a bare N applies to every stage; repeatable",
+    )
+    parser.add_argument(
+        "--patch",
+        action="store_true",
+        help="keep per-country layers and tiles in tmp/<country>/, retile only changed countries and rebuild "
+        "the archive from them with tile-join",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="print what the stages would download and cost, then exit")
+    args = parser.parse_args(argv)
+    # Validated here: argparse rejects an empty list for nargs="*" with choices.
+    unknown = sorted(set(args.stages) - set(STAGES))
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+    args.stages = [stage for stage in STAGES if stage in (args.stages or DEFAULT_STAGES)]
+    unknown = sorted(set(args.countries or []) - set(countries))
+    if unknown:
+        parser.error(f"not in countries.py: {', '.join(unknown)}")
+    layer_names = [dataset.layer_name for dataset in OPEN_AIP_DATASETS]
+    unknown = sorted(set(args.layers or []) - set(layer_names))
+    if unknown:
+        parser.error(f"unknown layers: {', '.join(unknown)} (choose from {', '.join(layer_names)})")
+    if "publish" in args.stages and (args.countries or args.layers) and not args.patch:
+        # The archive, stats and downloads of such a run only hold the
+        # selection, and the upload deletes remote files it does not have.
+        parser.error("publish needs every country and layer: drop --countries/--layers or add --patch")
+    try:
+        args.jobs = parse_jobs(args.jobs)
+    except argparse.ArgumentTypeError as exc:
+        parser.error(str(exc))
+    return args
 
 
-def download_country(country: str) -> None:
-    file_codes = {dataset.file_code for dataset in OPEN_AIP_DATASETS}
-    for file_code in file_codes:
-        download_file(country, file_code)
+def format_size(num_bytes: float) -> str:
+    return f"{num_bytes / 1024 / 1024:.1f} MB"
 
-def main() -> None:
+
+def print_estimate(
+    manifest: Optional[Manifest],
+    country_codes: List[str],
+    datasets: List[OpenAipDatasetConfig],
+    stages: List[str],
+) -> None:
+    """Dry run: what the selected stages would download, what that costs and,
+    from the previous run report, roughly how long they take."""
+    tasks = [(country, code) for country in country_codes for code in file_codes(datasets)]
+    names = [f"{country}_{code}.geojson" for country, code in tasks]
+    print(f"stages: {' '.join(stages)}; {len(country_codes)} countries, layers: {', '.join(d.layer_name for d in datasets)}")
+    if "fetch" in stages:
+        if manifest is None:
+            print(f"{len(names)} objects to request; run check_bucket.py for sizes and a cost estimate")
+        else:
+            objects = manifest["objects"]
+            present = [name for name in names if name in objects]
+            total = sum(objects[name]["size"] for name in present)
+            cached = sum(
+                objects[name]["size"]
+                for name in present
+                if (RAW_CACHE_DIR / f"{name[: -len('.geojson')]}.{objects[name]['generation']}.geojson").exists()
+            )
+            download = total - cached
+            cost = download / 1024 ** 3 * GCS_EGRESS_USD_PER_GB
+            print(
+                f"fetch: {len(present)} of {len(names)} objects in the manifest of {manifest['generated']}, "
+                f"{format_size(total)}; {format_size(cached)} cached in {RAW_CACHE_DIR}, "
+                f"{format_size(download)} to download (about ${cost:.2f} at ${GCS_EGRESS_USD_PER_GB}/GiB egress)"
+            )
+            previous = json.loads(RUN_REPORT_PATH.read_text(encoding="utf-8")) if RUN_REPORT_PATH.exists() else {}
+            rate = previous.get("values", {}).get("gcs_mb_per_s")
+            if rate:
+                print(f"fetch: about {download / 1024 / 1024 / rate:.0f}s at the last run's {rate} MB/s")
+    elif "map" in stages:
+        local = sum(local_file(country, code) is not None for country, code in tasks)
+        print(f"map: {local} of {len(tasks)} objects available in {RAW_CACHE_DIR}")
+    if RUN_REPORT_PATH.exists():
+        previous_stages = json.loads(RUN_REPORT_PATH.read_text(encoding="utf-8")).get("stages", {})
+        timings = ", ".join(f"{name} {stage['seconds']:.0f}s" for name, stage in previous_stages.items())
+        if timings:
+            print(f"last run: {timings}")
+
+
+def run(args: argparse.Namespace) -> None:
+    global bucket_objects, build_stats, DOWNLOAD_WORKERS, MAP_WORKERS
+    from gcs_transport import record_throughput
+
+    country_codes = args.countries or countries
+    datasets = [dataset for dataset in OPEN_AIP_DATASETS if not args.layers or dataset.layer_name in args.layers]
+    DOWNLOAD_WORKERS = args.jobs.get("fetch", DOWNLOAD_WORKERS)
+    MAP_WORKERS = args.jobs.get("map", MAP_WORKERS)
     ensure_download_dir()
-    clear_geojsons_dir()
-    init_geojson_files(OPEN_AIP_DATASETS)
-    for index, country in enumerate(countries, start=1):
-        download_country(country)
-        print(f"geojson generated for {country} ({index}/{len(countries)})")
-    finalize_geojson_files(OPEN_AIP_DATASETS)
-    process_tiles(OPEN_AIP_DATASETS)
+    manifest = load_manifest()
+    if manifest is not None:
+        bucket_objects = manifest["objects"]
+        print(f"using the bucket manifest of {manifest['generated']} as download plan")
+    if args.dry_run:
+        print_estimate(manifest, country_codes, datasets, args.stages)
+        return
+    report.record("memory_limit_mb", MEMORY_LIMIT_MB)
+    report.record("stages", args.stages)
+    previous = previous_stats() if "map" in args.stages else None
+    if args.patch:
+        # The archive keeps the countries and layers this run does not map.
+        build_stats = BuildStats(previous)
+    elif args.layers:
+        # The layer files this run does not write are tiled as they are; the
+        # ones it writes hold only the countries mapped now.
+        build_stats = BuildStats(previous)
+        for country in list(build_stats.countries):
+            build_stats.reset(country, [dataset.layer_name for dataset in datasets])
+    if "map" in args.stages and (args.patch or args.countries or args.layers):
+        # tmp/country_bounds.json keeps every country, not only those mapped
+        # now; in patch mode they are all in the joined archive.
+        seed_country_bounds(country_codes, bool(args.layers))
+    try:
+        if "fetch" in args.stages:
+            if not args.countries:
+                # Only a full run may drop the raw geojsons of removed countries.
+                clear_geojsons_dir()
+            with report.stage("download") as stage:
+                if "map" in args.stages:
+                    download_countries(country_codes, datasets, per_country=args.patch)
+                    save_country_bounds()
+                    write_stats(build_stats, previous)
+                else:
+                    fetch_countries(country_codes, datasets)
+            record_throughput(stage["seconds"])
+            if manifest is not None:
+                warn_unlisted_objects(manifest)
+            with report.stage("compress_geojsons"):
+                write_geojson_manifest(GEOJSONS_DIR)
+        elif "map" in args.stages:
+            with report.stage("map"):
+                download_countries(country_codes, datasets, local_only=True, per_country=args.patch)
+                save_country_bounds()
+                write_stats(build_stats, previous)
+        if "sort" in args.stages:
+            if args.patch:
+                sort_paths = [country_geojson_path(c, d.layer_name) for c in country_codes for d in datasets]
+            else:
+                sort_paths = [geojson_path(dataset) for dataset in datasets]
+            with report.stage("sort"):
+                sort_geojsons(sort_paths, args.jobs.get("sort", 1))
+        if "tile" in args.stages:
+            with report.stage("tiles"):
+                # Patch mode joins every country, not only those mapped now.
+                process_tiles(datasets, args.jobs.get("tile", 0), countries if args.patch else None)
+        if "extract" in args.stages:
+            bounds = country_bounds if "map" in args.stages else load_country_bounds()
+            if not bounds and "map" not in args.stages:
+                raise RuntimeError(f"{COUNTRY_BOUNDS_PATH} not found, run the map stage first")
+            # A --countries run tiles only its countries: extract just those
+            # and leave the continent extracts of the last full run alone. A
+            # patch run joins every country, so everything is extracted.
+            subset = bool(args.countries) and not args.patch
+            if subset:
+                bounds = {country: box for country, box in bounds.items() if country in country_codes}
+            with report.stage("extract"):
+                extract_all(COMBINED_PM_TILES, bounds, args.jobs.get("extract", EXTRACT_WORKERS), continents=not subset)
+                write_bootstraps(COMBINED_PM_TILES, bounds)
+        if {"fetch", "map", "tile", "extract"} & set(args.stages):
+            # What the upload (here or in the next CI job) verifies against.
+            with report.stage("artifacts"):
+                write_artifact_manifest(workers=args.jobs.get("publish"))
+        if "publish" in args.stages:
+            from upload_to_hugging_face import publish
+
+            with report.stage("publish"):
+                publish(workers=args.jobs.get("publish"))
+    finally:
+        report.write(RUN_REPORT_PATH)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    run(parse_args(argv))
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
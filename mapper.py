@@ -1,8 +1,9 @@
+import math
 from typing import Any, Dict, List, Literal, Optional, TypedDict, cast
 from dataclasses import dataclass
-from shapely import transform
-from shapely.geometry import shape, mapping
-from shapely.ops import transform
+import numpy as np
+import shapely
+from shapely.geometry import MultiPolygon, shape, mapping
 from enums import EAirSpaceIcaoClass, EAirSpaceType, EAirportType, EFrequencyUnit, EHangGlidingType, EHeightUnit, EHotSpotOccurrence, EHotSpotReliability, EHotSpotType, ENavaidType, EObstacleType, EReferenceDatum, RunwayPaved
 import pyproj
 
@@ -10,9 +11,34 @@ DatasetProperties = Dict[str, Any]
 
 @dataclass()
 class Geometry(TypedDict):
-    type: Literal["Point", "LineString", "Polygon"]
+    type: Literal["Point", "LineString", "Polygon", "MultiPolygon", "GeometryCollection"]
     coordinates: Any
 
+def geometry_bounds(geometry: Geometry) -> Optional[List[float]]:
+    """Return ``[min_lon, min_lat, max_lon, max_lat]`` of a GeoJSON geometry."""
+    xs: List[float] = []
+    ys: List[float] = []
+
+    def walk(coordinates: Any) -> None:
+        if coordinates and isinstance(coordinates[0], (int, float)):
+            xs.append(coordinates[0])
+            ys.append(coordinates[1])
+            return
+        for part in coordinates or []:
+            walk(part)
+
+    if geometry.get('type') == "GeometryCollection":
+        for part in geometry.get('geometries') or []:
+            bounds = geometry_bounds(part)
+            if bounds:
+                xs.extend(bounds[0::2])
+                ys.extend(bounds[1::2])
+    else:
+        walk(geometry.get('coordinates'))
+    if not xs:
+        return None
+    return [min(xs), min(ys), max(xs), max(ys)]
+
 def heightFormatter(value: float, unit: EHeightUnit, datum: EReferenceDatum) -> str:
     if(datum == EReferenceDatum.STD):
         return f"LF{value}"
@@ -46,39 +72,122 @@ def get_airspace_properties(properties: DatasetProperties) -> DatasetProperties:
         result['name_label'] = (EAirSpaceIcaoClass(properties['icaoClass']).name.upper() if properties['type'] == EAirSpaceType.other else EAirSpaceType(properties['type']).name.upper()) + " " + \
         heightFormatter(properties['lowerLimit']['value'], EHeightUnit(properties['lowerLimit']['unit']), EReferenceDatum(properties['lowerLimit']['referenceDatum'])) + " - " + \
         heightFormatter(properties['upperLimit']['value'], EHeightUnit(properties['upperLimit']['unit']), EReferenceDatum(properties['upperLimit']['referenceDatum']))
+    # Overlap group, stacking and label point from airspace_index.AirspaceIndex.
+    if '_stack' in properties:
+        result.update(properties['_stack'])
     return result
 
-def get_airspace_borders_geometry(geometry: Geometry, properties: DatasetProperties) -> Optional[Geometry]:
-    if geometry['type'] == "Polygon" and properties['type'] not in [EAirSpaceType.other, EAirSpaceType.adiz]:
-        polygon = shape(geometry)
+# Airspace labels appear once the airspace spans LABEL_MIN_PIXELS of a
+# 256 px tile and stay for LABEL_ZOOM_SPAN zooms (capped at the tileset's
+# --maximum-zoom), so large FIRs are labelled early and not at street level.
+EARTH_CIRCUMFERENCE_KM = 40075.017
+LABEL_MIN_PIXELS = 64
+LABEL_ZOOM_SPAN = 8
+LABEL_MAX_ZOOM = 14
 
-        aeqd_crs = f"+proj=aeqd +lat_0={polygon.centroid.y} +lon_0={polygon.centroid.x} +datum=WGS84 +units=m"
-        to_utm = pyproj.Transformer.from_crs("EPSG:4326", aeqd_crs, always_xy=True).transform
-        to_wgs = pyproj.Transformer.from_crs(aeqd_crs, "EPSG:4326", always_xy=True).transform
+def get_airspace_label_properties(properties: DatasetProperties) -> DatasetProperties:
+    """Return the few fields a label point needs."""
+    airspace = get_airspace_properties(properties)
+    result: DatasetProperties = {}
+    result['feature_type'] = 'airspace_label'
+    for key in ('source_id', 'country', 'type', 'icao_class', 'name', 'name_label', 'stack_rank'):
+        if key in airspace:
+            result[key] = airspace[key]
+    return result
 
-        polygon_utm = transform(to_utm, polygon)
-        inner_polygon = polygon_utm.buffer(-300)
-        border_utm = polygon_utm.difference(inner_polygon)
-        border = transform(to_wgs, border_utm)
-        return  mapping(border)
+def get_airspace_label_geometry(geometry: Geometry, properties: DatasetProperties) -> Optional[Geometry]:
+    """Pole of inaccessibility computed by airspace_index.AirspaceIndex."""
+    label = properties.get('_label')
+    if not label:
+        return None
+    return {"type": "Point", "coordinates": [label['lon'], label['lat']]}
 
-    return None
+def get_airspace_label_zoom(properties: DatasetProperties) -> Optional[Dict[str, int]]:
+    label = properties.get('_label')
+    if not label:
+        return None
+    size_km = math.sqrt(max(label['area_km2'], 1e-6))
+    minzoom = math.ceil(math.log2(EARTH_CIRCUMFERENCE_KM * LABEL_MIN_PIXELS / 256 / size_km))
+    minzoom = min(max(minzoom, 0), LABEL_MAX_ZOOM)
+    return {"minzoom": minzoom, "maxzoom": min(minzoom + LABEL_ZOOM_SPAN, LABEL_MAX_ZOOM)}
 
-def get_airspace_borders2x_geometry(geometry: Geometry, properties: DatasetProperties) -> Optional[Geometry]:
-    if geometry['type'] == "Polygon" and properties['type'] in [EAirSpaceType.other, EAirSpaceType.adiz]:
-        polygon = shape(geometry)
+# Width of the airspace border band (metres, inside the airspace).
+BORDER_WIDTH_M = 300
+# Fallback band: simplify the polygon to this tolerance (metres) first.
+FALLBACK_SIMPLIFY_M = 100
+
+POLYGONAL_TYPES = ("Polygon", "MultiPolygon", "GeometryCollection")
+
+def polygonal_shape(geometry: Geometry, properties: DatasetProperties) -> Optional[Any]:
+    """Return the feature as a valid (Multi)Polygon; the polygonal parts of a
+    GeometryCollection are merged into one MultiPolygon."""
+    # Parsed once per file by airspace_index.AirspaceIndex when available.
+    polygon = properties.get('_shape') or shape(geometry)
+    if polygon.geom_type not in ("Polygon", "MultiPolygon") or not polygon.is_valid:
+        if not polygon.is_valid:
+            polygon = shapely.make_valid(polygon)
+        parts: List[Any] = []
+        for part in shapely.get_parts(polygon):
+            if part.geom_type == "Polygon":
+                parts.append(part)
+            elif part.geom_type == "MultiPolygon":
+                parts.extend(part.geoms)
+        polygon = MultiPolygon(parts) if len(parts) != 1 else parts[0]
+    return None if polygon.is_empty else polygon
+
+def _projected(geometry: Any, projection: pyproj.Proj, inverse: bool = False) -> Any:
+    return shapely.transform(geometry, lambda xy: np.column_stack(projection(xy[:, 0], xy[:, 1], inverse=inverse)))
 
-        aeqd_crs = f"+proj=aeqd +lat_0={polygon.centroid.y} +lon_0={polygon.centroid.x} +datum=WGS84 +units=m"
-        to_utm = pyproj.Transformer.from_crs("EPSG:4326", aeqd_crs, always_xy=True).transform
-        to_wgs = pyproj.Transformer.from_crs(aeqd_crs, "EPSG:4326", always_xy=True).transform
+def border_band(polygon: Any, simplify_m: float = 0) -> Any:
+    """Return the band within BORDER_WIDTH_M inside ``polygon`` (WGS84).
 
-        polygon_utm = transform(to_utm, polygon)
-        border_utm = polygon_utm.difference(polygon_utm.buffer(-300))
-        border = transform(to_wgs, border_utm)
-        return  mapping(border)
+    Multipart airspaces cost one projection and one buffer per feature, not
+    per part: all coordinates go through a single vectorised projection call
+    (azimuthal equidistant, centred on the feature) and the MultiPolygon is
+    buffered as a whole.
+    """
+    centroid = polygon.centroid
+    projection = pyproj.Proj(f"+proj=aeqd +lat_0={centroid.y} +lon_0={centroid.x} +datum=WGS84 +units=m")
+    polygon_utm = _projected(polygon, projection)
+    if simplify_m:
+        polygon_utm = polygon_utm.simplify(simplify_m, preserve_topology=False)
+    border_utm = polygon_utm.difference(polygon_utm.buffer(-BORDER_WIDTH_M))
+    border = _projected(border_utm, projection, inverse=True)
+    if border.geom_type not in ("Polygon", "MultiPolygon") or not border.is_valid:
+        # Degenerate slivers or rounding in the back-projection.
+        border = polygonal_shape(mapping(border), {})
+    return border
+
+def has_border_band(geometry: Geometry, properties: DatasetProperties) -> bool:
+    return geometry['type'] in POLYGONAL_TYPES and properties['type'] not in [EAirSpaceType.other, EAirSpaceType.adiz]
+
+def has_border_band_2x(geometry: Geometry, properties: DatasetProperties) -> bool:
+    return geometry['type'] in POLYGONAL_TYPES and properties['type'] in [EAirSpaceType.other, EAirSpaceType.adiz]
+
+def _band_geometry(geometry: Geometry, properties: DatasetProperties, simplify_m: float = 0) -> Optional[Geometry]:
+    polygon = polygonal_shape(geometry, properties)
+    if polygon is None:
+        return None
+    band = border_band(polygon, simplify_m)
+    return None if band is None or band.is_empty else mapping(band)
+
+def get_airspace_borders_geometry(geometry: Geometry, properties: DatasetProperties) -> Optional[Geometry]:
+    if has_border_band(geometry, properties):
+        return _band_geometry(geometry, properties)
 
     return None
 
+def get_airspace_borders2x_geometry(geometry: Geometry, properties: DatasetProperties) -> Optional[Geometry]:
+    if has_border_band_2x(geometry, properties):
+        return _band_geometry(geometry, properties)
+
+    return None
+
+def get_airspace_border_fallback_geometry(geometry: Geometry, properties: DatasetProperties) -> Optional[Geometry]:
+    """Cheaper approximate border band used when the exact one is over budget:
+    the same band around a simplified polygon."""
+    return _band_geometry(geometry, properties, FALLBACK_SIMPLIFY_M)
+
 def get_airspace_border_properties(properties: DatasetProperties) -> DatasetProperties:
     """Return airspace-specific metadata for PMTiles ingestion."""
     result: DatasetProperties = {}
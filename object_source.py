@@ -0,0 +1,269 @@
+"""Where the pipeline reads ``<country>_<code>.geojson`` objects from.
+
+Two backends share one small interface (``list_objects``, ``read_text``,
+``download``):
+
+- ``BucketSource`` talks to the GCS JSON API at ``base_url``. By default that
+  is the requester-pays OpenAIP bucket (authenticated session, ``userProject``
+  on every request). Pointed at any other URL via ``GCS_BASE_URL`` it uses a
+  plain session, e.g. for the local stand-in below.
+- ``DirectorySource`` serves the files of a local directory directly
+  (``OPENAIP_SOURCE_DIR``), with the same listing fields and pagination.
+
+``python object_source.py serve DIR`` starts an HTTP stand-in that answers the
+JSON API calls the pipeline makes (listing with ``prefix``/``pageToken``/
+``maxResults`` and ``alt=media`` downloads) from DIR, so the whole pipeline
+and its benchmarks run offline, free and reproducibly:
+
+    python object_source.py serve ./fixtures --port 8080 &
+    GCS_BASE_URL=http://127.0.0.1:8080/storage/v1/b/local/o python main.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import datetime
+import hashlib
+import json
+import pathlib
+import shutil
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Callable, Protocol
+
+if TYPE_CHECKING:
+    import requests
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_PAGE_SIZE = 1000
+
+
+class ObjectSource(Protocol):
+    def list_objects(self, prefix: str = "", fields: str | None = None) -> list[dict[str, Any]]:
+        """Return the listing items of every object whose name starts with
+        ``prefix`` (all pages)."""
+
+    def read_text(self, name: str) -> str | None:
+        """Return the object's content, or ``None`` if it does not exist."""
+
+    def download(self, name: str, path: pathlib.Path) -> str | None:
+        """Stream the object to ``path``; return its base64 MD5 (the format of
+        the GCS ``md5Hash`` field), or ``None`` if it does not exist."""
+
+
+def _raise_for_status(response: requests.Response, action: str) -> None:
+    if not response.ok:
+        # Include the GCS error body so the exact reason (billing vs. IAM
+        # permission) is visible in the logs.
+        raise RuntimeError(
+            f"GCS {action} failed with HTTP {response.status_code}: {response.text}"
+        )
+
+
+class BucketSource:
+    """GCS JSON API backend (the real bucket or an HTTP stand-in).
+
+    Every request is counted in ``gcs_transport.stats`` (payload bytes and
+    time from sending the request to the last byte read).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        session_factory: Callable[[], requests.Session],
+        user_project: str = "",
+    ) -> None:
+        # Imported here: a DirectorySource run needs no HTTP stack at all.
+        from gcs_transport import stats
+
+        self.base_url = base_url.rstrip("/")
+        self._stats = stats
+        self._session_factory = session_factory
+        self._params = {"userProject": user_project} if user_project else {}
+
+    def list_objects(self, prefix: str = "", fields: str | None = None) -> list[dict[str, Any]]:
+        session = self._session_factory()
+        items: list[dict[str, Any]] = []
+        page_token = None
+        while True:
+            params = {**self._params, "prefix": prefix}
+            if fields:
+                params["fields"] = fields
+            if page_token:
+                params["pageToken"] = page_token
+            started = time.perf_counter()
+            response = session.get(self.base_url, params=params)
+            _raise_for_status(response, "list")
+            self._stats.observe(len(response.content), time.perf_counter() - started)
+            payload = response.json()
+            items.extend(payload.get("items", []))
+            page_token = payload.get("nextPageToken")
+            if not page_token:
+                return items
+
+    def _media(self, name: str, stream: bool) -> requests.Response:
+        return self._session_factory().get(
+            f"{self.base_url}/{urllib.parse.quote(name, safe='')}",
+            params={**self._params, "alt": "media"},
+            stream=stream,
+        )
+
+    def read_text(self, name: str) -> str | None:
+        started = time.perf_counter()
+        with self._media(name, stream=False) as response:
+            if response.status_code == 404:
+                return None
+            _raise_for_status(response, "download")
+            self._stats.observe(len(response.content), time.perf_counter() - started)
+            return response.text
+
+    def download(self, name: str, path: pathlib.Path) -> str | None:
+        started = time.perf_counter()
+        size = 0
+        with self._media(name, stream=True) as response:
+            if response.status_code == 404:
+                return None
+            _raise_for_status(response, "download")
+            md5 = hashlib.md5()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    md5.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        self._stats.observe(size, time.perf_counter() - started)
+        return base64.b64encode(md5.digest()).decode("ascii")
+
+
+def _file_md5(path: pathlib.Path) -> str:
+    md5 = hashlib.md5()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode("ascii")
+
+
+class DirectorySource:
+    """Filesystem backend: object ``name`` is the file ``root / name``."""
+
+    def __init__(self, root: pathlib.Path) -> None:
+        self.root = root
+        if not root.is_dir():
+            raise RuntimeError(f"object source directory {root} does not exist")
+
+    def _item(self, path: pathlib.Path) -> dict[str, Any]:
+        stat = path.stat()
+        updated = datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)
+        return {
+            "name": path.name,
+            "size": str(stat.st_size),
+            "generation": str(stat.st_mtime_ns),
+            "md5Hash": _file_md5(path),
+            "updated": updated.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        }
+
+    def list_page(self, prefix: str, page_token: str | None, max_results: int) -> dict[str, Any]:
+        """One page of a GCS-style listing; the token is the last name returned."""
+
+        names = sorted(
+            path.name
+            for path in self.root.iterdir()
+            if path.is_file() and path.name.startswith(prefix) and (page_token is None or path.name > page_token)
+        )
+        page = names[:max_results]
+        payload: dict[str, Any] = {"kind": "storage#objects", "items": [self._item(self.root / name) for name in page]}
+        if len(names) > max_results:
+            payload["nextPageToken"] = page[-1]
+        return payload
+
+    def list_objects(self, prefix: str = "", fields: str | None = None) -> list[dict[str, Any]]:
+        items: list[dict[str, Any]] = []
+        page_token = None
+        while True:
+            payload = self.list_page(prefix, page_token, DEFAULT_PAGE_SIZE)
+            items.extend(payload["items"])
+            page_token = payload.get("nextPageToken")
+            if not page_token:
+                return items
+
+    def path(self, name: str) -> pathlib.Path | None:
+        path = self.root / name
+        # Object names never contain a path separator; refuse anything else.
+        if path.parent != self.root or not path.is_file():
+            return None
+        return path
+
+    def read_text(self, name: str) -> str | None:
+        path = self.path(name)
+        return None if path is None else path.read_text(encoding="utf-8")
+
+    def download(self, name: str, path: pathlib.Path) -> str | None:
+        source = self.path(name)
+        if source is None:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, path)
+        return _file_md5(path)
+
+
+# --- HTTP stand-in -----------------------------------------------------------
+
+
+def make_handler(source: DirectorySource) -> type[BaseHTTPRequestHandler]:
+    class GcsJsonApiHandler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, message: str) -> None:
+            self._send(status, json.dumps({"error": {"code": status, "message": message}}).encode("utf-8"))
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server naming
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            parts = url.path.split("/")
+            # /storage/v1/b/<bucket>/o[/<object>]
+            if len(parts) < 6 or parts[1:4] != ["storage", "v1", "b"] or parts[5] != "o":
+                self._error(404, "Not Found")
+                return
+            if len(parts) == 6 or parts[6] == "":
+                max_results = int(query.get("maxResults", DEFAULT_PAGE_SIZE))
+                payload = source.list_page(query.get("prefix", ""), query.get("pageToken"), max_results)
+                self._send(200, json.dumps(payload).encode("utf-8"))
+                return
+            name = urllib.parse.unquote("/".join(parts[6:]))
+            path = source.path(name)
+            if path is None:
+                self._error(404, f"No such object: {name}")
+                return
+            if query.get("alt") == "media":
+                self._send(200, path.read_bytes(), "application/octet-stream")
+            else:
+                self._send(200, json.dumps(source._item(path)).encode("utf-8"))
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return GcsJsonApiHandler
+
+
+def serve(root: pathlib.Path, host: str, port: int) -> None:
+    server = ThreadingHTTPServer((host, port), make_handler(DirectorySource(root)))
+    print(f"serving {root} as http://{host}:{server.server_port}/storage/v1/b/local/o")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local GCS JSON API stand-in for offline runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="serve DIR like a GCS bucket")
+    serve_parser.add_argument("directory", type=pathlib.Path)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    serve(args.directory, args.host, args.port)
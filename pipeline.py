@@ -0,0 +1,344 @@
+"""Staged producer/consumer pipeline with bounded queues.
+
+Stages are pools of worker threads connected by bounded ``Channel`` queues.
+A worker blocks when its output queue is full, so a slow stage throttles the
+stages before it (backpressure) instead of letting work pile up in memory.
+A stage function may hand CPU-heavy work to a process pool; its threads then
+only wait for the result.
+
+Every stage records how long its workers were busy, idle (waiting for input)
+and blocked (waiting for room downstream), and a sampler records the depth of
+every queue. The stage with the highest utilisation is the bottleneck: adding
+workers anywhere else does not make the run faster.
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+import queue
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+POLL_INTERVAL = 0.1
+SAMPLE_INTERVAL = 0.25
+
+_CLOSED = object()
+
+StageFunction = Callable[[Any], Iterable[Tuple["Channel", Any]]]
+
+
+class _Aborted(Exception):
+    pass
+
+
+class Channel:
+    """Bounded queue between stages; closed once all its producers finish."""
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.producers = 0
+        self.consumers = 0
+        self._lock = threading.Lock()
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._depth_max = 0
+
+    def sample(self) -> None:
+        depth = self.queue.qsize()
+        self._depth_total += depth
+        self._depth_samples += 1
+        self._depth_max = max(self._depth_max, depth)
+
+    def producer_done(self) -> bool:
+        """Return True when the last producer finished."""
+
+        with self._lock:
+            self.producers -= 1
+            return self.producers == 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.maxsize,
+            "mean_depth": round(self._depth_total / self._depth_samples, 2) if self._depth_samples else 0,
+            "max_depth": self._depth_max,
+        }
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float = 0.0, idle: float = 0.0, blocked: float = 0.0, items: int = 0) -> None:
+        with self._lock:
+            self.busy += busy
+            self.idle += idle
+            self.blocked += blocked
+            self.items += items
+
+    @property
+    def utilization(self) -> float:
+        total = self.busy + self.idle + self.blocked
+        return self.busy / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "idle_seconds": round(self.idle, 3),
+            "blocked_seconds": round(self.blocked, 3),
+            "utilization": round(self.utilization, 3),
+        }
+
+
+class _Spilled:
+    """Placeholder for a buffered value that was moved to a file."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+
+
+class OrderedBuffer:
+    """Release values in a fixed key order, whatever order they arrive in.
+
+    With ``max_bytes``, string values that would push the buffered size
+    (counted in characters, which is bytes for ASCII GeoJSON) past it are
+    written to a temporary file in ``spill_dir`` and read back when
+    their turn comes, so one slow early key cannot make the later ones pile
+    up in memory. Spilling never blocks the producer, so it cannot deadlock
+    a pipeline whose early key is still in flight.
+    """
+
+    def __init__(
+        self,
+        order: Iterable[Hashable],
+        max_bytes: int = 0,
+        spill_dir: Optional[pathlib.Path] = None,
+    ) -> None:
+        self._order = list(order)
+        self._next = 0
+        self._pending: Dict[Hashable, Any] = {}
+        self._sizes: Dict[Hashable, int] = {}
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.buffered_bytes = 0
+        self.max_buffered_bytes = 0
+        self.spilled = 0
+        self.spilled_bytes = 0
+
+    def push(self, key: Hashable, value: Any) -> List[Any]:
+        """Buffer ``value`` and return the values that are now due, in order."""
+
+        if self._next < len(self._order) and key == self._order[self._next]:
+            # Due at once: never buffered.
+            self._pending[key] = value
+        elif isinstance(value, str) and self.max_bytes:
+            size = len(value)
+            if self.buffered_bytes + size > self.max_bytes:
+                self._pending[key] = self._spill(value)
+            else:
+                self._pending[key] = value
+                self._sizes[key] = size
+                self.buffered_bytes += size
+                self.max_buffered_bytes = max(self.max_buffered_bytes, self.buffered_bytes)
+        else:
+            self._pending[key] = value
+        ready = []
+        while self._next < len(self._order) and self._order[self._next] in self._pending:
+            ready.append(self._release(self._order[self._next]))
+            self._next += 1
+        return ready
+
+    def _spill(self, value: str) -> _Spilled:
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        handle, name = tempfile.mkstemp(suffix=".spill", dir=self.spill_dir)
+        with os.fdopen(handle, "w", encoding="utf-8") as file:
+            file.write(value)
+        self.spilled += 1
+        self.spilled_bytes += len(value)
+        return _Spilled(pathlib.Path(name))
+
+    def _release(self, key: Hashable) -> Any:
+        value = self._pending.pop(key)
+        self.buffered_bytes -= self._sizes.pop(key, 0)
+        if isinstance(value, _Spilled):
+            try:
+                return value.path.read_text(encoding="utf-8")
+            finally:
+                value.path.unlink()
+        return value
+
+    def discard(self) -> None:
+        """Drop whatever is still buffered and remove its spill files."""
+
+        for value in self._pending.values():
+            if isinstance(value, _Spilled):
+                value.path.unlink(missing_ok=True)
+        self._pending.clear()
+        self._sizes.clear()
+        self.buffered_bytes = 0
+
+    @property
+    def complete(self) -> bool:
+        return self._next == len(self._order)
+
+
+class Pipeline:
+    def __init__(self) -> None:
+        self.channels: List[Channel] = []
+        self.stages: Dict[str, StageStats] = {}
+        self._threads: List[threading.Thread] = []
+        self._abort = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def channel(self, name: str, maxsize: int) -> Channel:
+        channel = Channel(name, maxsize)
+        self.channels.append(channel)
+        return channel
+
+    def source(self, name: str, items: Iterable[Any], output: Channel) -> None:
+        """Feed ``items`` into ``output`` from a thread of its own."""
+
+        stats = StageStats(name, 1)
+        self.stages[name] = stats
+        output.producers += 1
+        self._threads.append(threading.Thread(target=self._feed, args=(stats, items, output), name=name, daemon=True))
+
+    def stage(
+        self,
+        name: str,
+        func: StageFunction,
+        inbox: Channel,
+        outputs: Iterable[Channel] = (),
+        workers: int = 1,
+    ) -> None:
+        """Run ``func`` on every item of ``inbox`` in ``workers`` threads.
+
+        ``func`` returns the ``(channel, value)`` pairs to pass downstream.
+        """
+
+        stats = StageStats(name, workers)
+        self.stages[name] = stats
+        outputs = list(outputs)
+        inbox.consumers += workers
+        for channel in outputs:
+            channel.producers += workers
+        for index in range(workers):
+            self._threads.append(
+                threading.Thread(
+                    target=self._work, args=(stats, func, inbox, outputs), name=f"{name}-{index}", daemon=True
+                )
+            )
+
+    def run(self) -> None:
+        sampler_done = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(sampler_done,), name="queue-sampler", daemon=True)
+        sampler.start()
+        for thread in self._threads:
+            thread.start()
+        for thread in self._threads:
+            thread.join()
+        sampler_done.set()
+        sampler.join()
+        if self._error is not None:
+            raise self._error
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "stages": {name: stats.as_dict() for name, stats in self.stages.items()},
+            "queues": {channel.name: channel.as_dict() for channel in self.channels},
+        }
+
+    def print_summary(self) -> None:
+        for name, stats in self.stages.items():
+            print(
+                f"pipeline {name}: {stats.items} items, {stats.workers} workers, "
+                f"busy {stats.busy:.1f}s, idle {stats.idle:.1f}s, blocked {stats.blocked:.1f}s"
+            )
+        workers = [stats for stats in self.stages.values() if stats.items]
+        if workers:
+            bottleneck = max(workers, key=lambda stats: stats.utilization)
+            print(f"pipeline bottleneck: {bottleneck.name} ({bottleneck.utilization:.0%} busy)")
+
+    # --- workers -------------------------------------------------------------
+
+    def _sample(self, done: threading.Event) -> None:
+        while not done.wait(SAMPLE_INTERVAL):
+            for channel in self.channels:
+                channel.sample()
+
+    def _put(self, channel: Channel, value: Any, stats: StageStats) -> None:
+        started = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted()
+            try:
+                channel.queue.put(value, timeout=POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        stats.add(blocked=time.perf_counter() - started)
+
+    def _get(self, channel: Channel, stats: StageStats) -> Any:
+        started = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted()
+            try:
+                value = channel.queue.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                continue
+        stats.add(idle=time.perf_counter() - started)
+        return value
+
+    def _close(self, channel: Channel, stats: StageStats) -> None:
+        if channel.producer_done():
+            for _ in range(channel.consumers):
+                self._put(channel, _CLOSED, stats)
+
+    def _fail(self, exc: BaseException) -> None:
+        if self._error is None:
+            self._error = exc
+        self._abort.set()
+
+    def _feed(self, stats: StageStats, items: Iterable[Any], output: Channel) -> None:
+        try:
+            for item in items:
+                self._put(output, item, stats)
+                stats.add(items=1)
+            self._close(output, stats)
+        except _Aborted:
+            pass
+        except BaseException as exc:
+            self._fail(exc)
+
+    def _work(self, stats: StageStats, func: StageFunction, inbox: Channel, outputs: List[Channel]) -> None:
+        try:
+            while True:
+                item = self._get(inbox, stats)
+                if item is _CLOSED:
+                    break
+                started = time.perf_counter()
+                results = list(func(item))
+                stats.add(busy=time.perf_counter() - started, items=1)
+                for channel, value in results:
+                    self._put(channel, value, stats)
+            for channel in outputs:
+                self._close(channel, stats)
+        except _Aborted:
+            pass
+        except BaseException as exc:
+            self._fail(exc)
@@ -0,0 +1,536 @@
+"""Minimal PMTiles v3 reader/writer.
+
+Only the parts of the spec the pipeline needs are implemented: the fixed
+127-byte header, varint-encoded directories (root + one level of leaves),
+gzip or uncompressed internal compression and content de-duplication on
+write. Tile payloads are passed through untouched, so archives produced by
+tippecanoe can be sliced, diffed and re-assembled without decoding any MVT.
+
+Like the ``.env`` parser in ``main.py`` this is intentionally tiny so the
+project needs no extra dependency just to move tiles between archives.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import math
+import mmap
+import pathlib
+import shutil
+import struct
+import tempfile
+from dataclasses import dataclass, replace
+from typing import Iterable, Iterator, NamedTuple
+
+HEADER_SIZE = 127
+MAGIC = b"PMTiles"
+SPEC_VERSION = 3
+# The header plus the root directory must fit into the first 16 KiB so a
+# client can fetch both with a single range request.
+ROOT_DIRECTORY_BUDGET = 16384 - HEADER_SIZE
+
+COMPRESSION_UNKNOWN = 0
+COMPRESSION_NONE = 1
+COMPRESSION_GZIP = 2
+
+TILE_TYPE_MVT = 1
+
+_HEADER_STRUCT = struct.Struct("<7sB11QBBBBBBiiiiBii")
+
+
+class Entry(NamedTuple):
+    """One directory entry. ``run_length == 0`` marks a leaf directory."""
+
+    tile_id: int
+    offset: int
+    length: int
+    run_length: int
+
+
+@dataclass(frozen=True)
+class PMTilesHeader:
+    root_offset: int = 0
+    root_length: int = 0
+    metadata_offset: int = 0
+    metadata_length: int = 0
+    leaf_directory_offset: int = 0
+    leaf_directory_length: int = 0
+    tile_data_offset: int = 0
+    tile_data_length: int = 0
+    addressed_tiles_count: int = 0
+    tile_entries_count: int = 0
+    tile_contents_count: int = 0
+    clustered: bool = True
+    internal_compression: int = COMPRESSION_GZIP
+    tile_compression: int = COMPRESSION_GZIP
+    tile_type: int = TILE_TYPE_MVT
+    min_zoom: int = 0
+    max_zoom: int = 14
+    min_lon_e7: int = -1800000000
+    min_lat_e7: int = -850511287
+    max_lon_e7: int = 1800000000
+    max_lat_e7: int = 850511287
+    center_zoom: int = 0
+    center_lon_e7: int = 0
+    center_lat_e7: int = 0
+
+    def serialize(self) -> bytes:
+        return _HEADER_STRUCT.pack(
+            MAGIC,
+            SPEC_VERSION,
+            self.root_offset,
+            self.root_length,
+            self.metadata_offset,
+            self.metadata_length,
+            self.leaf_directory_offset,
+            self.leaf_directory_length,
+            self.tile_data_offset,
+            self.tile_data_length,
+            self.addressed_tiles_count,
+            self.tile_entries_count,
+            self.tile_contents_count,
+            int(self.clustered),
+            self.internal_compression,
+            self.tile_compression,
+            self.tile_type,
+            self.min_zoom,
+            self.max_zoom,
+            self.min_lon_e7,
+            self.min_lat_e7,
+            self.max_lon_e7,
+            self.max_lat_e7,
+            self.center_zoom,
+            self.center_lon_e7,
+            self.center_lat_e7,
+        )
+
+    @classmethod
+    def deserialize(cls, data: bytes) -> "PMTilesHeader":
+        if len(data) < HEADER_SIZE:
+            raise RuntimeError("PMTiles header is truncated")
+        magic, version, *fields = _HEADER_STRUCT.unpack_from(data)
+        if magic != MAGIC:
+            raise RuntimeError("not a PMTiles archive")
+        if version != SPEC_VERSION:
+            raise RuntimeError(f"unsupported PMTiles version {version}")
+        fields[11] = bool(fields[11])
+        return cls(*fields)
+
+
+# --- Tile ids ---------------------------------------------------------------
+
+
+def _rotate(n: int, x: int, y: int, rx: int, ry: int) -> tuple[int, int]:
+    if ry == 0:
+        if rx == 1:
+            x = n - 1 - x
+            y = n - 1 - y
+        x, y = y, x
+    return x, y
+
+
+def zxy_to_tileid(z: int, x: int, y: int) -> int:
+    """Return the PMTiles tile id (Hilbert order inside each zoom level)."""
+
+    n = 1 << z
+    if x < 0 or y < 0 or x >= n or y >= n:
+        raise ValueError(f"tile {z}/{x}/{y} is outside the zoom level")
+    acc = ((1 << (2 * z)) - 1) // 3
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        x, y = _rotate(n, x, y, rx, ry)
+        s >>= 1
+    return acc + d
+
+
+def tileid_to_zxy(tile_id: int) -> tuple[int, int, int]:
+    z = 0
+    acc = 0
+    while True:
+        count = 1 << (2 * z)
+        if tile_id < acc + count:
+            break
+        acc += count
+        z += 1
+    t = tile_id - acc
+    n = 1 << z
+    x = y = 0
+    s = 1
+    while s < n:
+        rx = 1 & (t // 2)
+        ry = 1 & (t ^ rx)
+        x, y = _rotate(s, x, y, rx, ry)
+        x += s * rx
+        y += s * ry
+        t //= 4
+        s <<= 1
+    return z, x, y
+
+
+# --- Directories ------------------------------------------------------------
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def compress(data: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_NONE:
+        return data
+    if compression == COMPRESSION_GZIP:
+        return gzip.compress(data, mtime=0)
+    raise RuntimeError(f"unsupported PMTiles compression {compression}")
+
+
+def decompress(data: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_NONE:
+        return data
+    if compression == COMPRESSION_GZIP:
+        return gzip.decompress(data)
+    raise RuntimeError(f"unsupported PMTiles compression {compression}")
+
+
+def serialize_directory(entries: list[Entry], compression: int) -> bytes:
+    out = bytearray()
+    _write_varint(out, len(entries))
+    last_id = 0
+    for entry in entries:
+        _write_varint(out, entry.tile_id - last_id)
+        last_id = entry.tile_id
+    for entry in entries:
+        _write_varint(out, entry.run_length)
+    for entry in entries:
+        _write_varint(out, entry.length)
+    for index, entry in enumerate(entries):
+        previous = entries[index - 1] if index else None
+        if previous is not None and entry.offset == previous.offset + previous.length:
+            _write_varint(out, 0)
+        else:
+            _write_varint(out, entry.offset + 1)
+    return compress(bytes(out), compression)
+
+
+def deserialize_directory(data: bytes, compression: int) -> list[Entry]:
+    raw = decompress(data, compression)
+    count, pos = _read_varint(raw, 0)
+    tile_ids: list[int] = []
+    last_id = 0
+    for _ in range(count):
+        delta, pos = _read_varint(raw, pos)
+        last_id += delta
+        tile_ids.append(last_id)
+    run_lengths: list[int] = []
+    for _ in range(count):
+        value, pos = _read_varint(raw, pos)
+        run_lengths.append(value)
+    lengths: list[int] = []
+    for _ in range(count):
+        value, pos = _read_varint(raw, pos)
+        lengths.append(value)
+    entries: list[Entry] = []
+    for index in range(count):
+        value, pos = _read_varint(raw, pos)
+        if value == 0 and index > 0:
+            offset = entries[-1].offset + entries[-1].length
+        else:
+            offset = value - 1
+        entries.append(Entry(tile_ids[index], offset, lengths[index], run_lengths[index]))
+    return entries
+
+
+def build_directories(entries: list[Entry], compression: int) -> tuple[bytes, bytes]:
+    """Return ``(root, leaves)`` with the root small enough for the header
+    budget, splitting ``entries`` into leaf directories when necessary."""
+
+    root = serialize_directory(entries, compression)
+    if len(root) <= ROOT_DIRECTORY_BUDGET:
+        return root, b""
+    leaf_size = 4096
+    while True:
+        root_entries: list[Entry] = []
+        leaves = bytearray()
+        for start in range(0, len(entries), leaf_size):
+            chunk = entries[start:start + leaf_size]
+            leaf = serialize_directory(chunk, compression)
+            root_entries.append(Entry(chunk[0].tile_id, len(leaves), len(leaf), 0))
+            leaves += leaf
+        root = serialize_directory(root_entries, compression)
+        if len(root) <= ROOT_DIRECTORY_BUDGET:
+            return root, bytes(leaves)
+        leaf_size *= 2
+
+
+# --- Reading ----------------------------------------------------------------
+
+
+class PMTilesReader:
+    """Read-only, mmap-backed view of a PMTiles archive.
+
+    Use as a context manager; tile payloads returned by :meth:`tile_data` are
+    zero-copy ``memoryview`` slices and are only valid while it is open.
+    """
+
+    def __init__(self, path: pathlib.Path | str) -> None:
+        self.path = pathlib.Path(path)
+        self._file = self.path.open("rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self.header = PMTilesHeader.deserialize(self._mmap[:HEADER_SIZE])
+
+    def __enter__(self) -> "PMTilesReader":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def metadata(self) -> dict:
+        header = self.header
+        if not header.metadata_length:
+            return {}
+        raw = self._mmap[header.metadata_offset:header.metadata_offset + header.metadata_length]
+        return json.loads(decompress(raw, header.internal_compression))
+
+    def root_entries(self) -> list[Entry]:
+        header = self.header
+        raw = self._mmap[header.root_offset:header.root_offset + header.root_length]
+        return deserialize_directory(raw, header.internal_compression)
+
+    def leaf_entries(self, leaf: Entry) -> list[Entry]:
+        start = self.header.leaf_directory_offset + leaf.offset
+        raw = self._mmap[start:start + leaf.length]
+        return deserialize_directory(raw, self.header.internal_compression)
+
+    def entries(self) -> Iterator[Entry]:
+        """Yield every tile entry in tile id order, resolving leaf directories."""
+
+        def walk(directory: list[Entry]) -> Iterator[Entry]:
+            for entry in directory:
+                if entry.run_length == 0:
+                    yield from walk(self.leaf_entries(entry))
+                else:
+                    yield entry
+
+        yield from walk(self.root_entries())
+
+    def tiles(self) -> Iterator[tuple[int, Entry]]:
+        """Yield ``(tile_id, entry)`` for every addressed tile, expanding runs."""
+
+        for entry in self.entries():
+            for tile_id in range(entry.tile_id, entry.tile_id + entry.run_length):
+                yield tile_id, entry
+
+    def tile_data(self, entry: Entry) -> memoryview:
+        start = self.header.tile_data_offset + entry.offset
+        return self._view[start:start + entry.length]
+
+    def find(self, tile_id: int) -> Entry | None:
+        return self.find_path(tile_id)[1]
+
+    def find_path(self, tile_id: int, root: list[Entry] | None = None) -> tuple[list[Entry], Entry | None]:
+        """Return the leaf directories walked to reach ``tile_id`` and its
+        entry (None if the tile is not addressed). Pass ``root`` to reuse an
+        already decoded root directory."""
+
+        directory = self.root_entries() if root is None else root
+        leaves: list[Entry] = []
+        for _ in range(4):
+            entry = _find_entry(directory, tile_id)
+            if entry is None:
+                return leaves, None
+            if entry.run_length:
+                return leaves, entry
+            leaves.append(entry)
+            directory = self.leaf_entries(entry)
+        return leaves, None
+
+    def get_tile(self, z: int, x: int, y: int) -> bytes | None:
+        entry = self.find(zxy_to_tileid(z, x, y))
+        return None if entry is None else bytes(self.tile_data(entry))
+
+
+def _find_entry(directory: list[Entry], tile_id: int) -> Entry | None:
+    low, high = 0, len(directory) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = directory[middle].tile_id
+        if tile_id > candidate:
+            low = middle + 1
+        elif tile_id < candidate:
+            high = middle - 1
+        else:
+            return directory[middle]
+    if high >= 0:
+        entry = directory[high]
+        if entry.run_length == 0 or tile_id - entry.tile_id < entry.run_length:
+            return entry
+    return None
+
+
+# --- Writing ----------------------------------------------------------------
+
+
+class PMTilesWriter:
+    """Write a clustered PMTiles archive from tiles added in tile id order.
+
+    Identical payloads are stored once: pass ``key`` (e.g. the source offset
+    when copying out of another archive) to skip hashing, otherwise a digest
+    of the payload is used. Consecutive tiles sharing a payload collapse into
+    one run-length entry.
+    """
+
+    def __init__(self, path: pathlib.Path | str) -> None:
+        self.path = pathlib.Path(path)
+        self._data = tempfile.TemporaryFile()
+        self._data_length = 0
+        self._offsets: dict[object, tuple[int, int]] = {}
+        self._entries: list[Entry] = []
+        self._addressed = 0
+        self._last_tile_id = -1
+
+    def __enter__(self) -> "PMTilesWriter":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._data.close()
+
+    def add_tile(self, tile_id: int, data: bytes | memoryview, key: object = None) -> None:
+        if tile_id <= self._last_tile_id:
+            raise ValueError("tiles must be added in increasing tile id order")
+        self._last_tile_id = tile_id
+        if key is None:
+            key = hashlib.blake2b(data, digest_size=16).digest()
+        location = self._offsets.get(key)
+        if location is None:
+            location = (self._data_length, len(data))
+            self._data.write(data)
+            self._data_length += len(data)
+            self._offsets[key] = location
+        self._addressed += 1
+        offset, length = location
+        last = self._entries[-1] if self._entries else None
+        if (
+            last is not None
+            and last.offset == offset
+            and last.tile_id + last.run_length == tile_id
+        ):
+            self._entries[-1] = last._replace(run_length=last.run_length + 1)
+        else:
+            self._entries.append(Entry(tile_id, offset, length, 1))
+
+    @property
+    def addressed_tiles(self) -> int:
+        return self._addressed
+
+    def finalize(self, header: PMTilesHeader, metadata: dict) -> None:
+        """Write the archive. Offsets/counts in ``header`` are recomputed; the
+        zoom range is narrowed to the tiles actually written."""
+
+        compression = header.internal_compression or COMPRESSION_GZIP
+        root, leaves = build_directories(self._entries, compression)
+        metadata_bytes = compress(json.dumps(metadata).encode("utf-8"), compression)
+        if self._entries:
+            zooms = (tileid_to_zxy(self._entries[0].tile_id)[0], tileid_to_zxy(self._last_tile_id)[0])
+        else:
+            zooms = (header.min_zoom, header.max_zoom)
+        root_offset = HEADER_SIZE
+        metadata_offset = root_offset + len(root)
+        leaf_offset = metadata_offset + len(metadata_bytes)
+        tile_data_offset = leaf_offset + len(leaves)
+        final = replace(
+            header,
+            root_offset=root_offset,
+            root_length=len(root),
+            metadata_offset=metadata_offset,
+            metadata_length=len(metadata_bytes),
+            leaf_directory_offset=leaf_offset,
+            leaf_directory_length=len(leaves),
+            tile_data_offset=tile_data_offset,
+            tile_data_length=self._data_length,
+            addressed_tiles_count=self._addressed,
+            tile_entries_count=len(self._entries),
+            tile_contents_count=len(self._offsets),
+            clustered=True,
+            internal_compression=compression,
+            min_zoom=zooms[0],
+            max_zoom=zooms[1],
+            center_zoom=min(max(header.center_zoom, zooms[0]), zooms[1]),
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("wb") as out:
+            out.write(final.serialize())
+            out.write(root)
+            out.write(metadata_bytes)
+            out.write(leaves)
+            self._data.seek(0)
+            shutil.copyfileobj(self._data, out, 1024 * 1024)
+
+
+def write_archive(
+    path: pathlib.Path | str,
+    header: PMTilesHeader,
+    metadata: dict,
+    tiles: Iterable[tuple[int, bytes | memoryview]],
+) -> int:
+    """Write ``(tile_id, payload)`` pairs (sorted by tile id) to ``path`` and
+    return the number of addressed tiles."""
+
+    with PMTilesWriter(path) as writer:
+        for tile_id, data in tiles:
+            writer.add_tile(tile_id, data)
+        writer.finalize(header, metadata)
+        return writer.addressed_tiles
+
+
+# --- Web Mercator helpers ---------------------------------------------------
+
+
+def lon_to_tile_x(lon: float, z: int) -> int:
+    n = 1 << z
+    return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+
+def lat_to_tile_y(lat: float, z: int) -> int:
+    n = 1 << z
+    lat = min(85.0511287, max(-85.0511287, lat))
+    rad = math.radians(lat)
+    y = (1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * n
+    return min(n - 1, max(0, int(y)))
+
+
+def bbox_tile_range(bbox: list[float], z: int) -> tuple[int, int, int, int]:
+    """Return ``(min_x, min_y, max_x, max_y)`` of the tiles covering a
+    ``[min_lon, min_lat, max_lon, max_lat]`` bbox at zoom ``z``."""
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return (
+        lon_to_tile_x(min_lon, z),
+        lat_to_tile_y(max_lat, z),
+        lon_to_tile_x(max_lon, z),
+        lat_to_tile_y(min_lat, z),
+    )
@@ -0,0 +1,149 @@
+"""Find the features and functions that make a run slow.
+
+- ``PROFILE=cprofile`` (or ``PROFILE=pyinstrument`` when that optional package
+  is installed) profiles the mapping of every downloaded file into
+  ``tmp/profiles/<country>_<code>.prof`` (``.html`` for pyinstrument).
+  ``python profiling.py hot`` merges the cProfile files and prints the hottest
+  functions.
+- Every feature's mapping is timed. Features slower than ``SLOW_FEATURE_MS``
+  (default 500) are logged with country, layer, ``_id``, name and vertex
+  count, and ``tmp/slow_features.json`` gets a ``suggested`` entry in the
+  format of ``countries.slow_features``, so the exclusion list no longer has
+  to be curated by guesswork.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import cProfile
+import json
+import os
+import pathlib
+import pstats
+from typing import Any, Dict, Iterable, Iterator, List
+
+PROFILER = os.environ.get("PROFILE", "").lower()
+PROFILE_DIR = pathlib.Path("tmp/profiles")
+SLOW_FEATURE_MS = float(os.environ.get("SLOW_FEATURE_MS", "500"))
+SLOW_FEATURES_PATH = pathlib.Path("tmp/slow_features.json")
+
+SlowFeature = Dict[str, Any]
+
+
+@contextlib.contextmanager
+def profiled(name: str) -> Iterator[None]:
+    """Profile the block into ``PROFILE_DIR/<name>`` when ``PROFILE`` is set."""
+
+    if not PROFILER:
+        yield
+        return
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    if PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:  # optional dependency
+            Profiler = None
+        if Profiler is not None:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                (PROFILE_DIR / f"{name}.html").write_text(profiler.output_html(), encoding="utf-8")
+            return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(str(PROFILE_DIR / f"{name}.prof"))
+
+
+def count_vertices(geometry: Dict[str, Any]) -> int:
+    if geometry.get("type") == "GeometryCollection":
+        return sum(count_vertices(part) for part in geometry.get("geometries") or [])
+    count = 0
+    stack = [geometry.get("coordinates")]
+    while stack:
+        coordinates = stack.pop()
+        if not coordinates:
+            continue
+        if isinstance(coordinates[0], (int, float)):
+            count += 1
+        else:
+            stack.extend(coordinates)
+    return count
+
+
+def slow_feature(country: str, file_code: str, layer: str, feature: Dict[str, Any], seconds: float) -> SlowFeature:
+    properties = feature.get("properties") or {}
+    return {
+        "country": country,
+        "file_code": file_code,
+        "layer": layer,
+        "_id": properties.get("_id"),
+        "name": properties.get("name"),
+        "vertices": count_vertices(feature.get("geometry") or {}),
+        "ms": round(seconds * 1000, 1),
+    }
+
+
+def suggest_slow_features(records: Iterable[SlowFeature], layers_by_file: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Return a ``countries.slow_features`` entry excluding every logged
+    feature from all layers of its file (like the hand-written entries, so
+    an airspace never shows up without its border band)."""
+
+    suggested: Dict[str, Dict[str, Dict[str, List[str]]]] = {}
+    for record in records:
+        key, value = ("name", record["name"]) if record["name"] else ("_id", record["_id"])
+        for layer in layers_by_file.get(record["file_code"], [record["layer"]]):
+            values = suggested.setdefault(record["country"], {}).setdefault(layer, {}).setdefault(key, [])
+            if value not in values:
+                values.append(value)
+    return suggested
+
+
+def write_slow_features(records: List[SlowFeature], layers_by_file: Dict[str, List[str]]) -> None:
+    records = sorted(records, key=lambda record: -record["ms"])
+    SLOW_FEATURES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    SLOW_FEATURES_PATH.write_text(
+        json.dumps(
+            {
+                "threshold_ms": SLOW_FEATURE_MS,
+                "features": records,
+                "suggested": suggest_slow_features(records, layers_by_file),
+            },
+            indent=1,
+        ),
+        encoding="utf-8",
+    )
+    for record in records:
+        print(
+            f"slow feature {record['country']}/{record['layer']}: {record['name'] or record['_id']} "
+            f"({record['vertices']} vertices) {record['ms']:.0f} ms"
+        )
+    if records:
+        print(f"suggested slow_features written to {SLOW_FEATURES_PATH}")
+
+
+def print_hot_functions(directory: pathlib.Path = PROFILE_DIR, top: int = 25) -> None:
+    files = sorted(str(path) for path in directory.glob("*.prof"))
+    if not files:
+        print(f"no cProfile files in {directory}; run with PROFILE=cprofile")
+        return
+    stats = pstats.Stats(*files)
+    stats.sort_stats("cumulative").print_stats(top)
+    stats.sort_stats("tottime").print_stats(top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect profiles written with PROFILE=cprofile.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    hot_parser = subparsers.add_parser("hot", help="print the hottest functions of all profiles")
+    hot_parser.add_argument("--dir", type=pathlib.Path, default=PROFILE_DIR)
+    hot_parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    print_hot_functions(args.dir, args.top)
@@ -0,0 +1,164 @@
+"""Run report: wall time and peak memory per pipeline stage.
+
+``stage(name)`` times a block and tracks the peak resident set size (RSS) of
+this process while it runs, using a background sampler (the kernel only keeps
+a lifetime peak, which cannot be reset between stages). Peak RSS of finished
+child processes such as tippecanoe is taken from ``RUSAGE_CHILDREN``. Other
+modules add their own numbers with ``record``/``increment``. ``write`` dumps
+everything to ``tmp/run_report.json`` so runner sizes can be chosen from data.
+
+``MemoryGovernor`` enforces the optional RSS ceiling of the memory-bounded
+mode: work that would start above the high-water mark waits until other
+in-flight work has released memory.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import gc
+import json
+import os
+import pathlib
+import resource
+import sys
+import threading
+import time
+from typing import Any, Iterator
+
+SAMPLE_INTERVAL = 0.25
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """Return the current resident set size of this process in bytes."""
+
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # Not Linux: fall back to the lifetime peak, the best we can get
+        # without a third-party dependency.
+        return peak_rss(resource.RUSAGE_SELF)
+
+
+def peak_rss(who: int = resource.RUSAGE_SELF) -> int:
+    maxrss = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class RunReport:
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.stages: dict[str, dict[str, Any]] = {}
+        self.values: dict[str, Any] = {}
+        self._active: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._sampler: threading.Thread | None = None
+
+    def _sample_forever(self) -> None:
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            self.sample()
+
+    def sample(self) -> int:
+        rss = current_rss()
+        with self._lock:
+            for stage in self._active.values():
+                stage["peak_rss"] = max(stage["peak_rss"], rss)
+        return rss
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[dict[str, Any]]:
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_forever, name="rss-sampler", daemon=True)
+            self._sampler.start()
+        entry: dict[str, Any] = {"peak_rss": current_rss()}
+        children_before = peak_rss(resource.RUSAGE_CHILDREN)
+        started = time.perf_counter()
+        with self._lock:
+            self._active[name] = entry
+        try:
+            yield entry
+        finally:
+            self.sample()
+            with self._lock:
+                self._active.pop(name, None)
+            entry["seconds"] = round(time.perf_counter() - started, 3)
+            children_after = peak_rss(resource.RUSAGE_CHILDREN)
+            if children_after > children_before:
+                entry["children_peak_rss"] = children_after
+            self.stages[name] = entry
+
+    def record(self, key: str, value: Any) -> None:
+        with self._lock:
+            self.values[key] = value
+
+    def increment(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "started": self.started,
+            "seconds": round(time.time() - self.started, 3),
+            "peak_rss": peak_rss(resource.RUSAGE_SELF),
+            "stages": self.stages,
+            "values": self.values,
+        }
+
+    def write(self, path: pathlib.Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.as_dict(), indent=2, sort_keys=True), encoding="utf-8")
+        for name, stage in self.stages.items():
+            print(
+                f"stage {name}: {stage['seconds']:.1f}s, "
+                f"peak RSS {stage['peak_rss'] / 1024 / 1024:.0f} MB"
+                + (f", children {stage['children_peak_rss'] / 1024 / 1024:.0f} MB" if "children_peak_rss" in stage else "")
+            )
+
+
+report = RunReport()
+
+
+class MemoryGovernor:
+    """Admission control for the memory-bounded mode.
+
+    ``ceiling`` is the RSS limit in bytes (0 disables the governor). A task
+    only starts while RSS is below ``high_water`` x ceiling, unless nothing
+    else is in flight (a lone task must always be allowed to progress).
+    """
+
+    def __init__(self, ceiling: int, high_water: float = 0.8) -> None:
+        self.ceiling = ceiling
+        self.threshold = int(ceiling * high_water)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ceiling > 0
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        with self._condition:
+            waited = False
+            while self._in_flight and current_rss() >= self.threshold:
+                if not waited:
+                    gc.collect()
+                    report.increment("memory_throttled")
+                    waited = True
+                self._condition.wait(timeout=SAMPLE_INTERVAL)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def near_ceiling(self) -> bool:
+        return self.enabled and current_rss() >= self.threshold
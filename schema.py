@@ -0,0 +1,302 @@
+"""Validate raw OpenAIP features before they are mapped.
+
+The mappers index properties directly (``properties['icaoClass']``,
+``properties['elevation']['value']``) and build ``IntEnum`` members from
+raw values, so a single unexpected record used to raise deep inside a
+mapping worker and end the run. Every raw object is now checked feature by
+feature against the schema of its file code (``SCHEMAS``), and features
+that do not match are quarantined instead of mapped:
+
+- each schema is compiled once per process into a plain Python function
+  (``compile_validator``): one ``type()`` check or set lookup per field, no
+  recursion or per-call interpretation of the schema, returning the first
+  problem found;
+- the geometry is checked for a supported type and the coordinate nesting
+  of that type (first position only, not every vertex);
+- quarantined features are written with their reason to
+  ``tmp/quarantine.jsonl``, and the count per object goes to the run
+  report (``quarantined`` value).
+
+A schema lists what the mappers need, not everything OpenAIP sends: extra
+fields are ignored. Anything a schema cannot express and a mapper still
+trips over is caught in ``main.map_features`` and quarantined the same way.
+``python benchmarks/bench_validation.py`` compares the validator's cost
+with that of the mapping it protects.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+from collections import Counter
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from enums import (
+    EAirportType,
+    EAirSpaceIcaoClass,
+    EAirSpaceType,
+    EFrequencyUnit,
+    EHangGlidingType,
+    EHeightUnit,
+    EHotSpotOccurrence,
+    EHotSpotReliability,
+    EHotSpotType,
+    ENavaidType,
+    EObstacleType,
+    EReferenceDatum,
+)
+
+QUARANTINE_PATH = pathlib.Path("tmp/quarantine.jsonl")
+# What a mapper raises on data its schema let through.
+MAPPING_ERRORS = (KeyError, IndexError, TypeError, ValueError, AttributeError)
+# Added to the properties by the pipeline itself (airspace_index.py).
+PIPELINE_KEYS = ("_shape", "_stack", "_label")
+
+Feature = Dict[str, Any]
+# Returns None for a valid feature, else the first problem found.
+Validator = Callable[[Feature], Optional[str]]
+QuarantineRecord = Dict[str, Any]
+
+
+class Maybe:
+    """A field that may be absent."""
+
+    def __init__(self, spec: Any) -> None:
+        self.spec = spec
+
+
+class Nullable:
+    """A field that must be present but may be null."""
+
+    def __init__(self, spec: Any) -> None:
+        self.spec = spec
+
+
+class Items:
+    """A list of at least ``min_items`` elements matching ``spec``."""
+
+    def __init__(self, spec: Any, min_items: int = 0) -> None:
+        self.spec = spec
+        self.min_items = min_items
+
+
+NUMBER = (int, float)
+# Any JSON value.
+ANY = object()
+
+HEIGHT = {"value": NUMBER, "unit": EHeightUnit, "referenceDatum": EReferenceDatum}
+COMMON = {"_id": str, "country": str}
+
+# Per file code: the properties the mappers of that file read without a default.
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "asp": {
+        **COMMON,
+        "type": EAirSpaceType,
+        "icaoClass": EAirSpaceIcaoClass,
+        "name": Maybe(str),
+        "upperLimit": HEIGHT,
+        "lowerLimit": HEIGHT,
+    },
+    "obs": {**COMMON, "type": EObstacleType, "elevation": HEIGHT},
+    "apt": {
+        **COMMON,
+        "type": EAirportType,
+        "name": str,
+        "icaoCode": Maybe(str),
+        "elevation": HEIGHT,
+        "runways": Maybe(Nullable(Items(dict))),
+        "frequencies": Maybe(Items(dict)),
+    },
+    "nav": {
+        **COMMON,
+        "type": ENavaidType,
+        "name": str,
+        "identifier": str,
+        "frequency": {"value": ANY, "unit": EFrequencyUnit},
+    },
+    "hot": {
+        **COMMON,
+        "name": Maybe(str),
+        "type": EHotSpotType,
+        "reliability": EHotSpotReliability,
+        "occurrence": EHotSpotOccurrence,
+        "elevation": HEIGHT,
+    },
+    "hgl": {**COMMON, "type": EHangGlidingType, "name": str, "elevation": HEIGHT},
+    "rpp": {**COMMON, "name": Maybe(str), "airports": Maybe(Items(ANY, min_items=1))},
+}
+
+# Nesting depth of the coordinates of each geometry type.
+COORDINATE_DEPTH = {"Point": 1, "MultiPoint": 2, "LineString": 2, "MultiLineString": 3, "Polygon": 3, "MultiPolygon": 4}
+
+
+def _geometry_error(geometry: Any) -> Optional[str]:
+    if type(geometry) is not dict:
+        return "geometry: expected an object"
+    kind = geometry.get("type")
+    if kind == "GeometryCollection":
+        parts = geometry.get("geometries")
+        if type(parts) is not list:
+            return "geometry.geometries: expected a list"
+        for part in parts:
+            error = _geometry_error(part)
+            if error:
+                return error
+        return None
+    depth = COORDINATE_DEPTH.get(kind)  # type: ignore[arg-type]
+    if depth is None:
+        return f"geometry.type: unsupported {kind!r:.40}"
+    coordinates = geometry.get("coordinates")
+    for _ in range(depth - 1):
+        if type(coordinates) is not list or not coordinates:
+            return f"geometry.coordinates: not a {kind} (nesting)"
+        coordinates = coordinates[0]
+    if type(coordinates) is not list or len(coordinates) < 2:
+        return f"geometry.coordinates: not a {kind} (position)"
+    return None
+
+
+class _Compiler:
+    """Turns a schema into the source of one straight-line function."""
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.constants: Dict[str, Any] = {}
+        self.variables = 0
+
+    def variable(self) -> str:
+        self.variables += 1
+        return f"v{self.variables}"
+
+    def constant(self, value: Any) -> str:
+        name = f"c{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def check(self, spec: Any, var: str, path: str, indent: int) -> None:
+        if spec is ANY:
+            return
+        if isinstance(spec, Nullable):
+            self.emit(indent, f"if {var} is not None:")
+            self.check(spec.spec, var, path, indent + 1)
+            self.emit(indent + 1, "pass")
+        elif isinstance(spec, dict):
+            self.emit(indent, f"if type({var}) is not dict: return {path + ': expected an object'!r}")
+            for key, field in spec.items():
+                value = self.variable()
+                field_path = f"{path}.{key}"
+                self.emit(indent, f"{value} = {var}.get({key!r}, MISSING)")
+                if isinstance(field, Maybe):
+                    self.emit(indent, f"if {value} is not MISSING:")
+                    self.check(field.spec, value, field_path, indent + 1)
+                    self.emit(indent + 1, "pass")
+                else:
+                    self.emit(indent, f"if {value} is MISSING: return {field_path + ': missing'!r}")
+                    self.check(field, value, field_path, indent)
+        elif isinstance(spec, Items):
+            self.emit(indent, f"if type({var}) is not list: return {path + ': expected a list'!r}")
+            if spec.min_items:
+                message = f"{path}: expected at least {spec.min_items} items"
+                self.emit(indent, f"if len({var}) < {spec.min_items}: return {message!r}")
+            if spec.spec is not ANY:
+                item = self.variable()
+                self.emit(indent, f"for {item} in {var}:")
+                self.check(spec.spec, item, f"{path}[]", indent + 1)
+        elif isinstance(spec, type) and issubclass(spec, IntEnum):
+            values = self.constant(frozenset(member.value for member in spec))
+            message = f"{path}: not a {spec.__name__} value: "
+            self.emit(indent, f"if type({var}) is not int or {var} not in {values}:")
+            self.emit(indent + 1, f"return {message!r} + repr({var})[:40]")
+        elif spec == NUMBER:
+            self.emit(indent, f"if type({var}) is not int and type({var}) is not float:")
+            self.emit(indent + 1, f"return {path + ': expected a number, got '!r} + type({var}).__name__")
+        elif isinstance(spec, type):
+            self.emit(indent, f"if type({var}) is not {self.constant(spec)}:")
+            self.emit(indent + 1, f"return {path + f': expected {spec.__name__}, got '!r} + type({var}).__name__")
+        else:
+            raise TypeError(f"unsupported schema entry at {path}: {spec!r}")
+
+
+def compile_validator(properties: Dict[str, Any], name: str = "feature") -> Validator:
+    """Compile a properties schema into a validator of whole features."""
+
+    compiler = _Compiler()
+    compiler.emit(1, "if type(feature) is not dict: return 'feature: expected an object'")
+    compiler.emit(1, "error = geometry_error(feature.get('geometry'))")
+    compiler.emit(1, "if error: return error")
+    compiler.emit(1, "v0 = feature.get('properties')")
+    compiler.check(properties, "v0", "properties", 1)
+    compiler.emit(1, "return None")
+    source = "def validate(feature):\n" + "\n".join(compiler.lines) + "\n"
+    namespace: Dict[str, Any] = {"MISSING": object(), "geometry_error": _geometry_error, **compiler.constants}
+    exec(compile(source, f"<schema {name}>", "exec"), namespace)
+    validate = namespace["validate"]
+    validate.source = source
+    return validate
+
+
+@lru_cache(maxsize=None)
+def validator(file_code: str) -> Optional[Validator]:
+    """The compiled validator of ``file_code`` (None without a schema)."""
+
+    schema = SCHEMAS.get(file_code)
+    return None if schema is None else compile_validator(schema, file_code)
+
+
+def quarantine_record(country: str, file_code: str, layer: Optional[str], feature: Any, reason: str) -> QuarantineRecord:
+    properties = feature.get("properties") if isinstance(feature, dict) else None
+    if isinstance(properties, dict) and any(key in properties for key in PIPELINE_KEYS):
+        properties = {key: value for key, value in properties.items() if key not in PIPELINE_KEYS}
+        feature = dict(feature, properties=properties)
+    return {
+        "country": country,
+        "file_code": file_code,
+        "layer": layer,
+        "_id": properties.get("_id") if isinstance(properties, dict) else None,
+        "reason": reason,
+        "feature": feature,
+    }
+
+
+def validated(
+    features: Iterable[Feature],
+    validate: Optional[Validator],
+    quarantined: Optional[List[QuarantineRecord]],
+    country: str,
+    file_code: str,
+) -> Iterator[Feature]:
+    """Yield the valid ``features``; the others are appended to
+    ``quarantined`` (skipped silently when it is None)."""
+
+    if validate is None:
+        yield from features
+        return
+    for feature in features:
+        reason = validate(feature)
+        if reason is None:
+            yield feature
+        elif quarantined is not None:
+            quarantined.append(quarantine_record(country, file_code, None, feature, reason))
+
+
+def write_quarantine(records: List[QuarantineRecord], path: pathlib.Path = QUARANTINE_PATH) -> Dict[str, int]:
+    """Write ``records`` as JSON lines, print a summary and return the count
+    per object (``<country>_<code>``)."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, default=str))
+            f.write("\n")
+    counts = Counter(f"{record['country']}_{record['file_code']}" for record in records)
+    reasons: Counter[Tuple[str, str]] = Counter((record["file_code"], record["reason"]) for record in records)
+    for (file_code, reason), count in reasons.most_common(10):
+        print(f"quarantined {count} {file_code} features: {reason}")
+    if records:
+        print(f"{len(records)} features in {len(counts)} objects quarantined to {path}")
+    return dict(sorted(counts.items()))
@@ -0,0 +1,165 @@
+"""Order the features of each layer file along a Hilbert curve.
+
+The writers append features in country order and, within a country, in source
+order, so neighbouring features end up far apart in ``tmp/<layer>.geojson``.
+tippecanoe reads, sorts and merges its input by tile; input that already
+arrives in spatial order keeps its sort runs short and its merge phase cheap.
+
+``sort_layer`` rewrites one layer file ordered by the Hilbert index of each
+feature's bounding box centre (in Web Mercator, like the tiles; ties keep
+file order, so the result is deterministic). Features are streamed in and
+sorted in runs of at most ``SORT_RUN_MB`` of serialized text; a layer larger
+than one run is spilled to sorted run files next to it and merged back, so
+memory stays bounded whatever the layer size. The features themselves are
+written unchanged.
+
+Run as the ``sort`` stage of ``main.py`` (between ``map`` and ``tile``), or
+alone: ``python spatial_sort.py tmp/airspaces.geojson ...``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import os
+import pathlib
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+from geojson_stream import iter_geojson_features
+from mapper import geometry_bounds
+
+# Serialized bytes per in-memory run; larger layers are merged from disk.
+SORT_RUN_MB = int(os.environ.get("SORT_RUN_MB", "256"))
+# 2^16 x 2^16 cells: about 600 m at the equator, finer than a z14 tile.
+HILBERT_ORDER = 16
+MAX_LATITUDE = 85.05112878
+GEOJSON_HEADER = '{"type": "FeatureCollection","features": ['
+GEOJSON_FOOTER = "]}"
+# Run files hold one "<key><seq>\t<feature>" line per feature; the fixed-width
+# key and sequence number make plain string order the sort order.
+KEY_WIDTH = 10
+SEQ_WIDTH = 12
+
+
+def hilbert_index(x: int, y: int, order: int = HILBERT_ORDER) -> int:
+    """Distance of cell ``(x, y)`` along the Hilbert curve filling a
+    ``2^order`` square."""
+
+    index = 0
+    side = 1 << (order - 1)
+    while side:
+        rx = 1 if x & side else 0
+        ry = 1 if y & side else 0
+        index += side * side * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the sub-curve is in standard orientation.
+        if not ry:
+            if rx:
+                x = side - 1 - (x & (side - 1))
+                y = side - 1 - (y & (side - 1))
+            x, y = y, x
+        side >>= 1
+    return index
+
+
+def feature_key(feature: Dict[str, Any], order: int = HILBERT_ORDER) -> int:
+    """Hilbert index of the Web Mercator cell holding the centre of the
+    feature's bounding box; features without coordinates sort first."""
+
+    bounds = geometry_bounds(feature.get("geometry") or {})
+    if bounds is None:
+        return 0
+    lon = (bounds[0] + bounds[2]) / 2
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, (bounds[1] + bounds[3]) / 2))
+    cells = 1 << order
+    x = (lon + 180) / 360
+    y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2
+    return hilbert_index(min(cells - 1, max(0, int(x * cells))), min(cells - 1, max(0, int(y * cells))), order)
+
+
+def _keyed_lines(path: pathlib.Path) -> Iterator[str]:
+    for seq, feature in enumerate(iter_geojson_features(path)):
+        yield f"{feature_key(feature):0{KEY_WIDTH}d}{seq:0{SEQ_WIDTH}d}\t{json.dumps(feature)}"
+
+
+def _write_run(lines: List[str], directory: pathlib.Path) -> pathlib.Path:
+    lines.sort()
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".run", delete=False) as f:
+        for line in lines:
+            f.write(line)
+            f.write("\n")
+    return pathlib.Path(f.name)
+
+
+def _write_layer(lines: Iterable[str], out: IO[str]) -> int:
+    out.write(GEOJSON_HEADER)
+    count = 0
+    for line in lines:
+        if count:
+            out.write(",")
+        out.write(line[line.index("\t") + 1:].rstrip("\n"))
+        count += 1
+    out.write(GEOJSON_FOOTER)
+    return count
+
+
+def sort_layer(path: pathlib.Path, run_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """Rewrite ``path`` in Hilbert order; return features, runs and seconds."""
+
+    run_bytes = run_bytes or SORT_RUN_MB * 1024 * 1024
+    started = time.perf_counter()
+    runs: List[pathlib.Path] = []
+    lines: List[str] = []
+    held = 0
+    target = path.with_name(f"{path.name}.sorting")
+    try:
+        for line in _keyed_lines(path):
+            lines.append(line)
+            held += len(line)
+            if held >= run_bytes:
+                runs.append(_write_run(lines, path.parent))
+                lines, held = [], 0
+        with ExitStack() as stack, target.open("w", encoding="utf-8") as out:
+            if runs:
+                if lines:
+                    runs.append(_write_run(lines, path.parent))
+                    lines = []
+                files = [stack.enter_context(run.open("r", encoding="utf-8")) for run in runs]
+                count = _write_layer(heapq.merge(*files), out)
+            else:
+                lines.sort()
+                count = _write_layer(lines, out)
+        os.replace(target, path)
+    finally:
+        target.unlink(missing_ok=True)
+        for run in runs:
+            run.unlink(missing_ok=True)
+    return {"features": count, "runs": max(1, len(runs)), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def sort_layers(paths: List[pathlib.Path], run_bytes: Optional[int] = None, workers: int = 1) -> Dict[str, Dict[str, Any]]:
+    """Sort every layer file, ``workers`` at a time (each holding up to
+    ``run_bytes`` in memory)."""
+
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            sorted_layers = executor.map(sort_layer, paths, [run_bytes] * len(paths))
+    else:
+        sorted_layers = map(sort_layer, paths, [run_bytes] * len(paths))
+    results = {}
+    for path, result in zip(paths, sorted_layers):
+        results[str(path)] = result
+        spilled = f", merged from {result['runs']} runs" if result["runs"] > 1 else ""
+        print(f"sorted {path.name}: {result['features']} features in {result['seconds']:.1f}s{spilled}")
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python spatial_sort.py LAYER.geojson ...")
+    sort_layers([pathlib.Path(arg) for arg in sys.argv[1:]])
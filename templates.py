@@ -0,0 +1,64 @@
+"""Compiled ``{{NAME}}`` templates and write-if-changed output for the web pages.
+
+The pages used to be assembled with one ``str.replace`` pass over the whole
+template per placeholder, each copying the full page. A ``Template`` is
+split once, when it is created, into its literal segments and placeholder
+names; ``render`` then only joins the segments with the values, in one
+pass. A placeholder without a value raises ``KeyError`` instead of leaking
+``{{NAME}}`` into the page, and an unknown value raises too, so a typo in
+either place shows up at once.
+
+``write_if_changed`` writes a page only when its SHA-256 differs from the
+file already on disk, so an unchanged page keeps its mtime and the deploy
+sees no change.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pathlib
+import re
+from typing import Any, List, Tuple
+
+PLACEHOLDER = re.compile(r"\{\{([A-Z][A-Z0-9_]*)\}\}")
+
+
+class Template:
+    def __init__(self, text: str) -> None:
+        parts = PLACEHOLDER.split(text)
+        # split() alternates literal, name, literal, ..., literal.
+        self.literals: List[str] = parts[0::2]
+        self.names: Tuple[str, ...] = tuple(parts[1::2])
+        self.fields = frozenset(self.names)
+
+    def render(self, **values: Any) -> str:
+        unknown = values.keys() - self.fields
+        if unknown:
+            raise KeyError(f"not in the template: {', '.join(sorted(unknown))}")
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            out.append(str(values[name]))
+            out.append(literal)
+        return "".join(out)
+
+
+def file_sha256(path: pathlib.Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest() if path.exists() else ""
+
+
+def write_if_changed(path: pathlib.Path, content: str | bytes) -> bool:
+    """Write ``content`` to ``path`` unless the file already holds it.
+
+    Returns whether the file was written. The new content goes to a
+    temporary file first, so readers never see a half-written page.
+    """
+
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    if file_sha256(path) == hashlib.sha256(data).hexdigest():
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.tmp")
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+    return True
@@ -0,0 +1,206 @@
+"""Tile-level diff and patch between two PMTiles builds.
+
+``diff`` walks two archives in tile id order, compares a hash of every tile
+payload and writes a delta archive containing only added/changed tiles plus a
+JSON manifest listing removed tile ids. ``apply`` patches a local copy of the
+old archive with that delta. Because the patched file is re-assembled rather
+than byte-copied, archives are identified by a *tiles digest* (a hash over
+every ``(tile_id, payload hash)`` pair) instead of a file hash; ``apply``
+checks the base digest before patching and the target digest afterwards.
+
+Usage:
+    python tile_diff.py diff OLD.pmtiles NEW.pmtiles DELTA.pmtiles
+    python tile_diff.py apply BASE.pmtiles DELTA.pmtiles OUTPUT.pmtiles
+    python tile_diff.py digest ARCHIVE.pmtiles
+
+The manifest is written next to the delta as ``<delta>.json``.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import pathlib
+import sys
+from typing import Any, Iterator
+
+from pmtiles_archive import Entry, PMTilesHeader, PMTilesReader, PMTilesWriter
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(delta: pathlib.Path) -> pathlib.Path:
+    return delta.with_suffix(".json")
+
+
+def hashed_tiles(reader: PMTilesReader) -> Iterator[tuple[int, Entry, bytes]]:
+    """Yield ``(tile_id, entry, payload hash)``; each distinct payload
+    (addressed by its offset) is hashed only once."""
+
+    cache: dict[int, bytes] = {}
+    for tile_id, entry in reader.tiles():
+        digest = cache.get(entry.offset)
+        if digest is None:
+            digest = hashlib.sha256(reader.tile_data(entry)).digest()
+            cache[entry.offset] = digest
+        yield tile_id, entry, digest
+
+
+def _digest_update(digest: Any, tile_id: int, payload_hash: bytes) -> None:
+    digest.update(tile_id.to_bytes(8, "little"))
+    digest.update(payload_hash)
+
+
+def tiles_digest(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with PMTilesReader(path) as reader:
+        for tile_id, _, payload_hash in hashed_tiles(reader):
+            _digest_update(digest, tile_id, payload_hash)
+    return digest.hexdigest()
+
+
+def _ranges(tile_ids: list[int]) -> list[list[int]]:
+    """Compress sorted tile ids into ``[start, count]`` runs."""
+
+    runs: list[list[int]] = []
+    for tile_id in tile_ids:
+        if runs and runs[-1][0] + runs[-1][1] == tile_id:
+            runs[-1][1] += 1
+        else:
+            runs.append([tile_id, 1])
+    return runs
+
+
+def _header_fields(header: PMTilesHeader) -> dict:
+    return {
+        field.name: getattr(header, field.name)
+        for field in dataclasses.fields(header)
+        if field.name.startswith(("min_", "max_", "center_", "tile_compression", "tile_type"))
+    }
+
+
+def diff_archives(old: pathlib.Path, new: pathlib.Path, delta: pathlib.Path) -> dict:
+    """Write the delta archive and its manifest; return the manifest."""
+
+    added = changed = unchanged = 0
+    removed: list[int] = []
+    base_digest = hashlib.sha256()
+    target_digest = hashlib.sha256()
+    sentinel = (sys.maxsize, None, b"")
+
+    with PMTilesReader(old) as old_reader, PMTilesReader(new) as new_reader, PMTilesWriter(delta) as writer:
+        old_tiles = hashed_tiles(old_reader)
+        new_tiles = hashed_tiles(new_reader)
+        old_tile = next(old_tiles, sentinel)
+        new_tile = next(new_tiles, sentinel)
+        while old_tile is not sentinel or new_tile is not sentinel:
+            if old_tile[0] < new_tile[0]:
+                _digest_update(base_digest, old_tile[0], old_tile[2])
+                removed.append(old_tile[0])
+                old_tile = next(old_tiles, sentinel)
+                continue
+            tile_id, entry, payload_hash = new_tile
+            _digest_update(target_digest, tile_id, payload_hash)
+            if old_tile[0] == tile_id:
+                _digest_update(base_digest, old_tile[0], old_tile[2])
+                same = old_tile[2] == payload_hash
+                old_tile = next(old_tiles, sentinel)
+                if same:
+                    unchanged += 1
+                    new_tile = next(new_tiles, sentinel)
+                    continue
+                changed += 1
+            else:
+                added += 1
+            writer.add_tile(tile_id, new_reader.tile_data(entry), key=payload_hash)
+            new_tile = next(new_tiles, sentinel)
+
+        writer.finalize(new_reader.header, new_reader.metadata())
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "base": {"tiles_digest": base_digest.hexdigest(), "size": old.stat().st_size},
+            "target": {
+                "tiles_digest": target_digest.hexdigest(),
+                "size": new.stat().st_size,
+                "header": _header_fields(new_reader.header),
+                "metadata": new_reader.metadata(),
+            },
+            "delta": {"file": delta.name, "size": delta.stat().st_size},
+            "added": added,
+            "changed": changed,
+            "unchanged": unchanged,
+            "removed": _ranges(removed),
+            "removed_count": len(removed),
+        }
+
+    manifest_path_for(delta).write_text(json.dumps(manifest), encoding="utf-8")
+    return manifest
+
+
+def apply_delta(base: pathlib.Path, delta: pathlib.Path, output: pathlib.Path) -> None:
+    """Write ``output`` = ``base`` patched with ``delta``."""
+
+    manifest = json.loads(manifest_path_for(delta).read_text(encoding="utf-8"))
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise RuntimeError(f"unsupported delta manifest version {manifest.get('version')}")
+    base_digest = tiles_digest(base)
+    if base_digest != manifest["base"]["tiles_digest"]:
+        raise RuntimeError(
+            f"{base} is not the base this delta was built against "
+            f"(digest {base_digest[:12]}, expected {manifest['base']['tiles_digest'][:12]})"
+        )
+
+    removed: set[int] = set()
+    for start, count in manifest["removed"]:
+        removed.update(range(start, start + count))
+
+    with PMTilesReader(base) as base_reader, PMTilesReader(delta) as delta_reader, PMTilesWriter(output) as writer:
+        sentinel = (sys.maxsize, None)
+        base_tiles = base_reader.tiles()
+        delta_tiles = delta_reader.tiles()
+        base_tile = next(base_tiles, sentinel)
+        delta_tile = next(delta_tiles, sentinel)
+        while base_tile is not sentinel or delta_tile is not sentinel:
+            if delta_tile[0] <= base_tile[0]:
+                if delta_tile[0] == base_tile[0]:
+                    base_tile = next(base_tiles, sentinel)
+                tile_id, entry = delta_tile
+                writer.add_tile(tile_id, delta_reader.tile_data(entry), key=("delta", entry.offset))
+                delta_tile = next(delta_tiles, sentinel)
+            else:
+                tile_id, entry = base_tile
+                if tile_id not in removed:
+                    writer.add_tile(tile_id, base_reader.tile_data(entry), key=("base", entry.offset))
+                base_tile = next(base_tiles, sentinel)
+        header = dataclasses.replace(base_reader.header, **manifest["target"]["header"])
+        writer.finalize(header, manifest["target"]["metadata"])
+
+    output_digest = tiles_digest(output)
+    if output_digest != manifest["target"]["tiles_digest"]:
+        raise RuntimeError(f"patched archive {output} does not match the target digest")
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) == 4 and argv[0] == "diff":
+        manifest = diff_archives(*(pathlib.Path(arg) for arg in argv[1:]))
+        print(
+            f"{manifest['added']} added, {manifest['changed']} changed, "
+            f"{manifest['removed_count']} removed, {manifest['unchanged']} unchanged tiles; "
+            f"delta {manifest['delta']['size']} bytes vs {manifest['target']['size']} bytes"
+        )
+    elif len(argv) == 4 and argv[0] == "apply":
+        apply_delta(*(pathlib.Path(arg) for arg in argv[1:]))
+        print(f"patched {argv[1]} -> {argv[3]}")
+    elif len(argv) == 2 and argv[0] == "digest":
+        print(tiles_digest(pathlib.Path(argv[1])))
+    else:
+        raise RuntimeError(__doc__.split("Usage:", 1)[1].split("The manifest", 1)[0].strip())
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except RuntimeError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,134 @@
+"""Patch mode: rebuild the combined archive from cached per-country tiles.
+
+A full run tiles every layer of every country in one tippecanoe run, even
+when only a handful of countries changed since last week. In patch mode
+(``python main.py --patch``) the map stage also writes each country's layers
+to ``tmp/<country>/<layer>.geojson``, and the tile stage:
+
+- fingerprints every country: SHA-256 over its layer files and the
+  tippecanoe arguments, so new data, a mapper change or new arguments all
+  invalidate the cache;
+- tiles only the countries whose fingerprint differs from the one stored
+  next to their cached ``tmp/<country>/tiles.mbtiles`` (countries without a
+  single feature are left out);
+- joins the tiles of every country with ``tile-join`` into the combined
+  archive.
+
+Tiles that straddle a border are produced by several countries; tile-join
+merges same-named layers of the same tile, so the joined tile holds the
+features of all of them. The pipeline tiles with ``--drop-rate=0``,
+``--no-feature-limit``, ``--no-tile-size-limit`` and without line
+simplification, so which features a tile holds does not depend on its
+neighbours. Only tippecanoe's tiny-polygon reduction at low zooms looks at
+the other polygons of a tile, so sub-pixel polygons in shared tiles may be
+kept or dropped differently than in a full run.
+
+The countries joined are those passed in (``countries.py`` by default), not
+only the ones mapped by this run: ``python main.py --patch --countries de,fr``
+retiles Germany and France and reuses the cached tiles of every other
+country.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import pathlib
+import shutil
+import subprocess
+import time
+from typing import Any, Dict, List
+
+from hashing import hash_files
+from run_metrics import report
+from tiling import run_tippecanoe
+
+TILE_JOIN_EXECUTABLE = "tile-join"
+TILE_JOIN_ARGS = ["--force", "--no-tile-size-limit"]
+COUNTRY_TILES_NAME = "tiles.mbtiles"
+# Fingerprint of the inputs the cached tiles were built from.
+COUNTRY_STATE_NAME = "tiles.json"
+
+
+def has_features(path: pathlib.Path, empty_size: int) -> bool:
+    return path.stat().st_size > empty_size
+
+
+def fingerprint(layer_paths: List[pathlib.Path], tippecanoe_args: List[str]) -> str:
+    digest = hashlib.sha256(json.dumps(tippecanoe_args).encode("utf-8"))
+    for path, file_digest in sorted(hash_files(layer_paths).items()):
+        digest.update(f"{path.name}\0{file_digest.sha256}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cached_fingerprint(country_dir: pathlib.Path) -> str:
+    state = country_dir / COUNTRY_STATE_NAME
+    if not state.exists() or not (country_dir / COUNTRY_TILES_NAME).exists():
+        return ""
+    return json.loads(state.read_text(encoding="utf-8")).get("fingerprint", "")
+
+
+def tile_country(
+    country: str,
+    country_dir: pathlib.Path,
+    layer_paths: List[pathlib.Path],
+    tippecanoe: List[str],
+    digest: str,
+    threads: int = 0,
+) -> None:
+    tiles = country_dir / COUNTRY_TILES_NAME
+    (country_dir / COUNTRY_STATE_NAME).unlink(missing_ok=True)
+    command = [tippecanoe[0], "-o", str(tiles), *tippecanoe[1:], *[str(path) for path in layer_paths]]
+    run_tippecanoe(command, tiles, layer_paths, threads, name=f"tippecanoe:{country}")
+    # Written last: an interrupted run leaves no state, so it is retiled.
+    (country_dir / COUNTRY_STATE_NAME).write_text(json.dumps({"fingerprint": digest}), encoding="utf-8")
+
+
+def patch_tiles(
+    country_layers: Dict[str, List[pathlib.Path]],
+    tippecanoe: List[str],
+    output: pathlib.Path,
+    empty_size: int,
+    threads: int = 0,
+) -> None:
+    """Retile the changed countries and join all of them into ``output``.
+
+    ``country_layers`` maps each country to its layer files (every layer,
+    in the order of the full run); ``tippecanoe`` is the executable and its
+    arguments without ``-o`` and inputs; a layer file of ``empty_size``
+    bytes holds no feature.
+    """
+
+    if shutil.which(TILE_JOIN_EXECUTABLE) is None:
+        raise RuntimeError("tile-join executable not found on PATH. It ships with tippecanoe.")
+    missing = [country for country, paths in country_layers.items() if not all(path.exists() for path in paths)]
+    if missing:
+        raise RuntimeError(
+            f"no per-country layers for {', '.join(missing)}; run the map stage with --patch for them first"
+        )
+    joined: List[pathlib.Path] = []
+    retiled: List[str] = []
+    for country, paths in country_layers.items():
+        country_dir = paths[0].parent
+        if not any(has_features(path, empty_size) for path in paths):
+            continue
+        digest = fingerprint(paths, tippecanoe[1:])
+        if cached_fingerprint(country_dir) != digest:
+            print(f"tiling {country}: its layers or the tippecanoe arguments changed")
+            tile_country(country, country_dir, paths, tippecanoe, digest, threads)
+            retiled.append(country)
+        joined.append(country_dir / COUNTRY_TILES_NAME)
+    if not joined:
+        raise RuntimeError("no country has any feature to tile")
+    print(f"retiled {len(retiled)} of {len(joined)} countries; joining them into {output}")
+    started = time.perf_counter()
+    command = [TILE_JOIN_EXECUTABLE, "-o", str(output), *TILE_JOIN_ARGS, *[str(path) for path in joined]]
+    result = subprocess.run(command, stderr=subprocess.PIPE, text=True, errors="replace")
+    if result.returncode:
+        raise RuntimeError(f"tile-join failed (exit {result.returncode}):\n{result.stderr[-4000:]}")
+    patch: Dict[str, Any] = {
+        "retiled": retiled,
+        "joined": len(joined),
+        "join_seconds": round(time.perf_counter() - started, 3),
+    }
+    report.record("tile_patch", patch)
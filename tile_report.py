@@ -0,0 +1,285 @@
+"""Where the bytes of a PMTiles archive go.
+
+Reads every tile of an MVT archive (``openaip.pmtiles`` by default) and
+reports:
+
+- tile size percentiles (p50/p90/p99/max, as stored) per zoom;
+- decoded bytes per layer and, within a layer, per attribute - the key, the
+  values only that key uses and the feature tags pointing at them - and per
+  zoom, so ``ZoomAttributes`` rules in ``main.OPEN_AIP_DATASETS`` can target
+  the attributes that are expensive where they are not rendered;
+- the largest tiles with their heaviest layer.
+
+Sizes come from the directory, so percentiles cover every addressed tile.
+Attribution decodes each distinct payload once; ``--sample`` decodes only
+that fraction of them (chosen by tile id) and scales the result. The MVT
+decoder below handles exactly the protobuf fields of the vector tile spec,
+so no protobuf dependency is needed.
+
+Usage:
+    python tile_report.py [openaip.pmtiles] [--top 20] [--sample 1.0] [--json tmp/tile_report.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import pathlib
+from typing import Any, Dict, Iterator, List, Tuple
+
+from main import DETAIL_ZOOM
+from pmtiles_archive import Entry, PMTilesReader, _read_varint, decompress, tileid_to_zxy
+
+DEFAULT_ARCHIVE = pathlib.Path("openaip.pmtiles")
+REPORT_PATH = pathlib.Path("tmp/tile_report.json")
+PERCENTILES = (50, 90, 99)
+# Knuth's multiplicative hash spreads a --sample evenly over the tile ids.
+SAMPLE_HASH = 2654435761
+
+# Vector tile spec field numbers.
+TILE_LAYERS = 3
+LAYER_NAME = 1
+LAYER_FEATURES = 2
+LAYER_KEYS = 3
+LAYER_VALUES = 4
+FEATURE_TAGS = 2
+FEATURE_GEOMETRY = 4
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_BYTES = 2
+WIRE_FIXED32 = 5
+
+
+def iter_fields(data: memoryview | bytes) -> Iterator[Tuple[int, int, Any, int]]:
+    """Yield ``(field, wire type, value, encoded size)`` of a protobuf
+    message; bytes fields are returned as memoryview slices."""
+
+    data = memoryview(data)
+    pos = 0
+    end = len(data)
+    while pos < end:
+        start = pos
+        key, pos = _read_varint(data, pos)
+        field, wire = key >> 3, key & 7
+        if wire == WIRE_VARINT:
+            value, pos = _read_varint(data, pos)
+        elif wire == WIRE_BYTES:
+            length, pos = _read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire == WIRE_FIXED64:
+            value = data[pos:pos + 8]
+            pos += 8
+        elif wire == WIRE_FIXED32:
+            value = data[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire}")
+        yield field, wire, value, pos - start
+
+
+def packed_varints(data: memoryview) -> List[int]:
+    values = []
+    pos = 0
+    while pos < len(data):
+        value, pos = _read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def varint_size(value: int) -> int:
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def layer_bytes(layer: memoryview) -> Dict[str, Any]:
+    """Attribute the bytes of one encoded layer to geometry, attributes and
+    overhead (ids, types, layer header)."""
+
+    name = ""
+    keys: List[str] = []
+    key_sizes: List[int] = []
+    value_sizes: List[int] = []
+    features: List[memoryview] = []
+    for field, _, value, size in iter_fields(layer):
+        if field == LAYER_NAME:
+            name = bytes(value).decode("utf-8")
+        elif field == LAYER_KEYS:
+            keys.append(bytes(value).decode("utf-8"))
+            key_sizes.append(size)
+        elif field == LAYER_VALUES:
+            value_sizes.append(size)
+        elif field == LAYER_FEATURES:
+            features.append(value)
+    attributes: Dict[str, int] = dict.fromkeys(keys, 0)
+    for key, size in zip(keys, key_sizes):
+        attributes[key] += size
+    value_owner: Dict[int, str] = {}
+    geometry = 0
+    for feature in features:
+        for field, _, value, size in iter_fields(feature):
+            if field == FEATURE_GEOMETRY:
+                geometry += size
+            elif field == FEATURE_TAGS:
+                tags = packed_varints(value)
+                # The tags field header itself is shared overhead.
+                for key_index, value_index in zip(tags[::2], tags[1::2]):
+                    key = keys[key_index]
+                    attributes[key] += varint_size(key_index) + varint_size(value_index)
+                    # A value shared by several keys is charged to the first.
+                    value_owner.setdefault(value_index, key)
+    for value_index, key in value_owner.items():
+        attributes[key] += value_sizes[value_index]
+    return {
+        "name": name,
+        "features": len(features),
+        "bytes": len(layer),
+        "geometry": geometry,
+        "attributes": attributes,
+    }
+
+
+def decode_tile(data: memoryview | bytes) -> List[Dict[str, Any]]:
+    return [layer_bytes(value) for field, _, value, _ in iter_fields(data) if field == TILE_LAYERS]
+
+
+def percentile(sorted_values: List[int], percent: float) -> int:
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def analyze(path: pathlib.Path, top: int = 20, sample: float = 1.0) -> Dict[str, Any]:
+    sizes_by_zoom: Dict[int, List[int]] = {}
+    largest: List[Tuple[int, int, Entry]] = []  # min-heap of (stored size, tile id, entry)
+    layers: Dict[str, Dict[str, Any]] = {}
+    decoded_payloads = 0
+    scale = 1 / sample
+    with PMTilesReader(path) as reader:
+        compression = reader.header.tile_compression
+        seen_offsets = set()
+        for tile_id, entry in reader.tiles():
+            z = tileid_to_zxy(tile_id)[0]
+            sizes_by_zoom.setdefault(z, []).append(entry.length)
+            if len(largest) < top:
+                heapq.heappush(largest, (entry.length, tile_id, entry))
+            elif entry.length > largest[0][0]:
+                heapq.heapreplace(largest, (entry.length, tile_id, entry))
+            if entry.offset in seen_offsets:
+                continue
+            seen_offsets.add(entry.offset)
+            if sample < 1 and (tile_id * SAMPLE_HASH) % 2 ** 32 >= sample * 2 ** 32:
+                continue
+            decoded_payloads += 1
+            for layer in decode_tile(decompress(bytes(reader.tile_data(entry)), compression)):
+                total = layers.setdefault(
+                    layer["name"], {"bytes": 0, "features": 0, "geometry": 0, "zooms": {}, "attributes": {}}
+                )
+                total["bytes"] += layer["bytes"] * scale
+                total["features"] += layer["features"] * scale
+                total["geometry"] += layer["geometry"] * scale
+                total["zooms"][z] = total["zooms"].get(z, 0) + layer["bytes"] * scale
+                for key, size in layer["attributes"].items():
+                    by_zoom = total["attributes"].setdefault(key, {})
+                    by_zoom[z] = by_zoom.get(z, 0) + size * scale
+        worst = []
+        for size, tile_id, entry in sorted(largest, reverse=True):
+            z, x, y = tileid_to_zxy(tile_id)
+            decoded = decode_tile(decompress(bytes(reader.tile_data(entry)), compression))
+            heaviest = max(decoded, key=lambda layer: layer["bytes"], default=None)
+            worst.append(
+                {
+                    "tile": f"{z}/{x}/{y}",
+                    "bytes": size,
+                    "decoded_bytes": sum(layer["bytes"] for layer in decoded),
+                    "heaviest_layer": heaviest["name"] if heaviest else None,
+                    "heaviest_layer_bytes": heaviest["bytes"] if heaviest else 0,
+                }
+            )
+    zooms = {}
+    for z, sizes in sorted(sizes_by_zoom.items()):
+        sizes.sort()
+        zooms[z] = {
+            "tiles": len(sizes),
+            "bytes": sum(sizes),
+            **{f"p{percent}": percentile(sizes, percent) for percent in PERCENTILES},
+            "max": sizes[-1],
+        }
+    for layer in layers.values():
+        for key in ("bytes", "features", "geometry"):
+            layer[key] = round(layer[key])
+        layer["zooms"] = {z: round(size) for z, size in sorted(layer["zooms"].items())}
+        layer["attributes"] = {
+            key: {"bytes": round(sum(by_zoom.values())), "zooms": {z: round(size) for z, size in sorted(by_zoom.items())}}
+            for key, by_zoom in sorted(layer["attributes"].items(), key=lambda item: -sum(item[1].values()))
+        }
+    return {
+        "archive": str(path),
+        "sample": sample,
+        "decoded_payloads": decoded_payloads,
+        "zooms": zooms,
+        "layers": dict(sorted(layers.items(), key=lambda item: -item[1]["bytes"])),
+        "largest_tiles": worst,
+    }
+
+
+def format_size(num_bytes: float) -> str:
+    if num_bytes < 1024:
+        return f"{num_bytes:.0f} B"
+    if num_bytes < 1024 ** 2:
+        return f"{num_bytes / 1024:.1f} KB"
+    return f"{num_bytes / 1024 ** 2:.1f} MB"
+
+
+def print_report(report: Dict[str, Any], attributes: int = 8) -> None:
+    print(f"{report['archive']}: stored tile sizes per zoom")
+    print(f"  {'z':>2} {'tiles':>9} {'total':>10} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for z, stats in report["zooms"].items():
+        print(
+            f"  {z:>2} {stats['tiles']:>9} {format_size(stats['bytes']):>10} "
+            + " ".join(f"{format_size(stats[f'p{percent}']):>9}" for percent in PERCENTILES)
+            + f" {format_size(stats['max']):>9}"
+        )
+    total = sum(layer["bytes"] for layer in report["layers"].values()) or 1
+    sampled = f", {report['sample']:.0%} sample" if report["sample"] < 1 else ""
+    print(f"\ndecoded bytes per layer ({report['decoded_payloads']} payloads{sampled})")
+    for name, layer in report["layers"].items():
+        print(
+            f"  {name}: {format_size(layer['bytes'])} ({layer['bytes'] / total:.0%}), "
+            f"{layer['features']} features, geometry {format_size(layer['geometry'])}"
+        )
+        for key, attribute in list(layer["attributes"].items())[:attributes]:
+            zooms = attribute["zooms"]
+            low = sum(size for z, size in zooms.items() if int(z) < DETAIL_ZOOM)
+            print(
+                f"      {key:<28} {format_size(attribute['bytes']):>10} "
+                f"({attribute['bytes'] / max(layer['bytes'], 1):.0%} of layer, {format_size(low)} below z{DETAIL_ZOOM})"
+            )
+    print("\nlargest tiles")
+    for tile in report["largest_tiles"]:
+        print(
+            f"  {tile['tile']:<16} {format_size(tile['bytes']):>9} stored, {format_size(tile['decoded_bytes']):>9} decoded, "
+            f"heaviest layer {tile['heaviest_layer']} ({format_size(tile['heaviest_layer_bytes'])})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report tile sizes and byte attribution of a PMTiles archive.")
+    parser.add_argument("archive", nargs="?", type=pathlib.Path, default=DEFAULT_ARCHIVE)
+    parser.add_argument("--top", type=int, default=20, help="number of largest tiles to list")
+    parser.add_argument("--sample", type=float, default=1.0, help="fraction of tile payloads to decode")
+    parser.add_argument("--json", type=pathlib.Path, default=REPORT_PATH, help="where to write the full report")
+    args = parser.parse_args()
+    if not 0 < args.sample <= 1:
+        parser.error("--sample must be in (0, 1]")
+    result = analyze(args.archive, args.top, args.sample)
+    args.json.parent.mkdir(parents=True, exist_ok=True)
+    args.json.write_text(json.dumps(result, indent=1), encoding="utf-8")
+    print_report(result)
+    print(f"\nfull report written to {args.json}")
@@ -0,0 +1,226 @@
+"""Run tippecanoe within the disk and memory the runner actually has.
+
+With ``--no-feature-limit --no-tile-size-limit`` tippecanoe can fill the
+temporary directory or the RAM of a CI runner. ``run_tippecanoe`` therefore:
+
+- picks the temporary directory (``-t``) among ``TIPPECANOE_TMPDIR``, the
+  output directory and the system temp directory: the first one with
+  ``TEMP_SPACE_FACTOR`` x the input size free, else the one with the most
+  free space;
+- caps the thread count (``TIPPECANOE_MAX_THREADS``) at the CPU count and at
+  the available memory / ``TIPPECANOE_RAM_PER_THREAD_MB`` (default 1024),
+  unless a thread count is given (``--jobs tile=N``);
+- streams tippecanoe's ``--json-progress`` output to the console and keeps a
+  progress timeline, samples the peak RSS of the tippecanoe process and how
+  much the temporary file system filled up, and records every attempt in the
+  run report (``tippecanoe`` value, ``tippecanoe:<country>`` in patch mode);
+- retries a run that failed for lack of resources (killed by the OOM killer,
+  "No space left on device", ``bad_alloc``, too many open files) with half
+  the threads, on the directory with the most free space, up to
+  ``TIPPECANOE_ATTEMPTS`` times. Other failures are raised with the end of
+  tippecanoe's output.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Any, Deque, Dict, List, Optional
+
+from run_metrics import report
+
+TEMP_DIR = os.environ.get("TIPPECANOE_TMPDIR", "")
+RAM_PER_THREAD_MB = int(os.environ.get("TIPPECANOE_RAM_PER_THREAD_MB", "1024"))
+MAX_ATTEMPTS = int(os.environ.get("TIPPECANOE_ATTEMPTS", "3"))
+# tippecanoe's temporary files take roughly this multiple of the input size.
+TEMP_SPACE_FACTOR = 3.0
+PROGRESS_INTERVAL_S = 10
+SAMPLE_INTERVAL = 0.5
+OUTPUT_TAIL_LINES = 20
+RESOURCE_ERRORS = ("no space left on device", "cannot allocate memory", "bad_alloc", "out of memory", "too many open files")
+
+
+@dataclass(frozen=True)
+class TilePlan:
+    temp_dir: pathlib.Path
+    threads: int
+
+
+def available_memory() -> int:
+    """Bytes of memory available to new work (MemAvailable on Linux)."""
+
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def free_space(path: pathlib.Path) -> int:
+    return shutil.disk_usage(path).free
+
+
+def temp_dir_candidates(output: pathlib.Path) -> List[pathlib.Path]:
+    candidates = [pathlib.Path(TEMP_DIR)] if TEMP_DIR else []
+    candidates += [output.resolve().parent, pathlib.Path(tempfile.gettempdir())]
+    unique: List[pathlib.Path] = []
+    for candidate in candidates:
+        if candidate.is_dir() and candidate.resolve() not in unique:
+            unique.append(candidate.resolve())
+    return unique
+
+
+def plan_tiling(input_bytes: int, output: pathlib.Path, threads: int = 0) -> TilePlan:
+    """Choose the temporary directory and thread count for ``input_bytes``
+    of GeoJSON."""
+
+    candidates = temp_dir_candidates(output)
+    needed = int(input_bytes * TEMP_SPACE_FACTOR)
+    roomy = [candidate for candidate in candidates if free_space(candidate) >= needed]
+    temp_dir = roomy[0] if roomy else max(candidates, key=free_space)
+    if not roomy:
+        print(
+            f"tippecanoe may need ~{needed / 1024 ** 3:.1f} GB of temporary space; "
+            f"using {temp_dir} with {free_space(temp_dir) / 1024 ** 3:.1f} GB free"
+        )
+    if not threads:
+        by_memory = available_memory() // (RAM_PER_THREAD_MB * 1024 * 1024)
+        threads = max(1, min(os.cpu_count() or 1, by_memory))
+    return TilePlan(temp_dir, threads)
+
+
+def is_resource_failure(returncode: int, output_tail: List[str]) -> bool:
+    if returncode == -9:  # SIGKILL: almost always the OOM killer
+        return True
+    text = "\n".join(output_tail).lower()
+    return any(error in text for error in RESOURCE_ERRORS)
+
+
+def conservative(plan: TilePlan, output: pathlib.Path) -> Optional[TilePlan]:
+    """The plan for the next attempt, or None when nothing is left to cut."""
+
+    candidates = temp_dir_candidates(output)
+    temp_dir = max(candidates, key=free_space) if candidates else plan.temp_dir
+    if plan.threads == 1 and temp_dir == plan.temp_dir:
+        return None
+    return replace(plan, temp_dir=temp_dir, threads=max(1, plan.threads // 2))
+
+
+def _peak_rss(pid: int) -> int:
+    """Peak RSS of a running process (VmHWM), 0 when unavailable."""
+
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _attempt(command: List[str], plan: TilePlan) -> Dict[str, Any]:
+    """Run tippecanoe once under ``plan`` and return its metrics."""
+
+    work_dir = pathlib.Path(tempfile.mkdtemp(prefix="tippecanoe-", dir=plan.temp_dir))
+    command = [command[0], "-t", str(work_dir), "--json-progress", f"--progress-interval={PROGRESS_INTERVAL_S}", *command[1:]]
+    env = dict(os.environ, TIPPECANOE_MAX_THREADS=str(plan.threads))
+    free_before = free_space(work_dir)
+    metrics: Dict[str, Any] = {
+        "threads": plan.threads,
+        "temp_dir": str(plan.temp_dir),
+        "temp_free_bytes": free_before,
+        "peak_rss": 0,
+        "peak_temp_bytes": 0,
+        "progress": [],
+    }
+    tail: Deque[str] = deque(maxlen=OUTPUT_TAIL_LINES)
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stderr=subprocess.PIPE, text=True, errors="replace")
+
+    def sample() -> None:
+        while process.poll() is None:
+            metrics["peak_rss"] = max(metrics["peak_rss"], _peak_rss(process.pid))
+            # tippecanoe unlinks its temporary files right after creating
+            # them, so only the file system's free space shows their size.
+            metrics["peak_temp_bytes"] = max(metrics["peak_temp_bytes"], free_before - free_space(work_dir))
+            time.sleep(SAMPLE_INTERVAL)
+
+    sampler = threading.Thread(target=sample, name="tippecanoe-sampler", daemon=True)
+    sampler.start()
+    try:
+        assert process.stderr is not None
+        for line in process.stderr:
+            line = line.rstrip()
+            try:
+                progress = json.loads(line)["progress"]
+            except (ValueError, TypeError, KeyError):
+                if line:
+                    tail.append(line)
+                    print(line)
+                continue
+            elapsed = round(time.perf_counter() - started, 1)
+            metrics["progress"].append([elapsed, progress])
+            print(f"tippecanoe {progress:5.1f}% after {elapsed:.0f}s")
+        process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        sampler.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    metrics["returncode"] = process.returncode
+    metrics["seconds"] = round(time.perf_counter() - started, 3)
+    metrics["output_tail"] = list(tail)
+    return metrics
+
+
+def run_tippecanoe(
+    command: List[str],
+    output: pathlib.Path,
+    inputs: List[pathlib.Path],
+    threads: int = 0,
+    name: str = "tippecanoe",
+) -> None:
+    """Run ``command`` (tippecanoe and its arguments, without ``-t``) and
+    retry with more conservative settings when it runs out of resources.
+    The attempts are recorded in the run report as ``name``."""
+
+    plan: Optional[TilePlan] = plan_tiling(sum(path.stat().st_size for path in inputs), output, threads)
+    attempts: List[Dict[str, Any]] = []
+    try:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            assert plan is not None
+            print(f"tippecanoe attempt {attempt}: {plan.threads} threads, temporary files in {plan.temp_dir}")
+            metrics = _attempt(command, plan)
+            attempts.append(metrics)
+            if metrics["returncode"] == 0:
+                metrics["output_bytes"] = output.stat().st_size
+                print(
+                    f"tippecanoe finished in {metrics['seconds']:.0f}s, peak RSS {metrics['peak_rss'] / 1024 ** 2:.0f} MB, "
+                    f"temporary files {metrics['peak_temp_bytes'] / 1024 ** 2:.0f} MB"
+                )
+                return
+            tail = metrics["output_tail"]
+            if not is_resource_failure(metrics["returncode"], tail):
+                raise RuntimeError(f"tippecanoe failed (exit {metrics['returncode']}):\n" + "\n".join(tail))
+            plan = conservative(plan, output)
+            if plan is None or attempt == MAX_ATTEMPTS:
+                break
+            print(f"tippecanoe ran out of resources (exit {metrics['returncode']}); retrying more conservatively")
+        raise RuntimeError(
+            f"tippecanoe ran out of resources {len(attempts)} times:\n" + "\n".join(attempts[-1]["output_tail"])
+        )
+    finally:
+        report.record(name, attempts)
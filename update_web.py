@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import date
 from pathlib import Path
 
+from templates import Template, write_if_changed
 from web_generator import generate_geojsons_page
 
 
@@ -24,9 +25,9 @@ def update_generated_date() -> None:
 		return
 
 	today_str = date.today().strftime("%d %B %Y")
-	updated_html = html.replace("{{GENERATED_DATE}}", today_str)
+	updated_html = Template(html).render(GENERATED_DATE=today_str)
 
-	index_path.write_text(updated_html, encoding="utf-8")
+	write_if_changed(index_path, updated_html)
 
 
 if __name__ == "__main__":
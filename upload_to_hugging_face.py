@@ -1,8 +1,18 @@
+import argparse
 import os
+from dataclasses import dataclass, field
 from pathlib import Path
-from huggingface_hub import CommitOperationAdd, HfApi, upload_file
+from huggingface_hub import CommitOperationAdd, CommitOperationDelete, HfApi, hf_hub_download
+from huggingface_hub.hf_api import RepoFile
+from huggingface_hub.utils import EntryNotFoundError
 
-GEOJSONS_DIR = Path("tmp/geojsons")
+from artifacts import EXTRACTS_PREFIX, GEOJSONS_PREFIX, PMTILES_FILE, artifact_files, verify_artifacts
+from hashing import HASH_WORKERS, FileDigest, hash_files
+from tile_diff import diff_archives, manifest_path_for
+
+REPO_ID = "jobes666/openaip-mptiles"
+PREVIOUS_DIR = Path("tmp/previous")
+DELTA_FILE = Path("tmp/openaip.delta.pmtiles")
 
 
 def format_size(num_bytes: int) -> str:
@@ -15,48 +25,127 @@ def format_size(num_bytes: int) -> str:
     return f"{size:.1f} GB"
 
 
-def upload_geojsons(token: str | None, repo_id: str) -> None:
-    """Upload all raw apt/asp geojson files into the `geojsons/` folder.
+@dataclass
+class UploadPlan:
+    """What a commit has to contain to make the repo match the local files."""
+
+    operations: list[CommitOperationAdd | CommitOperationDelete] = field(default_factory=list)
+    uploaded: list[tuple[str, int]] = field(default_factory=list)
+    skipped: list[tuple[str, int]] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+
+    def changes(self, path_in_repo: str) -> bool:
+        return any(path == path_in_repo for path, _ in self.uploaded)
+
+
+def local_upload_files() -> dict[str, Path]:
+    """Return `path_in_repo -> local path` for everything that is published."""
+    return artifact_files()
+
+
+def fetch_remote_hashes(api: HfApi, repo_id: str) -> dict[str, str]:
+    """Return `path_in_repo -> hash` for every file in the repo, fetched with
+    one tree listing. LFS files report their SHA-256, small files their git
+    blob id; `hashing.hash_file` computes both locally."""
+    remote: dict[str, str] = {}
+    for item in api.list_repo_tree(repo_id, repo_type="dataset", recursive=True):
+        if isinstance(item, RepoFile):
+            remote[item.path] = item.lfs.sha256 if item.lfs else item.blob_id
+    return remote
+
+
+def plan_upload(
+    api: HfApi,
+    repo_id: str,
+    local: dict[str, Path],
+    workers: int | None = None,
+    digests: dict[Path, FileDigest] | None = None,
+) -> UploadPlan:
+    """Add only files whose content differs from the repo and delete raw
+    geojsons and extracts of countries that are no longer generated.
 
-    All files are uploaded in a single commit. Uploading each file with its
-    own `upload_file()` call creates one commit per file, which quickly
+    ``digests`` (from ``artifacts.verify_artifacts``) saves hashing the
+    files again.
+
+    All operations go into a single commit: one commit per file quickly
     exhausts the Hugging Face rate limit (HTTP 429 Too Many Requests) when
     there are hundreds of per-country files.
     """
-    if not GEOJSONS_DIR.exists():
-        print("No geojsons directory found, skipping upload")
-        return
-    files = sorted(GEOJSONS_DIR.glob("*.geojson"))
-    if not files:
-        print("No geojson files found in tmp/geojsons, skipping upload")
-        return
+    remote = fetch_remote_hashes(api, repo_id)
+    if digests is None:
+        digests = hash_files(local.values(), workers or HASH_WORKERS)
+    plan = UploadPlan()
+    for path_in_repo, path in local.items():
+        digest = digests[path]
+        if remote.get(path_in_repo) in (digest.sha256, digest.git_sha1):
+            plan.skipped.append((path_in_repo, digest.size))
+            continue
+        plan.uploaded.append((path_in_repo, digest.size))
+        plan.operations.append(CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=str(path)))
+
+    # Without any local file under a prefix its stage most likely failed -
+    # never wipe the published files in that case.
+    for prefix in (GEOJSONS_PREFIX, EXTRACTS_PREFIX):
+        if not any(path.startswith(prefix) for path in local):
+            continue
+        for path_in_repo in sorted(remote):
+            if path_in_repo.startswith(prefix) and path_in_repo not in local:
+                plan.deleted.append(path_in_repo)
+                plan.operations.append(CommitOperationDelete(path_in_repo=path_in_repo))
+    return plan
 
-    operations = [
-        CommitOperationAdd(
-            path_in_repo=f"geojsons/{path.name}",
-            path_or_fileobj=str(path),
-        )
-        for path in files
-    ]
 
-    total_size = sum(path.stat().st_size for path in files)
+def print_plan(plan: UploadPlan) -> None:
+    uploaded = sum(size for _, size in plan.uploaded)
+    skipped = sum(size for _, size in plan.skipped)
     print(
-        f"Uploading {len(files)} geojson files "
-        f"(total {format_size(total_size)}) to {repo_id}/geojsons in a single commit ..."
+        f"Upload plan: {len(plan.uploaded)} files to upload ({format_size(uploaded)}), "
+        f"{len(plan.skipped)} unchanged files skipped ({format_size(skipped)}), "
+        f"{len(plan.deleted)} files to delete"
     )
-    for path in files:
-        print(f"  {path.name} ({format_size(path.stat().st_size)})")
+    for path, size in plan.uploaded:
+        print(f"  upload  {path} ({format_size(size)})")
+    for path in plan.deleted:
+        print(f"  delete  {path}")
 
-    HfApi(token=token).create_commit(
-        repo_id=repo_id,
-        repo_type="dataset",
-        operations=operations,
-        commit_message="Update raw geojsons",
+
+def delta_operations(token: str | None, repo_id: str) -> list[CommitOperationAdd]:
+    """Build a tile-level delta from the currently published archive to the
+    new one, so consumers can patch their copy instead of re-downloading it.
+
+    Must run before the new `openaip.pmtiles` replaces the published one. The
+    returned operations go into the same commit as the archive, so a delta
+    is never published without its target.
+    """
+    try:
+        previous = Path(hf_hub_download(
+            repo_id=repo_id,
+            filename=PMTILES_FILE.name,
+            repo_type="dataset",
+            token=token,
+            local_dir=PREVIOUS_DIR,
+        ))
+    except EntryNotFoundError:
+        print("No previously published pmtiles found, skipping delta")
+        return []
+
+    manifest = diff_archives(previous, PMTILES_FILE, DELTA_FILE)
+    print(
+        f"Delta: {manifest['added']} added, {manifest['changed']} changed, "
+        f"{manifest['removed_count']} removed, {manifest['unchanged']} unchanged tiles "
+        f"({format_size(manifest['delta']['size'])} instead of {format_size(manifest['target']['size'])})"
     )
-    print("Upload finished")
+    return [
+        CommitOperationAdd(path_in_repo=f"deltas/{DELTA_FILE.name}", path_or_fileobj=str(DELTA_FILE)),
+        CommitOperationAdd(
+            path_in_repo=f"deltas/{manifest_path_for(DELTA_FILE).name}",
+            path_or_fileobj=str(manifest_path_for(DELTA_FILE)),
+        ),
+    ]
 
 
-if __name__ == "__main__":
+def publish(dry_run: bool = False, workers: int | None = None) -> None:
+    """Upload everything that changed (``workers`` hashing threads)."""
     hf_token = os.environ.get("HF_TOKEN")
 
     if hf_token:
@@ -64,10 +153,32 @@ if __name__ == "__main__":
     else:
         print("No token found")
 
-    upload_file(path_or_fileobj="openaip.pmtiles",
-                path_in_repo="openaip.pmtiles",
-                repo_id="jobes666/openaip-mptiles",
-                repo_type="dataset",
-                token=hf_token)
+    api = HfApi(token=hf_token)
+    local = local_upload_files()
+    # Refuses to publish files that differ from what the build produced.
+    digests = verify_artifacts(local, workers=workers)
+    plan = plan_upload(api, REPO_ID, local, workers, digests)
+    print_plan(plan)
+    if dry_run:
+        return
+    if not plan.operations:
+        print("Nothing changed, skipping upload")
+        return
+
+    if plan.changes(PMTILES_FILE.name):
+        plan.operations.extend(delta_operations(hf_token, REPO_ID))
+
+    api.create_commit(
+        repo_id=REPO_ID,
+        repo_type="dataset",
+        operations=plan.operations,
+        commit_message="Update openaip pmtiles, extracts and raw geojsons",
+    )
+    print("Upload finished")
 
-    upload_geojsons(hf_token, "jobes666/openaip-mptiles")
\ No newline at end of file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish openaip.pmtiles and the raw geojsons to Hugging Face.")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be uploaded/deleted")
+    args = parser.parse_args()
+    publish(args.dry_run)
@@ -12,14 +12,36 @@ country list changes:
 
 from __future__ import annotations
 
+import hashlib
+import json
 from datetime import date
 from pathlib import Path
+from typing import Any
 
+from build_stats import STATS_PATH, load_stats
 from countries import countries
+from geojson_artifacts import load_geojson_manifest
+from templates import Template, write_if_changed
 
 REPO_ID = "jobes666/openaip-mptiles"
 HF_RESOLVE = f"https://huggingface.co/datasets/{REPO_ID}/resolve/main"
-HF_API_TREE = f"https://huggingface.co/api/datasets/{REPO_ID}/tree/main/geojsons"
+# Written by the export stage (main.py); sizes and hashes of every raw file and
+# its compressed variants are embedded into the page from here.
+GEOJSONS_DIR = Path("tmp/geojsons")
+
+# Feature counts shown per country card (from openaip.stats.json, see
+# build_stats.py), with their change since the previous build.
+STATS_LAYERS = [
+    ("airports", "airports"),
+    ("airspaces", "airspaces"),
+    ("navaids", "navaids"),
+    ("reporting_points", "reporting points"),
+    ("obstacles", "obstacles"),
+    ("hotspots", "hotspots"),
+    ("hang_glidings", "hang gliding sites"),
+]
+# Published next to the page; the next build reads it as its previous stats.
+WEB_STATS_NAME = "stats.json"
 
 # Layer metadata used for the two files generated per country.
 LAYERS = [
@@ -164,47 +186,206 @@ COUNTRY_META = {
 }
 
 
-def build_country_card(code: str, name: str) -> str:
-    """Render one country card with a download button per layer."""
-    code = code.lower()
-    buttons = []
-    for file_code, label, icon, hint in LAYERS:
-        filename = f"{code}_{file_code}.geojson"
-        url = f"{HF_RESOLVE}/geojsons/{filename}"
-        buttons.append(
-            f"""
-            <a href="{url}"
+def format_size(num_bytes: int | None) -> str:
+    """Format a byte count like the page's former client-side formatter."""
+    if num_bytes is None:
+        return "&ndash;"
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    size = float(num_bytes)
+    for unit in ("KB", "MB", "GB"):
+        size /= 1024
+        if size < 1024 or unit == "GB":
+            break
+    return f"{size:.1f} {unit}"
+
+
+def format_delta(delta: int | None) -> str:
+    if not delta:
+        return ""
+    color = "text-emerald-600" if delta > 0 else "text-rose-600"
+    return f' <span class="font-mono {color}">{delta:+,}</span>'
+
+
+def build_country_stats(country: dict[str, Any] | None) -> str:
+    """Feature counts of one country and their change since the last build."""
+    if not country:
+        return ""
+    layers = country["layers"]
+    items = [
+        f"<span>{layers[layer]['features']:,} {label}{format_delta(layers[layer].get('delta'))}</span>"
+        for layer, label in STATS_LAYERS
+        if layer in layers
+    ]
+    if country.get("quarantined"):
+        items.append(f'<span class="text-amber-600">{country["quarantined"]:,} skipped (invalid)</span>')
+    if not items:
+        return ""
+    return f"""
+            <div class="mt-3 flex flex-wrap gap-x-3 gap-y-1 text-xs text-slate-500">
+              {''.join(items)}
+            </div>"""
+
+
+def stats_summary(stats: dict[str, Any] | None) -> str:
+    """One sentence on the whole build for the header note."""
+    if not stats:
+        return ""
+    totals = stats["totals"]
+    parts = [
+        f"{totals[layer]['features']:,} {label}{format_delta(totals[layer].get('delta'))}"
+        for layer, label in STATS_LAYERS
+        if layer in totals
+    ]
+    since = f" (changes since {stats['previous'][:10]})" if stats.get("previous") else ""
+    return f"<br />The current build holds {', '.join(parts)}{since}."
+
+
+# Compressed variants listed next to each download, by manifest suffix.
+VARIANTS = {"gz": "gzip", "zst": "zstd"}
+
+VARIANT_LINK = Template("""
+            <a href="{{URL}}.{{SUFFIX}}"
                target="_blank" rel="noopener"
-               class="group flex items-center gap-3 rounded-lg border border-slate-200
+               class="flex items-center rounded-lg border border-slate-200 bg-slate-50 px-2.5
+                      text-xs font-mono text-slate-500 hover:border-blue-400 hover:bg-blue-50
+                      hover:text-blue-600 transition-colors"
+               title="{{CODEC}}-compressed ({{SIZE}})">.{{SUFFIX}}</a>""")
+
+BUTTON = Template("""
+            <div class="flex items-stretch gap-2">
+            <a href="{{URL}}"
+               target="_blank" rel="noopener"
+               class="group flex flex-1 items-center gap-3 rounded-lg border border-slate-200
                       bg-slate-50 px-3 py-2.5 hover:border-blue-400 hover:bg-blue-50
                       transition-colors"
-               title="{hint}">
-              <i class="fa-solid {icon} w-5 text-blue-500 group-hover:text-blue-600"></i>
+               title="{{HINT}}">
+              <i class="fa-solid {{ICON}} w-5 text-blue-500 group-hover:text-blue-600"></i>
               <span class="flex-1 text-sm font-medium text-slate-700 group-hover:text-slate-900">
-                {label}
+                {{LABEL}}
               </span>
-              <span class="file-size text-xs font-mono text-slate-400"
-                    data-file="{filename}">&ndash;</span>
+              {{SIZE}}
               <i class="fa-solid fa-download text-xs text-slate-300 group-hover:text-blue-500"></i>
-            </a>"""
-        )
-    return f"""
-          <div class="country-card card p-4" data-code="{code}" data-name="{name.lower()}">
+            </a>{{VARIANT_LINKS}}
+            </div>""")
+
+CARD = Template("""
+          <div class="country-card card p-4" data-code="{{CODE}}" data-name="{{NAME_LOWER}}">
             <div class="flex items-center justify-between mb-3">
-              <span class="font-semibold text-slate-800">{name}</span>
+              <span class="font-semibold text-slate-800">{{NAME}}</span>
               <span class="text-[11px] font-mono uppercase tracking-wider
                            bg-slate-100 text-slate-500 px-1.5 py-0.5 rounded">
-                {code}
+                {{CODE}}
               </span>
             </div>
             <div class="grid grid-cols-1 gap-2">
-              {''.join(buttons)}
-            </div>
-          </div>"""
+              {{BUTTONS}}
+            </div>{{STATS}}
+          </div>""")
+
+SECTION = Template("""
+        <section class="continent-section mb-12" data-continent="{{CONTINENT_LOWER}}">
+          <div class="flex items-center gap-3 mb-5">
+            <span class="flex h-10 w-10 items-center justify-center rounded-lg
+                         bg-blue-50 text-blue-600">
+              <i class="fa-solid {{ICON}}"></i>
+            </span>
+            <h2 class="text-xl font-bold text-slate-800">{{CONTINENT}}</h2>
+            <span class="text-sm text-slate-400 font-medium">
+              {{COUNT}}
+            </span>
+          </div>
+          <div class="grid sm:grid-cols-2 lg:grid-cols-3 gap-4">
+            {{CARDS}}
+          </div>
+        </section>""")
+
+# Rendered cards of the previous run, by the hash of their inputs: a card is
+# only rendered again when one of its files or its stats changed, or when
+# this module (its templates and formatting) did.
+CARD_CACHE_PATH = Path("tmp/web_cards.json")
+
+
+def renderer_version() -> str:
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def load_card_cache(path: Path = CARD_CACHE_PATH) -> dict[str, str]:
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return cache.get("cards", {}) if cache.get("version") == renderer_version() else {}
+
+
+def save_card_cache(cards: dict[str, str], path: Path = CARD_CACHE_PATH) -> None:
+    """Keep the cards of this run only, so the cache does not grow."""
+
+    write_if_changed(path, json.dumps({"version": renderer_version(), "cards": cards}, sort_keys=True))
+
+
+def build_country_card(
+    code: str,
+    name: str,
+    files: dict[str, Any],
+    stats: dict[str, Any] | None = None,
+    previous: dict[str, str] | None = None,
+    rendered: dict[str, str] | None = None,
+) -> str:
+    """Render one country card with a download button per layer.
+
+    ``files`` is the ``files`` section of the geojson manifest; layers without
+    an entry are shown as "pending". ``stats`` is the country's entry of the
+    build stats. A card found in ``previous`` (the card cache) under the hash
+    of its inputs is reused; every card is recorded in ``rendered``.
+    """
+    code = code.lower()
+    entries = [files.get(f"{code}_{file_code}.geojson") for file_code, *_ in LAYERS]
+    key = hashlib.sha256(json.dumps([code, name, entries, stats], sort_keys=True).encode("utf-8")).hexdigest()
+    card = (previous or {}).get(key)
+    if card is None:
+        card = render_country_card(code, name, entries, stats)
+    if rendered is not None:
+        rendered[key] = card
+    return card
+
+
+def render_country_card(code: str, name: str, entries: list[dict[str, Any] | None], stats: dict[str, Any] | None) -> str:
+    buttons = []
+    for (file_code, label, icon, hint), entry in zip(LAYERS, entries):
+        filename = f"{code}_{file_code}.geojson"
+        url = f"{HF_RESOLVE}/geojsons/{filename}"
+        if entry:
+            size_html = f"""<span class="file-size text-xs font-mono text-emerald-600"
+                    data-file="{filename}" data-sha256="{entry['sha256']}">{format_size(entry['size'])}</span>"""
+        else:
+            size_html = f"""<span class="file-size text-xs font-mono text-slate-300"
+                    data-file="{filename}">pending</span>"""
+        variants = (entry or {}).get("variants", {})
+        variant_links = "".join(
+            VARIANT_LINK.render(URL=url, SUFFIX=suffix, CODEC=codec, SIZE=format_size(variants[suffix]["size"]))
+            for suffix, codec in VARIANTS.items()
+            if suffix in variants
+        )
+        buttons.append(
+            BUTTON.render(URL=url, HINT=hint, ICON=icon, LABEL=label, SIZE=size_html, VARIANT_LINKS=variant_links)
+        )
+    return CARD.render(
+        CODE=code,
+        NAME=name,
+        NAME_LOWER=name.lower(),
+        BUTTONS="".join(buttons),
+        STATS=build_country_stats(stats),
+    )
 
 
 def build_page() -> str:
     today = date.today().strftime("%d %B %Y")
+    files = load_geojson_manifest(GEOJSONS_DIR)["files"]
+    stats = load_stats(STATS_PATH)
+    country_stats = (stats or {}).get("countries", {})
+    previous_cards = load_card_cache()
+    cards: dict[str, str] = {}
     by_continent: dict[str, list[tuple[str, str]]] = {c: [] for c, _ in CONTINENTS}
     for code in countries:
         meta = COUNTRY_META.get(code.lower(), (code.upper(), "Other"))
@@ -215,24 +396,16 @@ def build_page() -> str:
         entries = sorted(by_continent.get(continent, []), key=lambda e: e[1].lower())
         if not entries:
             continue
-        cards = "\n".join(build_country_card(c, n) for c, n in entries)
         sections.append(
-            f"""
-        <section class="continent-section mb-12" data-continent="{continent.lower()}">
-          <div class="flex items-center gap-3 mb-5">
-            <span class="flex h-10 w-10 items-center justify-center rounded-lg
-                         bg-blue-50 text-blue-600">
-              <i class="fa-solid {icon}"></i>
-            </span>
-            <h2 class="text-xl font-bold text-slate-800">{continent}</h2>
-            <span class="text-sm text-slate-400 font-medium">
-              {len(entries)} {('country' if len(entries) == 1 else 'countries')}
-            </span>
-          </div>
-          <div class="grid sm:grid-cols-2 lg:grid-cols-3 gap-4">
-            {cards}
-          </div>
-        </section>"""
+            SECTION.render(
+                CONTINENT=continent,
+                CONTINENT_LOWER=continent.lower(),
+                ICON=icon,
+                COUNT=f"{len(entries)} {('country' if len(entries) == 1 else 'countries')}",
+                CARDS="\n".join(
+                    build_country_card(c, n, files, country_stats.get(c), previous_cards, cards) for c, n in entries
+                ),
+            )
         )
 
     all_files = [
@@ -240,22 +413,27 @@ def build_page() -> str:
         for c in countries
         for fc, *_ in LAYERS
     ]
-
-    page = PAGE_TEMPLATE
-    page = page.replace("{{GENERATED_DATE}}", today)
-    page = page.replace("{{COUNTRY_COUNT}}", str(len(countries)))
-    page = page.replace("{{FILE_COUNT}}", str(len(all_files)))
-    page = page.replace("{{SECTIONS}}", "\n".join(sections))
-    page = page.replace("{{EXPECTED_FILES}}", __import__("json").dumps(all_files))
-    page = page.replace("{{HF_API_TREE}}", HF_API_TREE)
-    return page
+    available = [files[name] for name in all_files if name in files]
+    save_card_cache(cards)
+    return PAGE.render(
+        GENERATED_DATE=today,
+        COUNTRY_COUNT=len(countries),
+        FILE_COUNT=len(all_files),
+        FILES_AVAILABLE=f"{len(available)} / {len(all_files)}",
+        TOTAL_SIZE=format_size(sum(entry["size"] for entry in available)),
+        STATS_SUMMARY=stats_summary(stats),
+        SECTIONS="\n".join(sections),
+    )
 
 
 def generate_geojsons_page() -> None:
     output = Path(__file__).with_name("web") / "geojsons.html"
-    output.parent.mkdir(parents=True, exist_ok=True)
-    output.write_text(build_page(), encoding="utf-8")
-    print(f"Wrote {output} ({output.stat().st_size / 1024:.0f} KB)")
+    if write_if_changed(output, build_page()):
+        print(f"Wrote {output} ({output.stat().st_size / 1024:.0f} KB)")
+    else:
+        print(f"{output} is up to date")
+    if STATS_PATH.exists():
+        write_if_changed(output.with_name(WEB_STATS_NAME), STATS_PATH.read_bytes())
 
 
 PAGE_TEMPLATE = """<!doctype html>
@@ -360,26 +538,28 @@ PAGE_TEMPLATE = """<!doctype html>
             <div class="text-xs text-slate-500 font-medium mt-0.5">Downloadable files</div>
           </div>
           <div class="rounded-lg bg-slate-50 border border-slate-100 p-3 text-center">
-            <div class="text-2xl font-bold text-slate-800" id="files-available">&ndash;</div>
+            <div class="text-2xl font-bold text-slate-800" id="files-available">{{FILES_AVAILABLE}}</div>
             <div class="text-xs text-slate-500 font-medium mt-0.5">Available now</div>
           </div>
           <div class="rounded-lg bg-slate-50 border border-slate-100 p-3 text-center">
-            <div class="text-2xl font-bold text-slate-800" id="total-size">&ndash;</div>
+            <div class="text-2xl font-bold text-slate-800" id="total-size">{{TOTAL_SIZE}}</div>
             <div class="text-xs text-slate-500 font-medium mt-0.5">Total size</div>
           </div>
         </div>
 
         <p class="mt-4 text-xs text-slate-400 italic">
-          * File sizes are read live from the Hugging Face repository. Data is
+          * File sizes are taken from the build that produced the files; every
+          file is also available gzip-compressed (<span class="font-mono">.gz</span>)
+          and, where listed, zstd-compressed (<span class="font-mono">.zst</span>). Data is
           regenerated automatically once a week (Sundays 04:00 UTC) &mdash;
-          last generated {{GENERATED_DATE}}.
+          last generated {{GENERATED_DATE}}.{{STATS_SUMMARY}}
         </p>
       </section>
 
       <noscript>
         <div class="card p-4 mb-8 text-sm text-amber-700 bg-amber-50 border border-amber-200">
-          JavaScript is disabled &mdash; the search box and live file sizes won't work,
-          but all download links remain available below.
+          JavaScript is disabled &mdash; the search box won't work, but all download
+          links remain available below.
         </div>
       </noscript>
 
@@ -404,54 +584,6 @@ PAGE_TEMPLATE = """<!doctype html>
     </footer>
 
     <script>
-      // Files we expect to exist (generated from countries.py).
-      const EXPECTED = {{EXPECTED_FILES}};
-      const HF_TREE_URL = "{{HF_API_TREE}}";
-
-      function fmtSize(n) {
-        if (n == null || isNaN(n)) return "\u2013";
-        if (n < 1024) return n + " B";
-        const units = ["KB", "MB", "GB"];
-        let i = -1;
-        do { n /= 1024; i += 1; } while (n >= 1024 && i < units.length - 1);
-        return n.toFixed(1) + " " + units[i];
-      }
-
-      // Enrich the static list with live file sizes from Hugging Face.
-      fetch(HF_TREE_URL)
-        .then((res) => {
-          if (!res.ok) throw new Error("tree unavailable");
-          return res.json();
-        })
-        .then((items) => {
-          const sizes = new Map();
-          items.forEach((f) => {
-            if (f && f.size != null) sizes.set(f.path.split("/").pop(), f.size);
-          });
-
-          let total = 0;
-          let present = 0;
-          document.querySelectorAll(".file-size").forEach((el) => {
-            const size = sizes.get(el.dataset.file);
-            if (size != null) {
-              el.textContent = fmtSize(size);
-              el.classList.remove("text-slate-400");
-              el.classList.add("text-emerald-600");
-              total += size;
-              present += 1;
-            } else {
-              el.textContent = "pending";
-              el.classList.add("text-slate-300");
-            }
-          });
-          document.getElementById("files-available").textContent =
-            present + " / " + EXPECTED.length;
-          document.getElementById("total-size").textContent = fmtSize(total);
-        })
-        .catch(() => {
-          // Keep the static links working even if the API is unreachable.
-        });
-
       // Search filter across countries and continents.
       const searchInput = document.getElementById("search");
       const clearBtn = document.getElementById("clear-search");
@@ -484,6 +616,7 @@ PAGE_TEMPLATE = """<!doctype html>
   </body>
 </html>
 """
+PAGE = Template(PAGE_TEMPLATE)
 
 
 if __name__ == "__main__":